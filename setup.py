@@ -83,7 +83,7 @@ def get_requirements(env):
 # Only include dev requirements in non-binary distributions as we don't want these
 # to be listed in the wheels. Main reason for this is being able to use git/URL dependencies
 # for development, which will be rejected by PyPI when trying to upload the wheel.
-extras_require = {"rabbitmq": ["amqp==2.6.1"]}
+extras_require = {"rabbitmq": ["amqp==2.6.1"], "zstd": ["zstandard>=0.14.0,<0.15.0"]}
 if not sys.argv[1:][0].startswith("bdist"):
     extras_require["dev"] = get_requirements("dev")
 
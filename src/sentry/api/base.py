@@ -294,8 +294,9 @@ class Endpoint(APIView):
 
         input_cursor = None
         if request.GET.get("cursor"):
+            cursor_cls = getattr(paginator or paginator_cls, "cursor_cls", Cursor)
             try:
-                input_cursor = Cursor.from_string(request.GET.get("cursor"))
+                input_cursor = cursor_cls.from_string(request.GET.get("cursor"))
             except ValueError:
                 raise ParseError(detail="Invalid cursor parameter.")
 
@@ -26,6 +26,44 @@ def _sample_apm():
     return random.random() < getattr(settings, "SENTRY_RELAY_ENDPOINT_APM_SAMPLING", 0)
 
 
+def _get_cached_configs(relay, keys, full_config_requested):
+    """
+    Returns full configs that are already in the project config cache, if
+    ``SENTRY_RELAY_PROJECTCONFIG_CACHE_READS`` is enabled. Disabled configs
+    are computed again, as they are also cached for keys and projects that do
+    not exist yet, and so are configs of organizations the relay has no
+    access to.
+    """
+    if not settings.SENTRY_RELAY_PROJECTCONFIG_CACHE_READS:
+        return {}
+    if not full_config_requested or not keys:
+        return {}
+
+    with start_span(op="relay_fetch_cached_configs"):
+        cached = projectconfig_cache.get_many(keys)
+    cached = {
+        key: project_config
+        for key, project_config in six.iteritems(cached)
+        if not project_config.get("disabled") and project_config.get("organizationId")
+    }
+
+    if cached:
+        org_ids = set(project_config["organizationId"] for project_config in six.itervalues(cached))
+        org_ids = set(
+            org.id
+            for org in Organization.objects.get_many_from_cache(org_ids)
+            if relay.has_org_access(org)
+        )
+        cached = {
+            key: project_config
+            for key, project_config in six.iteritems(cached)
+            if project_config["organizationId"] in org_ids
+        }
+
+    metrics.timing("relay_project_configs.configs_cached", len(cached))
+    return cached
+
+
 class RelayProjectConfigsEndpoint(Endpoint):
     authentication_classes = (RelayAuthentication,)
     permission_classes = (RelayPermission,)
@@ -61,6 +99,9 @@ class RelayProjectConfigsEndpoint(Endpoint):
         public_keys = request.relay_request_data.get("publicKeys")
         public_keys = set(public_keys or ())
 
+        cached_configs = _get_cached_configs(request.relay, public_keys, full_config_requested)
+        public_keys -= set(cached_configs)
+
         project_keys = {}  # type: dict[str, ProjectKey]
         project_ids = set()  # type: set[int]
 
@@ -130,14 +171,22 @@ class RelayProjectConfigsEndpoint(Endpoint):
 
             configs[public_key] = project_config.to_dict()
 
-        if full_config_requested:
+        if full_config_requested and configs:
             projectconfig_cache.set_many(configs)
 
+        configs.update(cached_configs)
         return Response({"configs": configs}, status=200)
 
     def _post_by_project(self, request, full_config_requested):
         project_ids = set(request.relay_request_data.get("projects") or ())
 
+        cached_configs = _get_cached_configs(request.relay, project_ids, full_config_requested)
+        project_ids = set(
+            project_id
+            for project_id in project_ids
+            if six.text_type(project_id) not in cached_configs
+        )
+
         with start_span(op="relay_fetch_projects"):
             if project_ids:
                 with metrics.timer("relay_project_configs.fetching_projects.duration"):
@@ -195,7 +244,8 @@ class RelayProjectConfigsEndpoint(Endpoint):
 
             configs[six.text_type(project_id)] = project_config.to_dict()
 
-        if full_config_requested:
+        if full_config_requested and configs:
             projectconfig_cache.set_many(configs)
 
+        configs.update(cached_configs)
         return Response({"configs": configs}, status=200)
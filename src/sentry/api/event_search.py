@@ -27,6 +27,7 @@ from sentry.search.utils import (
 )
 from sentry.snuba.dataset import Dataset
 from sentry.utils.compat import functools
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.dates import to_timestamp
 from sentry.utils.snuba import (
     DATASETS,
@@ -189,6 +190,10 @@ spaces               = ~r"\ *"
 """
 )
 
+# Parsed search queries are kept per process, keyed by the visitor class, its
+# flags and the query string, since the same queries are issued over and over.
+parsed_query_cache = LRUCache(max_size=1000)
+
 
 # Create the known set of fields from the issue properties
 # and the transactions and events dataset mapping definitions.
@@ -323,8 +328,15 @@ class SearchVisitor(NodeVisitor):
 
     def __init__(self, allow_boolean=True):
         self.allow_boolean = allow_boolean
+        # Set once a relative date (e.g. ``-24h``) has been resolved against
+        # the current time, after which the result must not be cached.
+        self.is_time_dependent = False
         super(SearchVisitor, self).__init__()
 
+    @property
+    def cache_key(self):
+        return (type(self), self.allow_boolean)
+
     @cached_property
     def key_mappings_lookup(self):
         lookup = {}
@@ -497,6 +509,7 @@ class SearchVisitor(NodeVisitor):
                 from_val, to_val = parse_datetime_range(search_value.text)
             except InvalidQuery as exc:
                 raise InvalidSearchQuery(six.text_type(exc))
+            self.is_time_dependent = True
 
             if from_val is not None:
                 operator = ">="
@@ -544,6 +557,7 @@ class SearchVisitor(NodeVisitor):
                 from_val, to_val = parse_datetime_range(value.text)
             except InvalidQuery as exc:
                 raise InvalidSearchQuery(six.text_type(exc))
+            self.is_time_dependent = True
 
             # TODO: Handle negations
             if from_val is not None:
@@ -723,9 +737,27 @@ class SearchVisitor(NodeVisitor):
         return children or node
 
 
-def parse_search_query(query, allow_boolean=True):
+def visit_search_query(query, visitor, parse):
+    """
+    Returns the search terms ``visitor`` produces for the tree returned by
+    ``parse(query)``, reusing the terms of an earlier call with the same query
+    and visitor configuration. The cached terms are never handed out
+    directly, every caller gets its own list of them.
+    """
+    key = visitor.cache_key + (query,)
+    terms = parsed_query_cache.get(key)
+    if terms is not None:
+        return list(terms)
+
+    terms = visitor.visit(parse(query))
+    if isinstance(terms, list) and not visitor.is_time_dependent:
+        parsed_query_cache.set(key, tuple(terms))
+    return terms
+
+
+def parse_search_tree(query):
     try:
-        tree = event_search_grammar.parse(query)
+        return event_search_grammar.parse(query)
     except IncompleteParseError as e:
         idx = e.column()
         prefix = query[max(0, idx - 5) : idx]
@@ -736,7 +768,10 @@ def parse_search_query(query, allow_boolean=True):
                 "This is commonly caused by unmatched parentheses. Enclose any text in double quotes.",
             )
         )
-    return SearchVisitor(allow_boolean).visit(tree)
+
+
+def parse_search_query(query, allow_boolean=True):
+    return visit_search_query(query, SearchVisitor(allow_boolean), parse_search_tree)
 
 
 def convert_aggregate_filter_to_snuba_query(aggregate_filter, params):
@@ -5,12 +5,13 @@ import functools
 import math
 
 from datetime import datetime
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import connections
+from django.db.models import Q
 from django.db.models.sql.datastructures import EmptyResultSet
 from django.utils import timezone
 
-from sentry.utils.cursors import build_cursor, Cursor, CursorResult
+from sentry.utils.cursors import build_cursor, Cursor, CursorResult, KeysetCursor
 from sentry.utils.compat import map
 from sentry.utils.compat import zip
 
@@ -320,6 +321,116 @@ class MergingOffsetPaginator(OffsetPaginator):
         return CursorResult(results=results, next=next_cursor, prev=prev_cursor)
 
 
+class KeysetPaginator(object):
+    """
+    Paginates a queryset by seeking past the sort key of the last row of the
+    previous page (``WHERE key > cursor``) instead of skipping rows with an
+    OFFSET, so that deep pages are as fast to fetch as the first one.
+
+    ``order_by`` is a field name or a list of field names (each optionally
+    prefixed with ``-``), which do not have to be unique. The ``tiebreaker``
+    field (the primary key by default) is appended to make the order
+    deterministic. None of the fields may be nullable, and there should be an
+    index on them for this to be fast.
+
+    Cursors encode the full sort key of a row, see ``KeysetCursor``.
+    """
+
+    cursor_cls = KeysetCursor
+
+    def __init__(
+        self, queryset, order_by=None, max_limit=MAX_LIMIT, on_results=None, tiebreaker="id"
+    ):
+        if order_by is None:
+            order_by = []
+        elif not isinstance(order_by, (list, tuple)):
+            order_by = [order_by]
+
+        key = [(name.lstrip("-"), name.startswith("-")) for name in order_by]
+        if tiebreaker not in [name for name, desc in key]:
+            key.append((tiebreaker, key[-1][1] if key else False))
+
+        self.fields = [queryset.model._meta.get_field(name) for name, desc in key]
+        self.key = [(field.attname, desc) for field, (name, desc) in zip(self.fields, key)]
+        self.queryset = queryset
+        self.max_limit = max_limit
+        self.on_results = on_results
+
+    def get_item_key(self, item):
+        return [getattr(item, name) for name, desc in self.key]
+
+    def value_from_cursor(self, cursor):
+        if cursor.value is None:
+            return None
+        if not isinstance(cursor.value, list) or len(cursor.value) != len(self.fields):
+            raise BadPaginationError("Invalid cursor")
+        try:
+            return [field.to_python(value) for field, value in zip(self.fields, cursor.value)]
+        except ValidationError:
+            raise BadPaginationError("Invalid cursor")
+
+    def _build_seek_condition(self, value, is_prev):
+        """
+        Returns the condition for rows that come after (or before, if
+        ``is_prev``) the row with the given sort key.
+        """
+        condition = None
+        for (name, desc), field_value in reversed(list(zip(self.key, value))):
+            lookup = "lt" if desc != is_prev else "gt"
+            seek = Q(**{"%s__%s" % (name, lookup): field_value})
+            if condition is not None:
+                seek |= Q(**{name: field_value}) & condition
+            condition = seek
+
+        # Redundant, but allows the database to scan an index range on the
+        # first column rather than evaluating the whole disjunction.
+        name, desc = self.key[0]
+        lookup = "lte" if desc != is_prev else "gte"
+        return condition & Q(**{"%s__%s" % (name, lookup): value[0]})
+
+    def _build_queryset(self, value, is_prev):
+        # Previous pages are fetched in reverse order (seeking backwards from
+        # the cursor) and reversed back afterwards.
+        queryset = self.queryset.order_by(
+            *[("-" if desc != is_prev else "") + name for name, desc in self.key]
+        )
+        if value is not None:
+            queryset = queryset.filter(self._build_seek_condition(value, is_prev))
+        return queryset
+
+    def get_result(self, limit=100, cursor=None):
+        if cursor is None:
+            cursor = self.cursor_cls(None)
+
+        limit = min(limit, self.max_limit)
+
+        value = self.value_from_cursor(cursor)
+        # The extra row tells whether there is another page in this direction.
+        results = list(self._build_queryset(value, cursor.is_prev)[: limit + 1])
+        has_more = len(results) > limit
+        results = results[:limit]
+
+        if cursor.is_prev:
+            results.reverse()
+            has_prev, has_next = has_more, value is not None
+        else:
+            has_prev, has_next = value is not None, has_more
+
+        if results:
+            prev_value = self.get_item_key(results[0])
+            next_value = self.get_item_key(results[-1])
+        else:
+            prev_value = next_value = cursor.value
+
+        next_cursor = self.cursor_cls(next_value, 0, False, has_next)
+        prev_cursor = self.cursor_cls(prev_value, 0, True, has_prev)
+
+        if self.on_results:
+            results = self.on_results(results)
+
+        return CursorResult(results=results, next=next_cursor, prev=prev_cursor)
+
+
 def reverse_bisect_left(a, x, lo=0, hi=None):
     """\
     Similar to ``bisect.bisect_left``, but expects the data in the array ``a``
@@ -3,8 +3,11 @@ from __future__ import absolute_import
 import logging
 import six
 
-from django.db.models import F
+from django.db import connections, router, transaction
+from django.db.models import F, Model
+from django.db.models.expressions import BaseExpression
 
+from sentry.db.models.query import bulk_increment
 from sentry.signals import buffer_incr_complete
 from sentry.tasks.process_buffer import process_incr
 from sentry.utils.services import Service
@@ -30,9 +33,15 @@ class Buffer(Service):
 
     This is useful in situations where a single event might be happening so fast that the queue cant
     keep up with the updates.
+
+    When ``bulk_update`` is enabled, ``process_batch`` coalesces the updates of many rows of the same
+    model (identified by their primary key and changing the same columns) into a single ``UPDATE``
+    statement.
     """
 
-    __all__ = ("incr", "process", "process_pending", "validate")
+    __all__ = ("incr", "process", "process_batch", "process_pending", "validate")
+
+    bulk_update = False
 
     def incr(self, model, columns, filters, extra=None, signal_only=None):
         """
@@ -55,7 +64,145 @@ class Buffer(Service):
     def process_pending(self, partition=None):
         return []
 
+    def process_batch(self, model, batch):
+        """
+        Processes many increments of ``model``, given as a list of
+        ``(columns, filters, extra, signal_only)`` tuples, and returns the
+        increments that failed to be written.
+
+        Every row is written in its own transaction (or savepoint), so that a
+        failing row doesn't keep the other rows from being written.
+        ``buffer_incr_complete`` is only sent once a row has been committed.
+        """
+        using = router.db_for_write(model)
+
+        if self.bulk_update:
+            batch = self._process_bulk_update(model, batch)
+
+        failed = []
+        for item in batch:
+            columns, filters, extra, signal_only = item
+            try:
+                with transaction.atomic(using=using):
+                    created = self._update_or_create(model, columns, filters, extra, signal_only)
+            except Exception:
+                self.logger.exception(
+                    "buffer.process_batch.failed", extra={"model": model.__name__}
+                )
+                failed.append(item)
+                continue
+
+            self._send_incr_complete_on_commit(model, columns, filters, extra, created, using)
+
+        return failed
+
+    def _send_incr_complete_on_commit(self, model, columns, filters, extra, created, using):
+        transaction.on_commit(
+            lambda: buffer_incr_complete.send_robust(
+                model=model,
+                columns=columns,
+                filters=filters,
+                extra=extra,
+                created=created,
+                sender=model,
+            ),
+            using=using,
+        )
+
+    def _process_bulk_update(self, model, batch):
+        """
+        Updates all rows of the batch that can be updated in bulk and returns
+        the remaining items.
+        """
+        from sentry.models import Group
+
+        using = router.db_for_write(model)
+        if connections[using].vendor != "postgresql":
+            return batch
+
+        remaining = []
+        # (columns, extra columns) -> {pk: (item, extra)}
+        updates = {}
+        for item in batch:
+            columns, filters, extra, signal_only = item
+            pk = filters.get("id", filters.get("pk"))
+            if signal_only or pk is None or len(filters) != 1:
+                remaining.append(item)
+                continue
+
+            extra = dict(extra or {})
+            # HACK(dcramer): See ``process``, the score is computed from the updated columns.
+            if model is Group and "last_seen" in extra and "times_seen" in columns:
+                extra.pop("score", None)
+
+            if any(isinstance(v, (BaseExpression, Model)) for v in six.itervalues(extra)):
+                remaining.append(item)
+                continue
+
+            rows = updates.setdefault((frozenset(columns), frozenset(extra)), {})
+            pk = model._meta.pk.to_python(pk)
+            if pk in rows:
+                # Only one update per row and statement.
+                remaining.append(item)
+            else:
+                rows[pk] = (item, extra)
+
+        for (columns, extra_columns), rows in six.iteritems(updates):
+            if len(rows) < 2:
+                remaining.extend(item for item, extra in six.itervalues(rows))
+                continue
+
+            expressions = None
+            if model is Group and "last_seen" in extra_columns and "times_seen" in columns:
+                expressions = {
+                    "score": "log({table}.times_seen + {values}.i_times_seen) * 600"
+                    " + floor(extract(epoch from {values}.v_last_seen))"
+                }
+
+            try:
+                with transaction.atomic(using=using):
+                    updated = bulk_increment(
+                        model,
+                        {pk: (item[0], extra) for pk, (item, extra) in six.iteritems(rows)},
+                        expressions=expressions,
+                        using=using,
+                    )
+            except Exception:
+                # Fall back to writing the rows one by one, so that only the
+                # rows that fail on their own are not written.
+                self.logger.exception(
+                    "buffer.process_batch.bulk_update_failed", extra={"model": model.__name__}
+                )
+                remaining.extend(item for item, extra in six.itervalues(rows))
+                continue
+
+            for pk, (item, extra) in six.iteritems(rows):
+                if pk not in updated:
+                    remaining.append(item)
+                    continue
+
+                columns, filters, extra, signal_only = item
+                self._send_incr_complete_on_commit(model, columns, filters, extra, False, using)
+
+        return remaining
+
     def process(self, model, columns, filters, extra=None, signal_only=None):
+        created = self._update_or_create(model, columns, filters, extra, signal_only)
+
+        buffer_incr_complete.send_robust(
+            model=model,
+            columns=columns,
+            filters=filters,
+            extra=extra,
+            created=created,
+            sender=model,
+        )
+
+    def _update_or_create(self, model, columns, filters, extra=None, signal_only=None):
+        """
+        Writes an increment to the database and returns whether the row was
+        created.
+        """
         from sentry.models import Group
         from sentry.event_manager import ScoreClause
 
@@ -78,11 +225,4 @@ class Buffer(Service):
 
             _, created = model.objects.create_or_update(values=update_kwargs, **filters)
 
-        buffer_incr_complete.send_robust(
-            model=model,
-            columns=columns,
-            filters=filters,
-            extra=extra,
-            created=created,
-            sender=model,
-        )
+        return created
@@ -5,6 +5,7 @@ import six
 import threading
 from time import time
 
+from collections import OrderedDict
 from datetime import datetime
 from django.db import models
 from django.utils import timezone
@@ -51,15 +52,43 @@ class PendingBuffer(object):
 
 
 class RedisBuffer(Buffer):
+    """
+    Pending keys are spread over ``pending_partitions`` sorted sets (scored
+    by the time they were first buffered since they were last processed) and
+    each partition is drained by its own ``process_pending`` task.
+
+    ``max_pending_keys`` bounds how many of the oldest keys a single drain of
+    a partition takes from each host, leaving the remainder for the next run
+    instead of flooding the queue with ``process_incr`` tasks. Size and lag
+    (age of the oldest key) of every drained partition are reported as
+    metrics.
+
+    With ``bulk_update``, increments that fail to be written are buffered
+    again and retried by the next flush, up to ``max_process_attempts``
+    times.
+    """
+
     key_expire = 60 * 60  # 1 hour
     pending_key = "b:p"
-
-    def __init__(self, pending_partitions=1, incr_batch_size=2, **options):
+    # Increments that fail to be written this many times are dropped.
+    max_process_attempts = 5
+
+    def __init__(
+        self,
+        pending_partitions=1,
+        incr_batch_size=2,
+        max_pending_keys=None,
+        bulk_update=False,
+        **options
+    ):
         self.cluster, options = get_cluster_from_options("SENTRY_BUFFER_OPTIONS", options)
         self.pending_partitions = pending_partitions
         self.incr_batch_size = incr_batch_size
+        self.max_pending_keys = max_pending_keys
+        self.bulk_update = bulk_update
         assert self.pending_partitions > 0
         assert self.incr_batch_size > 0
+        assert self.max_pending_keys is None or self.max_pending_keys > 0
 
     def validate(self):
         try:
@@ -110,6 +139,12 @@ class RedisBuffer(Buffer):
     def _make_lock_key(self, key):
         return "l:%s" % (key,)
 
+    def _get_model_from_key(self, key):
+        """
+        Returns the model part of a key, as generated by ``_make_key``.
+        """
+        return key.rpartition(":")[0]
+
     def _dump_values(self, values):
         result = {}
         for k, v in six.iteritems(values):
@@ -160,6 +195,21 @@ class RedisBuffer(Buffer):
         - Add hashmap key to pending flushes
         """
 
+        self._write_incr(model, columns, filters, extra, signal_only)
+
+        metrics.incr(
+            "buffer.incr",
+            skip_internal=True,
+            tags={"module": model.__module__, "model": model.__name__},
+        )
+
+    def _write_incr(self, model, columns, filters, extra=None, signal_only=None, attempts=0):
+        """
+        Writes an increment to the buffer. When ``attempts`` is set, the
+        increment is one that failed to be processed that many times, and its
+        extra values don't overwrite the ones of increments that were
+        buffered since.
+        """
         # TODO(dcramer): longer term we'd rather not have to serialize values
         # here (unless it's to JSON)
         key = self._make_key(model, filters)
@@ -184,22 +234,21 @@ class RedisBuffer(Buffer):
             for column, value in six.iteritems(extra):
                 # TODO(dcramer): once this goes live in production, we can kill the pickle path
                 # (this is to ensure a zero downtime deploy where we can transition event processing)
-                pipe.hset(key, "e+" + column, pickle.dumps(value))
+                (pipe.hsetnx if attempts else pipe.hset)(key, "e+" + column, pickle.dumps(value))
                 # pipe.hset(key, 'e+' + column, json.dumps(self._dump_value(value)))
 
         if signal_only is True:
             pipe.hset(key, "s", "1")
 
+        if attempts:
+            pipe.hset(key, "r", attempts)
+
         pipe.expire(key, self.key_expire)
-        pipe.zadd(pending_key, {key: time()})
+        # Keep the time the key was first buffered, so that keys that keep
+        # being incremented are still drained in order.
+        pipe.zadd(pending_key, {key: time()}, nx=True)
         pipe.execute()
 
-        metrics.incr(
-            "buffer.incr",
-            skip_internal=True,
-            tags={"module": model.__module__, "model": model.__name__},
-        )
-
     def process_pending(self, partition=None):
         if partition is None and self.pending_partitions > 1:
             # If we're using partitions, this one task fans out into
@@ -218,28 +267,51 @@ class RedisBuffer(Buffer):
             return
 
         pending_buffer = PendingBuffer(self.incr_batch_size)
+        partition_tags = {"partition": six.text_type(partition)}
 
         try:
-            keycount = 0
+            now = time()
+            stop = self.max_pending_keys - 1 if self.max_pending_keys is not None else -1
             with self.cluster.all() as conn:
-                results = conn.zrange(pending_key, 0, -1)
+                results = conn.zrange(pending_key, 0, stop, withscores=True)
+                sizes = conn.zcard(pending_key)
+
+            pending = []
+            for host_id, items in six.iteritems(results.value):
+                pending.extend((score, key.decode("utf-8")) for key, score in items)
+
+            metrics.timing(
+                "buffer.pending-partition-size", sum(sizes.value.values()), tags=partition_tags
+            )
+            if pending:
+                metrics.timing(
+                    "buffer.pending-partition-lag",
+                    now - min(score for score, key in pending),
+                    tags=partition_tags,
+                )
 
-            with self.cluster.all() as conn:
-                for host_id, keys in six.iteritems(results.value):
-                    if not keys:
-                        continue
-                    keycount += len(keys)
-                    for key in keys:
-                        pending_buffer.append(key.decode("utf-8"))
-                        if pending_buffer.full():
-                            process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
-                    conn.target([host_id]).zrem(pending_key, *keys)
+            # Batch up keys of the same model (oldest first), so that their
+            # updates can be flushed together.
+            keys_by_model = OrderedDict()
+            for score, key in sorted(pending):
+                keys_by_model.setdefault(self._get_model_from_key(key), []).append(key)
+
+            for keys in six.itervalues(keys_by_model):
+                for key in keys:
+                    pending_buffer.append(key)
+                    if pending_buffer.full():
+                        process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
 
             # queue up remainder of pending keys
             if not pending_buffer.empty():
                 process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
 
-            metrics.timing("buffer.pending-size", keycount)
+            with self.cluster.all() as conn:
+                for host_id, items in six.iteritems(results.value):
+                    if items:
+                        conn.target([host_id]).zrem(pending_key, *[key for key, score in items])
+
+            metrics.timing("buffer.pending-size", len(pending))
         finally:
             client.delete(lock_key)
 
@@ -250,65 +322,152 @@ class RedisBuffer(Buffer):
         if key is not None:
             batch_keys = [key]
 
-        for key in batch_keys:
-            self._process_single_incr(key)
+        if not self.bulk_update:
+            for key in batch_keys:
+                self._process_single_incr(key)
+            return
 
-    def _process_single_incr(self, key):
         client = self.cluster.get_routing_client()
+        lock_keys = []
+        batches = OrderedDict()
+        # key -> number of times the increment failed to be processed before
+        attempts = {}
+        try:
+            for key in batch_keys:
+                lock_key = self._lock_incr(client, key)
+                if lock_key is None:
+                    continue
+                lock_keys.append(lock_key)
+
+                incr = self._pop_incr(key)
+                if incr is not None:
+                    model, columns, filters, extra, signal_only, attempts[key] = incr
+                    batches.setdefault(model, []).append((columns, filters, extra, signal_only))
+
+            for model, batch in six.iteritems(batches):
+                try:
+                    failed = self.process_batch(model, batch)
+                except Exception:
+                    self.logger.exception(
+                        "buffer.process_batch.failed", extra={"model": model.__name__}
+                    )
+                    failed = batch
+                if failed:
+                    self._requeue(model, failed, attempts)
+        finally:
+            if lock_keys:
+                client.delete(*lock_keys)
+
+    def _requeue(self, model, batch, attempts):
+        """
+        Buffers increments that failed to be processed again, to be retried
+        with the next flush. Increments that failed ``max_process_attempts``
+        times are dropped instead.
+        """
+        tags = {"module": model.__module__, "model": model.__name__}
+        requeued = 0
+        for columns, filters, extra, signal_only in batch:
+            key = self._make_key(model, filters)
+            attempt = attempts.get(key, 0) + 1
+            if attempt >= self.max_process_attempts:
+                self.logger.error(
+                    "buffer.process.dropped",
+                    extra={
+                        "model": model.__name__,
+                        "redis_key": key,
+                        "columns": columns,
+                        "attempts": attempt,
+                    },
+                )
+                continue
+            self._write_incr(model, columns, filters, extra, signal_only, attempts=attempt)
+            requeued += 1
+
+        if requeued:
+            metrics.incr("buffer.requeued", amount=requeued, tags=tags, skip_internal=False)
+        if requeued < len(batch):
+            metrics.incr(
+                "buffer.dropped", amount=len(batch) - requeued, tags=tags, skip_internal=False
+            )
+
+    def _lock_incr(self, client, key):
+        """
+        Locks the key for processing, returns the lock key if successful.
+        """
         lock_key = self._make_lock_key(key)
         # prevent a stampede due to the way we use celery etas + duplicate
         # tasks
         if not client.set(lock_key, "1", nx=True, ex=10):
             metrics.incr("buffer.revoked", tags={"reason": "locked"}, skip_internal=False)
             self.logger.debug("buffer.revoked.locked", extra={"redis_key": key})
-            return
+            return None
+        return lock_key
 
-        pending_key = self._make_pending_key_from_key(key)
+    def _process_single_incr(self, key):
+        client = self.cluster.get_routing_client()
+        lock_key = self._lock_incr(client, key)
+        if lock_key is None:
+            return
 
         try:
-            conn = self.cluster.get_local_client_for_key(key)
-            pipe = conn.pipeline()
-            pipe.hgetall(key)
-            pipe.zrem(pending_key, key)
-            pipe.delete(key)
-            values = pipe.execute()[0]
-
-            # XXX(python3): In python2 this isn't as important since redis will
-            # return string tyes (be it, byte strings), but in py3 we get bytes
-            # back, and really we just want to deal with keys as strings.
-            values = {force_text(k): v for k, v in six.iteritems(values)}
-
-            if not values:
-                metrics.incr("buffer.revoked", tags={"reason": "empty"}, skip_internal=False)
-                self.logger.debug("buffer.revoked.empty", extra={"redis_key": key})
-                return
-
-            # XXX(py3): Note that ``import_string`` explicitly wants a str in
-            # python2, so we'll decode (for python3) and then translate back to
-            # a byte string (in python2) for import_string.
-            model = import_string(str(values.pop("m").decode("utf-8")))  # NOQA
-
-            if values["f"].startswith(b"{"):
-                filters = self._load_values(json.loads(values.pop("f").decode("utf-8")))
-            else:
-                # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
-                filters = pickle.loads(values.pop("f"))
-
-            incr_values = {}
-            extra_values = {}
-            signal_only = None
-            for k, v in six.iteritems(values):
-                if k.startswith("i+"):
-                    incr_values[k[2:]] = int(v)
-                elif k.startswith("e+"):
-                    if v.startswith(b"["):
-                        extra_values[k[2:]] = self._load_value(json.loads(v.decode("utf-8")))
-                    else:
-                        # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
-                        extra_values[k[2:]] = pickle.loads(v)
-                elif k == "s":
-                    signal_only = bool(int(v))  # Should be 1 if set
-
-            super(RedisBuffer, self).process(model, incr_values, filters, extra_values, signal_only)
+            incr = self._pop_incr(key)
+            if incr is not None:
+                super(RedisBuffer, self).process(*incr[:5])
         finally:
             client.delete(lock_key)
+
+    def _pop_incr(self, key):
+        """
+        Removes the pending increment from the buffer and returns it as a
+        ``(model, columns, filters, extra, signal_only, attempts)`` tuple, or
+        ``None`` if it has been processed already.
+        """
+        pending_key = self._make_pending_key_from_key(key)
+
+        conn = self.cluster.get_local_client_for_key(key)
+        pipe = conn.pipeline()
+        pipe.hgetall(key)
+        pipe.zrem(pending_key, key)
+        pipe.delete(key)
+        values = pipe.execute()[0]
+
+        # XXX(python3): In python2 this isn't as important since redis will
+        # return string tyes (be it, byte strings), but in py3 we get bytes
+        # back, and really we just want to deal with keys as strings.
+        values = {force_text(k): v for k, v in six.iteritems(values)}
+
+        if not values:
+            metrics.incr("buffer.revoked", tags={"reason": "empty"}, skip_internal=False)
+            self.logger.debug("buffer.revoked.empty", extra={"redis_key": key})
+            return None
+
+        # XXX(py3): Note that ``import_string`` explicitly wants a str in
+        # python2, so we'll decode (for python3) and then translate back to
+        # a byte string (in python2) for import_string.
+        model = import_string(str(values.pop("m").decode("utf-8")))  # NOQA
+
+        if values["f"].startswith(b"{"):
+            filters = self._load_values(json.loads(values.pop("f").decode("utf-8")))
+        else:
+            # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
+            filters = pickle.loads(values.pop("f"))
+
+        incr_values = {}
+        extra_values = {}
+        signal_only = None
+        attempts = 0
+        for k, v in six.iteritems(values):
+            if k.startswith("i+"):
+                incr_values[k[2:]] = int(v)
+            elif k.startswith("e+"):
+                if v.startswith(b"["):
+                    extra_values[k[2:]] = self._load_value(json.loads(v.decode("utf-8")))
+                else:
+                    # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
+                    extra_values[k[2:]] = pickle.loads(v)
+            elif k == "s":
+                signal_only = bool(int(v))  # Should be 1 if set
+            elif k == "r":
+                attempts = int(v)
+
+        return model, incr_values, filters, extra_values, signal_only, attempts
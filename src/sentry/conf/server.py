@@ -1089,6 +1089,25 @@ SENTRY_ALLOW_ORIGIN = None
 # Enable scraping of javascript context for source code
 SENTRY_SCRAPE_JAVASCRIPT_CONTEXT = True
 
+# Maximum number of source files and sourcemaps fetched concurrently while
+# processing a single javascript event. Set to 1 to fetch them serially.
+SENTRY_JS_FETCH_CONCURRENCY = 8
+
+# Maximum number of adjacent bulk deletion relations (relations deleted by a
+# BulkModelDeletionTask) that are deleted concurrently. Set to 1 to delete all
+# relations serially.
+SENTRY_DELETIONS_CONCURRENCY = 4
+
+# The events of a group that is unmerged are partitioned by time into this
+# many shards, whose batches of events are fetched on up to
+# SENTRY_UNMERGE_CONCURRENCY threads.
+SENTRY_UNMERGE_SHARDS = 4
+SENTRY_UNMERGE_CONCURRENCY = 4
+
+# Maximum number of batches of projects whose weekly reports are built
+# concurrently, per organization.
+SENTRY_REPORTS_CONCURRENCY = 4
+
 # Buffer backend
 SENTRY_BUFFER = "sentry.buffer.Buffer"
 SENTRY_BUFFER_OPTIONS = {}
@@ -1128,6 +1147,14 @@ SENTRY_QUOTA_OPTIONS = {}
 SENTRY_RELAY_PROJECTCONFIG_CACHE = "sentry.relay.projectconfig_cache.base.ProjectConfigCache"
 SENTRY_RELAY_PROJECTCONFIG_CACHE_OPTIONS = {}
 
+# Serve full configs that are already in the Relay project config cache from
+# the project configs endpoint instead of computing them again. Cached configs
+# are only invalidated when project options, project keys or organization
+# options change. Changes to anything else, such as quotas or the fields and
+# status of projects and organizations, are served stale for up to an hour,
+# the timeout of the Redis project config cache.
+SENTRY_RELAY_PROJECTCONFIG_CACHE_READS = False
+
 # Which cache to use for debouncing cache updates to the projectconfig cache
 SENTRY_RELAY_PROJECTCONFIG_DEBOUNCE_CACHE = (
     "sentry.relay.projectconfig_debounce_cache.base.ProjectConfigDebounceCache"
@@ -1144,11 +1171,38 @@ SENTRY_DEFAULT_MAX_EVENTS_PER_MINUTE = "90%"
 # Snuba configuration
 SENTRY_SNUBA = os.environ.get("SNUBA", "http://127.0.0.1:1218")
 SENTRY_SNUBA_TIMEOUT = 30
+# The number of queries a process runs against snuba at once, in total and per
+# referrer. Identical queries that are in flight at the same time are only
+# sent once.
+SENTRY_SNUBA_MAX_CONCURRENT_QUERIES = 10
+SENTRY_SNUBA_MAX_CONCURRENT_QUERIES_PER_REFERRER = 8
+# Referrers whose query results are shared through the default cache. Results
+# for time windows that ended more than SETTLE_TIME seconds ago are kept for
+# TTL seconds, all others for RECENT_TTL seconds.
+SENTRY_SNUBA_RESULT_CACHE_REFERRERS = frozenset()
+SENTRY_SNUBA_RESULT_CACHE_TTL = 60 * 60
+SENTRY_SNUBA_RESULT_CACHE_RECENT_TTL = 10
+SENTRY_SNUBA_RESULT_CACHE_SETTLE_TIME = 60 * 5
 
 # Node storage backend
 SENTRY_NODESTORE = "sentry.nodestore.django.DjangoNodeStorage"
 SENTRY_NODESTORE_OPTIONS = {}
 
+# Maximum size (in bytes of serialized JSON) of the process-local cache in
+# front of the node storage backend. Set to 0 to disable the cache.
+SENTRY_NODESTORE_LOCAL_CACHE_SIZE = 0
+
+# Seconds after which entries of the process-local node storage cache expire.
+# Writes and deletes in other processes are not seen by this cache, so this
+# bounds how long it may return stale data, or report deleted data for ids
+# that have been written since.
+SENTRY_NODESTORE_LOCAL_CACHE_TTL = 60
+
+# Maximum size (in bytes of the original files) of the per-worker cache of
+# parsed JavaScript sources and sourcemaps, which is shared across events.
+# Set to 0 to disable the cache.
+SENTRY_JS_VIEW_CACHE_SIZE = 64 * 1024 * 1024
+
 # Tag storage backend
 SENTRY_TAGSTORE = os.environ.get("SENTRY_TAGSTORE", "sentry.tagstore.snuba.SnubaTagStorage")
 SENTRY_TAGSTORE_OPTIONS = {}
@@ -1391,6 +1445,11 @@ SENTRY_ROLES = (
 
 # See sentry/options/__init__.py for more information
 SENTRY_OPTIONS = {}
+
+# Options read by a process are reloaded in bulk about every this many seconds
+# and served from memory in between.  Set to 0 to fetch options one by one.
+SENTRY_OPTIONS_SNAPSHOT_INTERVAL = 10
+
 SENTRY_DEFAULT_OPTIONS = {}
 
 # You should not change this setting after your database has been created
@@ -2013,8 +2072,23 @@ SENTRY_SIMILARITY_GROUPING_CONFIGURATIONS_TO_INDEX = {
     "similarity:2020-07-23": "a",
 }
 
+# Number of grouping results of recently seen events that are kept in memory
+# by every process.  Events with identical stacktraces and grouping configs
+# reuse these instead of running the grouping strategies again.  Set to 0 to
+# disable the cache.
+SENTRY_GROUPING_VARIANTS_CACHE_SIZE = 1000
+
+# Number of processed frames that are kept in memory by every process in front
+# of the shared cache, and for how many seconds.  Set the TTL to 0 to disable
+# the local cache.
+SENTRY_FRAME_CACHE_LOCAL_SIZE = 10000
+SENTRY_FRAME_CACHE_LOCAL_TTL = 60
+
 SENTRY_USE_UWSGI = True
 
 SENTRY_REPROCESSING_ATTACHMENT_CHUNK_SIZE = 2 ** 20
 
 SENTRY_REPROCESSING_SYNC_REDIS_CLUSTER = "default"
+
+# Redis cluster of the event frequency counters used by alert rules
+SENTRY_RULES_FREQUENCY_COUNTER_CLUSTER = "default"
@@ -44,6 +44,9 @@ class DataExportEndpoint(OrganizationEndpoint, EnvironmentMixin):
         except Environment.DoesNotExist as error:
             return Response(error, status=400)
         limit = request.data.get("limit")
+        compression = request.data.get("compression")
+        if compression not in (None, "gzip"):
+            return Response({"compression": ["Unsupported compression."]}, status=400)
 
         # Validate the data export payload
         serializer = DataExportQuerySerializer(data=request.data)
@@ -111,7 +114,10 @@ class DataExportEndpoint(OrganizationEndpoint, EnvironmentMixin):
                     "dataexport.enqueue", tags={"query_type": data["query_type"]}, sample_rate=1.0
                 )
                 assemble_download.delay(
-                    data_export_id=data_export.id, export_limit=limit, environment_id=environment_id
+                    data_export_id=data_export.id,
+                    export_limit=limit,
+                    environment_id=environment_id,
+                    compression=compression,
                 )
                 status = 201
         except ValidationError as e:
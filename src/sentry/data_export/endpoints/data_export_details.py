@@ -48,7 +48,8 @@ class DataExportDetailsEndpoint(OrganizationEndpoint):
         file = data_export.file
         raw_file = file.getfile()
         response = StreamingHttpResponse(
-            iter(lambda: raw_file.read(4096), b""), content_type="text/csv"
+            iter(lambda: raw_file.read(4096), b""),
+            content_type=file.headers.get("Content-Type", "text/csv"),
         )
         response["Content-Length"] = file.size
         response["Content-Disposition"] = u'attachment; filename="{}"'.format(file.name)
@@ -1,8 +1,11 @@
 from __future__ import absolute_import
 
 import logging
+import pytz
 
-from sentry.api.event_search import get_function_alias
+from dateutil.parser import parse as parse_date
+
+from sentry.api.event_search import get_function_alias, is_function
 from sentry.api.utils import get_date_range_from_params
 from sentry.models import Environment, Group, Project
 from sentry.snuba import discover
@@ -36,6 +39,16 @@ class DiscoverProcessor(object):
         self.data_fn = self.get_data_fn(
             fields=discover_query["field"], query=discover_query["query"], params=self.params
         )
+        # Exports of individual events (without aggregates) are paginated with
+        # a cursor on the timestamp and event id of the last exported event.
+        self.supports_cursor = not any(is_function(field) for field in discover_query["field"])
+        if self.supports_cursor:
+            fields = discover_query["field"]
+            if "timestamp" not in fields:
+                fields = fields + ["timestamp"]
+            self.cursor_data_fn = self.get_data_fn(
+                fields=fields, query=discover_query["query"], params=self.params
+            )
 
     @staticmethod
     def get_projects(organization_id, query):
@@ -67,7 +80,7 @@ class DiscoverProcessor(object):
 
     @staticmethod
     def get_data_fn(fields, query, params):
-        def data_fn(offset, limit):
+        def data_fn(offset, limit, **kwargs):
             return discover.query(
                 selected_columns=fields,
                 query=query,
@@ -78,10 +91,44 @@ class DiscoverProcessor(object):
                 auto_fields=True,
                 auto_aggregations=True,
                 use_aggregate_conditions=True,
+                **kwargs
             )
 
         return data_fn
 
+    def get_rows_after(self, cursor, limit):
+        """
+        Returns up to ``limit`` events, newest first, that come after the
+        ``cursor`` returned by ``get_cursor`` for the last exported event, or
+        from the newest event if ``cursor`` is ``None``.
+        """
+        if cursor is None:
+            return self.cursor_data_fn(offset=0, limit=limit, orderby=["-timestamp", "-id"])["data"]
+
+        timestamp, event_id = cursor
+        timestamp = parse_date(timestamp).replace(tzinfo=pytz.utc)
+
+        # The remaining events of the same second, followed by older events.
+        # These are separate queries as conditions cannot be combined with OR.
+        rows = self.cursor_data_fn(
+            offset=0,
+            limit=limit,
+            orderby=["-id"],
+            conditions=[["timestamp", "=", timestamp], ["event_id", "<", event_id]],
+        )["data"]
+        if len(rows) < limit:
+            rows += self.cursor_data_fn(
+                offset=0,
+                limit=limit - len(rows),
+                orderby=["-timestamp", "-id"],
+                conditions=[["timestamp", "<", timestamp]],
+            )["data"]
+        return rows
+
+    @staticmethod
+    def get_cursor(row):
+        return [row["timestamp"], row["id"]]
+
     def handle_fields(self, result_list):
         # Find issue short_id if present
         # (originally in `/api/bases/organization_events.py`)
@@ -1,9 +1,9 @@
 from __future__ import absolute_import
 
 import csv
+import gzip
 import logging
 import six
-import tempfile
 import codecs
 
 from hashlib import sha1
@@ -58,6 +58,8 @@ def assemble_download(
     offset=0,
     bytes_written=0,
     environment_id=None,
+    cursor=None,
+    compression=None,
     **kwargs
 ):
     with sentry_sdk.start_transaction(
@@ -102,8 +104,22 @@ def assemble_download(
                 export_limit = min(export_limit, EXPORTED_ROWS_LIMIT)
 
             processor = get_processor(data_export, environment_id)
+            use_cursor = getattr(processor, "supports_cursor", False)
+
+            # Rows are written straight into blobs of the export as they come
+            # in, optionally gzipped. Every blob is stored in its own
+            # transaction, so no transaction is held open while rows are
+            # fetched. If the batch fails, the blobs written so far are
+            # deleted again.
+            blob_writer = ExportBlobWriter(data_export, bytes_written)
+            # blobs of an earlier attempt of this batch that did not finish
+            blob_writer.delete_blobs()
+            try:
+                if compression == "gzip":
+                    out = gzip.GzipFile(fileobj=blob_writer, mode="wb")
+                else:
+                    out = blob_writer
 
-            with tempfile.TemporaryFile(mode="w+b") as tf:
                 # XXX(python3):
                 #
                 # In python2 land we write utf-8 encoded strings as bytes via
@@ -116,16 +132,16 @@ def assemble_download(
                 # Because of this we use the codec getwriter to transform our
                 # file handle to a stream writer that will encode to utf8.
                 if six.PY2:
-                    tfw = tf
+                    tfw = out
                 else:
-                    tfw = codecs.getwriter("utf-8")(tf)
+                    tfw = codecs.getwriter("utf-8")(out)
 
                 writer = csv.DictWriter(tfw, processor.header_fields, extrasaction="ignore")
                 if first_page:
                     writer.writeheader()
 
                 # the position in the file at the end of the headers
-                starting_pos = tf.tell()
+                starting_pos = out.tell()
 
                 # the row offset relative to the start of the current task
                 # this offset tells you the number of rows written during this batch fragment
@@ -138,23 +154,43 @@ def assemble_download(
                     # the number of rows to export in the next batch fragment
                     fragment_row_count = min(batch_size, max(export_limit - next_offset, 1))
 
-                    rows = process_rows(processor, data_export, fragment_row_count, next_offset)
+                    rows = process_rows(
+                        processor,
+                        data_export,
+                        fragment_row_count,
+                        next_offset,
+                        cursor=cursor if use_cursor else None,
+                    )
                     writer.writerows(rows)
 
                     fragment_offset += len(rows)
                     next_offset = offset + fragment_offset
+                    if use_cursor and rows:
+                        cursor = processor.get_cursor(rows[-1])
 
                     if (
                         not rows
                         or len(rows) < batch_size
                         # the batch may exceed MAX_BATCH_SIZE but immediately stops
-                        or tf.tell() - starting_pos >= MAX_BATCH_SIZE
+                        or out.tell() - starting_pos >= MAX_BATCH_SIZE
+                        or blob_writer.is_full
                     ):
                         break
 
-                tf.seek(0)
-                new_bytes_written = store_export_chunk_as_blob(data_export, bytes_written, tf)
-                bytes_written += new_bytes_written
+                out.close()
+                blob_writer.close()
+            except Exception:
+                blob_writer.delete_blobs()
+                raise
+
+            if blob_writer.is_full:
+                # there is a maximum file size allowed, so this batch is
+                # dropped and the export is finished with what we have
+                blob_writer.delete_blobs()
+                new_bytes_written = 0
+            else:
+                new_bytes_written = blob_writer.bytes_written
+            bytes_written += new_bytes_written
         except ExportError as error:
             return data_export.email_failure(message=six.text_type(error))
         except Exception as error:
@@ -189,11 +225,13 @@ def assemble_download(
                     offset=next_offset,
                     bytes_written=bytes_written,
                     environment_id=environment_id,
+                    cursor=cursor,
+                    compression=compression,
                 )
             else:
                 metrics.timing("dataexport.row_count", next_offset, sample_rate=1.0)
                 metrics.timing("dataexport.file_size", bytes_written, sample_rate=1.0)
-                merge_export_blobs.delay(data_export_id)
+                merge_export_blobs.delay(data_export_id, compression=compression)
 
 
 def get_processor(data_export, environment_id):
@@ -218,12 +256,12 @@ def get_processor(data_export, environment_id):
         raise
 
 
-def process_rows(processor, data_export, batch_size, offset):
+def process_rows(processor, data_export, batch_size, offset, cursor=None):
     try:
         if data_export.query_type == ExportQueryType.ISSUES_BY_TAG:
             rows = process_issues_by_tag(processor, batch_size, offset)
         elif data_export.query_type == ExportQueryType.DISCOVER:
-            rows = process_discover(processor, batch_size, offset)
+            rows = process_discover(processor, batch_size, offset, cursor)
         return rows
     except ExportError as error:
         metrics.incr("dataexport.error", tags={"error": six.text_type(error)}, sample_rate=1.0)
@@ -245,8 +283,12 @@ def process_issues_by_tag(processor, limit, offset):
 
 
 @handle_snuba_errors(logger)
-def process_discover(processor, limit, offset):
-    raw_data_unicode = processor.data_fn(limit=limit, offset=offset)["data"]
+def process_discover(processor, limit, offset, cursor=None):
+    if getattr(processor, "supports_cursor", False):
+        # the offset is only used to count rows, the cursor takes us to them
+        raw_data_unicode = processor.get_rows_after(cursor, limit)
+    else:
+        raw_data_unicode = processor.data_fn(limit=limit, offset=offset)["data"]
     # TODO(python3): Remove next block once the 'csv' module has been updated
     # to Python 3
     if six.PY2:
@@ -257,33 +299,77 @@ def process_discover(processor, limit, offset):
     return raw_data
 
 
-@transaction.atomic()
-def store_export_chunk_as_blob(data_export, bytes_written, fileobj, blob_size=DEFAULT_BLOB_SIZE):
+class ExportBlobWriter(object):
+    """
+    A write-only file object that stores everything written to it as blobs of
+    ``data_export`` of up to ``blob_size`` bytes, starting at byte ``offset`` of
+    the export. At most one blob is held in memory at a time.
+
+    Writes are ignored once the export has reached its maximum file size, which
+    is signalled by ``is_full``.
+    """
+
     # adapted from `putfile` in  `src/sentry/models/file.py`
-    bytes_offset = 0
-    while True:
-        contents = fileobj.read(blob_size)
-        if not contents:
-            return bytes_offset
 
-        blob_fileobj = ContentFile(contents)
-        blob = FileBlob.from_file(blob_fileobj, logger=logger)
-        ExportedDataBlob.objects.get_or_create(
-            data_export=data_export, blob=blob, offset=bytes_written + bytes_offset
-        )
+    def __init__(self, data_export, offset, blob_size=DEFAULT_BLOB_SIZE):
+        self.data_export = data_export
+        self.offset = offset
+        self.blob_size = blob_size
+        self.bytes_written = 0
+        self.is_full = False
+        self._buffer = []
+        self._buffer_size = 0
+
+    def write(self, data):
+        if self.is_full or not data:
+            return
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if self._buffer_size >= self.blob_size:
+            self._store_blobs()
+
+    def tell(self):
+        return self.bytes_written + self._buffer_size
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._store_blobs(final=True)
+
+    def delete_blobs(self):
+        """
+        Deletes the blobs of the export from ``offset`` on, including those
+        written by earlier attempts that failed.
+        """
+        ExportedDataBlob.objects.filter(
+            data_export=self.data_export, offset__gte=self.offset
+        ).delete()
+        self.bytes_written = 0
+
+    def _store_blobs(self, final=False):
+        contents = b"".join(self._buffer)
+        while contents and (final or len(contents) >= self.blob_size) and not self.is_full:
+            with transaction.atomic():
+                blob = FileBlob.from_file(ContentFile(contents[: self.blob_size]), logger=logger)
+                ExportedDataBlob.objects.get_or_create(
+                    data_export=self.data_export, blob=blob, offset=self.offset + self.bytes_written
+                )
+            contents = contents[self.blob_size :]
+            self.bytes_written += blob.size
 
-        bytes_offset += blob.size
+            # there is a maximum file size allowed, so we need to make sure we don't exceed it
+            # NOTE: there seems to be issues with downloading files larger than 1 GB on slower
+            # networks, limit the export to 1 GB for now to improve reliability
+            if self.offset + self.bytes_written >= min(MAX_FILE_SIZE, 2 ** 30):
+                self.is_full = True
 
-        # there is a maximum file size allowed, so we need to make sure we don't exceed it
-        # NOTE: there seems to be issues with downloading files larger than 1 GB on slower
-        # networks, limit the export to 1 GB for now to improve reliability
-        if bytes_written + bytes_offset >= min(MAX_FILE_SIZE, 2 ** 30):
-            transaction.set_rollback(True)
-            return 0
+        self._buffer = [contents] if contents and not self.is_full else []
+        self._buffer_size = len(contents) if self._buffer else 0
 
 
 @instrumented_task(name="sentry.data_export.tasks.merge_blobs", queue="data_export", acks_late=True)
-def merge_export_blobs(data_export_id, **kwargs):
+def merge_export_blobs(data_export_id, compression=None, **kwargs):
     with sentry_sdk.start_transaction(
         op="task.data_export.merge", name="DataExportMerge", sampled=True,
     ):
@@ -311,11 +397,18 @@ def merge_export_blobs(data_export_id, **kwargs):
         # adapted from `putfile` in  `src/sentry/models/file.py`
         try:
             with transaction.atomic():
-                file = File.objects.create(
-                    name=data_export.file_name,
-                    type="export.csv",
-                    headers={"Content-Type": "text/csv"},
-                )
+                if compression == "gzip":
+                    file = File.objects.create(
+                        name=data_export.file_name + ".gz",
+                        type="export.csv",
+                        headers={"Content-Type": "application/gzip"},
+                    )
+                else:
+                    file = File.objects.create(
+                        name=data_export.file_name,
+                        type="export.csv",
+                        headers={"Content-Type": "text/csv"},
+                    )
                 size = 0
                 file_checksum = sha1(b"")
 
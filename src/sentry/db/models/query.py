@@ -3,7 +3,7 @@ from __future__ import absolute_import
 import itertools
 import six
 
-from django.db import IntegrityError, router, transaction
+from django.db import IntegrityError, connections, router, transaction
 from django.db.models import Model, Q
 from django.db.models.expressions import CombinedExpression
 from django.db.models.signals import post_save
@@ -11,7 +11,7 @@ from six.moves import reduce
 
 from .utils import resolve_combined_expression
 
-__all__ = ("update", "create_or_update")
+__all__ = ("update", "create_or_update", "bulk_increment")
 
 
 def update(self, using=None, **kwargs):
@@ -98,6 +98,103 @@ def create_or_update(model, using=None, **kwargs):
     return affected, False
 
 
+def bulk_increment(model, rows, expressions=None, using=None):
+    """
+    Increments counters (and sets values) of many rows at once using a single
+    ``UPDATE ... FROM (VALUES ...)`` statement (PostgreSQL only.)
+
+    ``rows`` maps primary keys to ``(increments, values)`` tuples, which all
+    need to refer to the same columns. Columns can also be set from raw SQL
+    ``expressions``, in which ``{table}`` refers to the updated row and
+    ``{values}`` to the row of increments and values. Rows are not created if
+    they do not exist: the primary keys of the rows that have been updated are
+    returned.
+
+    >>> bulk_increment(MyModel, {
+    >>>     1: ({'col_name': 1}, {'other_col': 'foo'}),
+    >>>     2: ({'col_name': 3}, {'other_col': 'bar'}),
+    >>> })
+    """
+    if not rows:
+        return set()
+
+    if not using:
+        using = router.db_for_write(model)
+
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+
+    increments, values = next(six.itervalues(rows))
+    increment_fields = [model._meta.get_field(name) for name in sorted(increments)]
+    value_fields = [model._meta.get_field(name) for name in sorted(values)]
+
+    def make_column(field, prefix):
+        return quote_name(prefix + field.column)
+
+    set_clauses = [
+        u"{column} = t.{column} + v.{value}".format(
+            column=quote_name(field.column), value=make_column(field, "i_")
+        )
+        for field in increment_fields
+    ]
+    set_clauses.extend(
+        u"{} = v.{}".format(quote_name(field.column), make_column(field, "v_"))
+        for field in value_fields
+    )
+    for name, expression in six.iteritems(expressions or {}):
+        set_clauses.append(
+            u"{} = {}".format(
+                quote_name(model._meta.get_field(name).column),
+                expression.format(table="t", values="v"),
+            )
+        )
+
+    pk_field = model._meta.pk
+    fields = [(pk_field, None)]
+    fields.extend((field, "i_") for field in increment_fields)
+    fields.extend((field, "v_") for field in value_fields)
+
+    def make_cast(field, prefix):
+        # Auto primary keys have pseudo types like ``serial`` which can't be
+        # cast to, so they are cast to the type a reference to them has.
+        if prefix is not None:
+            return field.db_type(connection)
+        if hasattr(field, "get_related_db_type"):
+            return field.get_related_db_type(connection)
+        return field.rel_db_type(connection)
+
+    placeholder = u"({})".format(
+        u", ".join(u"%s::{}".format(make_cast(field, prefix)) for field, prefix in fields)
+    )
+
+    params = []
+    for pk, (increments, values) in six.iteritems(rows):
+        params.append(pk_field.get_db_prep_save(pk, connection=connection))
+        for field in increment_fields:
+            params.append(field.get_db_prep_save(increments[field.name], connection=connection))
+        for field in value_fields:
+            params.append(field.get_db_prep_save(values[field.name], connection=connection))
+
+    sql = (
+        u"UPDATE {table} AS t SET {set_clauses} "
+        u"FROM (VALUES {values}) AS v ({columns}) "
+        u"WHERE t.{pk} = v.{pk} RETURNING t.{pk}"
+    ).format(
+        table=quote_name(model._meta.db_table),
+        set_clauses=u", ".join(set_clauses),
+        values=u", ".join([placeholder] * len(rows)),
+        columns=u", ".join(
+            quote_name(pk_field.column) if prefix is None else make_column(field, prefix)
+            for field, prefix in fields
+        ),
+        pk=quote_name(pk_field.column),
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return set(row[0] for row in cursor.fetchall())
+
+
 def in_iexact(column, values):
     """Operator to test if any of the given values are (case-insensitive)
        matching to values in the given column."""
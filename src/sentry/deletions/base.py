@@ -91,24 +91,29 @@ class BaseDeletionTask(object):
         """
         self.mark_deletion_in_progress(instance_list)
 
-        child_relations = self.get_child_relations_bulk(instance_list)
-        child_relations = self.extend_relations_bulk(child_relations, instance_list)
-        child_relations = self.filter_relations(child_relations)
+        child_relations = self.get_all_child_relations(instance_list)
         if child_relations:
             has_more = self.delete_children(child_relations)
             if has_more:
                 return has_more
 
+        return self.delete_instance_bulk(instance_list)
+
+    def get_all_child_relations(self, instance_list):
+        """
+        Returns all relations that ``delete_bulk`` deletes before deleting
+        ``instance_list``, in the order they are deleted in.
+        """
+        child_relations = self.get_child_relations_bulk(instance_list)
+        child_relations = self.extend_relations_bulk(child_relations, instance_list)
+        child_relations = list(self.filter_relations(child_relations))
+
         for instance in instance_list:
-            child_relations = self.get_child_relations(instance)
-            child_relations = self.extend_relations(child_relations, instance)
-            child_relations = self.filter_relations(child_relations)
-            if child_relations:
-                has_more = self.delete_children(child_relations)
-                if has_more:
-                    return has_more
+            relations = self.get_child_relations(instance)
+            relations = self.extend_relations(relations, instance)
+            child_relations.extend(self.filter_relations(relations))
 
-        return self.delete_instance_bulk(instance_list)
+        return child_relations
 
     def delete_instance(self, instance):
         raise NotImplementedError
@@ -118,17 +123,11 @@ class BaseDeletionTask(object):
             self.delete_instance(instance)
 
     def delete_children(self, relations):
-        # Ideally this runs through the deletion manager
-        for relation in relations:
-            task = self.manager.get(
-                transaction_id=self.transaction_id,
-                actor_id=self.actor_id,
-                task=relation.task,
-                **relation.params
-            )
-            has_more = True
-            while has_more:
-                has_more = task.chunk()
+        from sentry.deletions.plan import DeletionPlan
+
+        DeletionPlan(
+            self.manager, relations, transaction_id=self.transaction_id, actor_id=self.actor_id
+        ).execute()
         return False
 
     def mark_deletion_in_progress(self, instance_list):
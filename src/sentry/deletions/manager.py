@@ -13,13 +13,19 @@ class DeletionTaskManager(object):
         self.bulk_dependencies = defaultdict(set)
 
     def get(self, task=None, **kwargs):
+        task = self.get_task_class(kwargs.get("model"), task)
+        return task(manager=self, **kwargs)
+
+    def get_task_class(self, model, task=None):
+        """
+        Returns the task class ``get`` instantiates for ``model``.
+        """
         if task is None:
-            model = kwargs.get("model")
             try:
                 task = self.tasks[model]
             except KeyError:
                 task = self.default_task
-        return task(manager=self, **kwargs)
+        return task
 
     def register(self, model, task):
         self.tasks[model] = task
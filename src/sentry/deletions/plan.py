@@ -0,0 +1,220 @@
+"""
+Plans the deletion of the child relations of a deletion task.
+
+Relations handled by a ``BulkModelDeletionTask`` have no per-row side effects
+and are removed with set based ``DELETE ... WHERE id = ANY(ARRAY(SELECT id ...
+LIMIT n))`` batches, while all other relations are walked object by object
+through their deletion task. Relations are deleted in the order they are given,
+as later relations may depend on earlier ones being gone, except that runs of
+adjacent bulk relations which do not reference each other form a stage whose
+relations are deleted in parallel.
+
+>>> plan = DeletionPlan(default_manager, relations)
+>>> plan.execute(dry_run=True)
+"""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import six
+
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+
+from sentry.utils import json, metrics
+
+from .base import BulkModelDeletionTask
+
+logger = logging.getLogger("sentry.deletions.plan")
+
+
+def estimate_rows(queryset):
+    """
+    Returns the number of rows the planner of the database expects
+    ``queryset`` to match, which is much cheaper than counting them.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        explanation = cursor.fetchone()[0]
+    if isinstance(explanation, six.string_types):
+        explanation = json.loads(explanation)
+    return explanation[0]["Plan"]["Plan Rows"]
+
+
+class PlanStep(object):
+    def __init__(self, relation, task_cls):
+        self.relation = relation
+        self.task_cls = task_cls
+        self.estimated_rows = None
+        self.rows_deleted = 0
+        self.finished = False
+
+    def __repr__(self):
+        return "<%s: task=%s params=%s>" % (type(self), self.task_cls, self.relation.params)
+
+    @property
+    def model(self):
+        return self.relation.params.get("model")
+
+    @property
+    def is_bulk(self):
+        return issubclass(self.task_cls, BulkModelDeletionTask)
+
+    @property
+    def kind(self):
+        return "bulk" if self.is_bulk else "objects"
+
+    def get_queryset(self):
+        if self.model is None:
+            return None
+        manager_name = getattr(self.task_cls, "manager_name", "objects")
+        return getattr(self.model, manager_name).filter(**self.relation.params["query"])
+
+    def references(self, other):
+        """
+        Returns ``True`` if rows of this step may hold foreign keys to rows of
+        ``other``, in which case this step must be finished before ``other``
+        starts.
+        """
+        if self.model is None or other.model is None:
+            return True
+        return any(
+            field.related_model is other.model
+            for field in self.model._meta.concrete_fields
+            if field.is_relation
+        )
+
+
+class DeletionPlan(object):
+    """
+    The steps needed to delete ``relations``, grouped into stages that run one
+    after another. Every step of a stage runs in parallel on up to
+    ``concurrency`` threads, which defaults to ``SENTRY_DELETIONS_CONCURRENCY``.
+
+    ``progress`` is called with the step after every batch it deleted. It may
+    be called from several threads at once.
+    """
+
+    def __init__(
+        self,
+        manager,
+        relations,
+        transaction_id=None,
+        actor_id=None,
+        concurrency=None,
+        progress=None,
+    ):
+        self.manager = manager
+        self.transaction_id = transaction_id
+        self.actor_id = actor_id
+        self.concurrency = (
+            concurrency if concurrency is not None else settings.SENTRY_DELETIONS_CONCURRENCY
+        )
+        self.progress = progress
+        self.stages = []
+
+        for relation in relations:
+            step = PlanStep(
+                relation, manager.get_task_class(relation.params.get("model"), relation.task)
+            )
+            stage = self.stages[-1] if self.stages else None
+            if (
+                stage is None
+                or not step.is_bulk
+                or not stage[0].is_bulk
+                or any(prev.references(step) for prev in stage)
+            ):
+                self.stages.append([step])
+            else:
+                stage.append(step)
+
+    def __repr__(self):
+        return "<%s: stages=%s>" % (type(self), self.stages)
+
+    @property
+    def steps(self):
+        return [step for stage in self.stages for step in stage]
+
+    def estimate(self):
+        """
+        Sets the ``estimated_rows`` of every step that deletes models.
+        """
+        for step in self.steps:
+            queryset = step.get_queryset()
+            if queryset is not None:
+                step.estimated_rows = estimate_rows(queryset)
+
+    def describe(self):
+        """
+        Returns a line for every step, describing how it is going to be deleted.
+        """
+        lines = []
+        for index, stage in enumerate(self.stages):
+            for step in stage:
+                line = "%d. [%s] %s %s" % (
+                    index + 1,
+                    step.kind,
+                    step.model.__name__ if step.model is not None else step.task_cls.__name__,
+                    json.dumps(step.relation.params.get("query"), default=six.text_type),
+                )
+                if step.estimated_rows is not None:
+                    line += ", ~%d rows" % step.estimated_rows
+                if step.rows_deleted:
+                    line += ", %d deleted" % step.rows_deleted
+                if step.finished:
+                    line += ", done"
+                lines.append(line)
+        return lines
+
+    def execute(self, dry_run=False):
+        """
+        Deletes all relations of the plan. When ``dry_run`` is set, the
+        row counts of the steps are estimated and the plan is logged instead.
+        """
+        if dry_run:
+            self.estimate()
+            for line in self.describe():
+                logger.info(
+                    "object.delete.plan",
+                    extra={"transaction_id": self.transaction_id, "step": line},
+                )
+            return
+
+        for stage in self.stages:
+            max_workers = min(self.concurrency, len(stage))
+            if max_workers <= 1:
+                for step in stage:
+                    self.execute_step(step)
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    # consume the results, so that errors are raised here
+                    list(executor.map(self._execute_step_in_thread, stage))
+
+    def execute_step(self, step):
+        task = self.manager.get(
+            transaction_id=self.transaction_id,
+            actor_id=self.actor_id,
+            task=step.relation.task,
+            **step.relation.params
+        )
+        with metrics.timer("deletions.plan.step", tags={"kind": step.kind}):
+            while True:
+                # bulk deletion tasks return the number of deleted rows
+                has_more = task.chunk()
+                if not has_more:
+                    break
+                if step.is_bulk:
+                    step.rows_deleted += int(has_more)
+                    metrics.incr("deletions.plan.rows_deleted", amount=int(has_more))
+                if self.progress is not None:
+                    self.progress(step)
+        step.finished = True
+
+    def _execute_step_in_thread(self, step):
+        try:
+            return self.execute_step(step)
+        finally:
+            # connections are local to the thread and would leak otherwise
+            connections.close_all()
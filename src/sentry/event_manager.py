@@ -69,7 +69,6 @@ from sentry.utils.outcomes import Outcome, track_outcome
 from sentry.utils.safe import safe_execute, trim, get_path, setdefault_path
 from sentry.stacktraces.processing import normalize_stacktraces_for_grouping
 from sentry.culprit import generate_culprit
-from sentry.utils.compat import map
 from sentry.reprocessing2 import save_unprocessed_event
 
 logger = logging.getLogger("sentry.events")
@@ -693,6 +692,8 @@ def _tsdb_record_all_metrics(jobs):
     put everything in a single redis pipeline someday.
     """
 
+    from sentry.rules.conditions.event_frequency import record_event_frequency
+
     # XXX: validate whether anybody actually uses those metrics
 
     for job in jobs:
@@ -741,6 +742,9 @@ def _tsdb_record_all_metrics(jobs):
         if frequencies:
             tsdb.record_frequency_multi(frequencies, timestamp=event.datetime)
 
+        if group:
+            record_event_frequency(group.id, environment.id, event.datetime)
+
 
 @metrics.wraps("save_event.nodestore_save_many")
 def _nodestore_save_many(jobs):
@@ -1358,10 +1362,35 @@ def save_attachments(cache_key, attachments, job):
         )
 
 
+@metrics.wraps("event_manager.find_hashes")
 def _find_hashes(project, hash_list):
-    return map(
-        lambda hash: GroupHash.objects.get_or_create(project=project, hash=hash)[0], hash_list
-    )
+    """
+    Returns the `GroupHash` rows for `hash_list` in the same order, creating
+    the ones that do not exist yet.  Existing hashes are resolved with a
+    single query and missing ones are inserted in bulk.
+    """
+    found = {h.hash: h for h in GroupHash.objects.filter(project=project, hash__in=hash_list)}
+
+    missing = []
+    for hash in hash_list:
+        if hash not in found and hash not in missing:
+            missing.append(hash)
+
+    if missing:
+        try:
+            with transaction.atomic(using=router.db_for_write(GroupHash)):
+                created = GroupHash.objects.bulk_create(
+                    [GroupHash(project=project, hash=hash) for hash in missing]
+                )
+        except IntegrityError:
+            # Another event created some of these hashes concurrently. Fall
+            # back to resolving them one by one.
+            created = [
+                GroupHash.objects.get_or_create(project=project, hash=hash)[0] for hash in missing
+            ]
+        found.update((h.hash, h) for h in created)
+
+    return [found[hash] for hash in hash_list]
 
 
 @metrics.wraps("event_manager.save_transactions.materialize_event_metrics")
@@ -1,8 +1,11 @@
 from __future__ import absolute_import
 
+import copy
 import re
 import six
 
+from django.conf import settings
+
 from sentry.grouping.strategies.configurations import CONFIGURATIONS
 from sentry.grouping.component import GroupingComponent
 from sentry.grouping.variants import (
@@ -19,10 +22,20 @@ from sentry.grouping.utils import (
     resolve_fingerprint_values,
     expand_title_template,
 )
+from sentry.utils import json, metrics
+from sentry.utils.datastructures import LRUCache
+from sentry.utils.hashlib import md5_text
 
 
 HASH_RE = re.compile(r"^[0-9a-f]{32}$")
 
+# Frame attributes that no grouping strategy looks at.  They are left out of
+# the cache key so that events only differing in local variables or source
+# context share grouping results.
+_IGNORED_FRAME_KEYS = frozenset(("vars", "pre_context", "post_context"))
+
+_variants_cache = LRUCache(max_size=settings.SENTRY_GROUPING_VARIANTS_CACHE_SIZE)
+
 
 class GroupingConfigNotFound(LookupError):
     pass
@@ -178,6 +191,63 @@ def _get_calculated_grouping_variants_for_event(event, config):
     return rv
 
 
+def _strip_ignored_frame_keys(value):
+    if isinstance(value, dict):
+        rv = {}
+        for (key, item) in six.iteritems(value):
+            if key == "frames" and isinstance(item, list):
+                rv[key] = [
+                    dict((k, v) for k, v in six.iteritems(frame) if k not in _IGNORED_FRAME_KEYS)
+                    if isinstance(frame, dict)
+                    else frame
+                    for frame in item
+                ]
+            else:
+                rv[key] = _strip_ignored_frame_keys(item)
+        return rv
+    if isinstance(value, list):
+        return [_strip_ignored_frame_keys(item) for item in value]
+    return value
+
+
+def _get_grouping_cache_key(event, config):
+    """Returns a digest of everything the strategies of `config` look at
+    when grouping `event`: the interfaces they are registered for and the
+    platform of the event.
+    """
+    interfaces = set()
+    for strategy in config.iter_strategies():
+        interfaces.update(strategy.interfaces)
+
+    grouping_input = [config.id, config.enhancements_config, event.platform]
+    for path in sorted(interfaces):
+        grouping_input.append(_strip_ignored_frame_keys(event.data.get(path)))
+
+    return md5_text(json.dumps(grouping_input)).hexdigest()
+
+
+def _get_cached_calculated_grouping_variants_for_event(event, config):
+    """Like `_get_calculated_grouping_variants_for_event` but reuses the
+    components computed for earlier events with identical grouping input.
+    The returned components can be modified by the caller.
+    """
+    if not _variants_cache.max_size:
+        return _get_calculated_grouping_variants_for_event(event, config)
+
+    cache_key = _get_grouping_cache_key(event, config)
+    components = _variants_cache.get(cache_key)
+    if components is not None:
+        metrics.incr("grouping.variants_cache", tags={"result": "hit"})
+        return copy.deepcopy(components)
+
+    metrics.incr("grouping.variants_cache", tags={"result": "miss"})
+    components = _get_calculated_grouping_variants_for_event(event, config)
+    evicted = _variants_cache.set(cache_key, copy.deepcopy(components))
+    if evicted:
+        metrics.incr("grouping.variants_cache.evictions", amount=evicted)
+    return components
+
+
 def get_grouping_variants_for_event(event, config=None):
     """Returns a dict of all grouping variants for this event."""
     # If a checksum is set the only variant that comes back from this
@@ -208,7 +278,7 @@ def get_grouping_variants_for_event(event, config=None):
 
     # At this point we need to calculate the default event values.  If the
     # fingerprint is salted we will wrap it.
-    components = _get_calculated_grouping_variants_for_event(event, config)
+    components = _get_cached_calculated_grouping_variants_for_event(event, config)
 
     # If no defaults are referenced we produce a single completely custom
     # fingerprint and mark all other variants as non-contributing
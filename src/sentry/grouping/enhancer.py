@@ -7,6 +7,7 @@ import zlib
 import base64
 import msgpack
 import inspect
+import weakref
 
 from parsimonious.grammar import Grammar, NodeVisitor
 from parsimonious.exceptions import ParseError
@@ -16,7 +17,7 @@ from sentry.stacktraces.functions import set_in_app
 from sentry.stacktraces.platform import get_behavior_family_for_platform
 from sentry.grouping.component import GroupingComponent
 from sentry.grouping.utils import get_rule_bool
-from sentry.utils.compat import implements_to_string
+from sentry.utils.compat import functools, implements_to_string
 from sentry.utils.glob import glob_match
 from sentry.utils.safe import get_path
 from sentry.utils.compat import zip
@@ -111,10 +112,50 @@ MATCHERS = {
 }
 
 
+# Characters that have a special meaning in glob patterns.  Everything
+# outside of these is matched literally which lets us reject most frames with
+# a cheap prefix/suffix check before calling into the glob matcher.
+GLOB_SPECIAL_CHARS = frozenset("*?[]{}!\\")
+
+# Upper bound of memoized glob results shared across events.
+GLOB_MATCH_CACHE_SIZE = 20000
+
+# Upper bound of deserialized (and compiled) enhancement configs shared
+# across events.
+LOADED_ENHANCEMENTS_CACHE_SIZE = 200
+
+
 class InvalidEnhancerConfig(Exception):
     pass
 
 
+def _literal_affixes(pattern):
+    """Returns the literal prefix and suffix of a glob pattern.  A value can
+    only match the pattern if it starts with the prefix and ends with the
+    suffix.
+    """
+    special = [idx for idx, char in enumerate(pattern) if char in GLOB_SPECIAL_CHARS]
+    if not special:
+        return pattern, pattern
+    suffix = pattern[special[-1] + 1 :]
+    # ``**/`` also matches no directory at all (``**/foo.js`` matches
+    # ``foo.js``), so the slash is not part of the suffix.
+    if pattern[special[-1]] == "*" and suffix.startswith("/"):
+        suffix = suffix[1:]
+    return pattern[: special[0]], suffix
+
+
+@functools.lru_cache(maxsize=GLOB_MATCH_CACHE_SIZE)
+def _cached_glob_match(value, pattern, path_like):
+    if not path_like:
+        return glob_match(value, pattern)
+    if glob_match(value, pattern, ignorecase=True, doublestar=True, path_normalize=True):
+        return True
+    return not value.startswith("/") and glob_match(
+        "/" + value, pattern, ignorecase=True, doublestar=True, path_normalize=True
+    )
+
+
 class Match(object):
     def __init__(self, key, pattern, negated=False):
         try:
@@ -342,26 +383,33 @@ class Enhancements(object):
             bases = []
         self.bases = bases
 
+    def compile(self):
+        """Returns the compiled form of these enhancements.  The result is
+        cached for the lifetime of this object.
+        """
+        rv = _compiled_enhancements.get(self)
+        if rv is None:
+            rv = _compiled_enhancements[self] = CompiledEnhancements(self)
+        return rv
+
     def apply_modifications_to_frame(self, frames, platform):
         """This applies the frame modifications to the frames itself.  This
         does not affect grouping.
         """
-        for rule in self.iter_rules():
-            for idx, frame in enumerate(frames):
-                actions = rule.get_matching_frame_actions(frame, platform)
-                for action in actions or ():
-                    action.apply_modifications_to_frame(frames, idx)
+        for idx, rule in self.compile().iter_matching_rules(frames, platform):
+            for action in rule.actions:
+                action.apply_modifications_to_frame(frames, idx)
 
     def update_frame_components_contributions(self, components, frames, platform):
         stacktrace_state = StacktraceState()
 
         # Apply direct frame actions and update the stack state alongside
-        for rule in self.iter_rules():
-            for idx, (component, frame) in enumerate(zip(components, frames)):
-                actions = rule.get_matching_frame_actions(frame, platform)
-                for action in actions or ():
-                    action.update_frame_components_contributions(components, frames, idx, rule=rule)
-                    action.modify_stacktrace_state(stacktrace_state, rule)
+        matched_frames = frames[: len(components)]
+        for idx, compiled_rule in self.compile().iter_matching_rules(matched_frames, platform):
+            rule = compiled_rule.rule
+            for action in rule.actions:
+                action.update_frame_components_contributions(components, frames, idx, rule=rule)
+                action.modify_stacktrace_state(stacktrace_state, rule)
 
         # Use the stack state to update frame contributions again to trim
         # down to max-frames.  min-frames is handled on the other hand for
@@ -454,15 +502,13 @@ class Enhancements(object):
 
     @classmethod
     def loads(cls, data):
+        """Loads serialized enhancements.  Results are memoized by the
+        serialized config, so that all events with the same config share one
+        object and its compiled form.  They must not be modified.
+        """
         if isinstance(data, six.text_type):
             data = data.encode("ascii", "ignore")
-        padded = data + b"=" * (4 - (len(data) % 4))
-        try:
-            return cls._from_config_structure(
-                msgpack.loads(zlib.decompress(base64.urlsafe_b64decode(padded)), raw=False)
-            )
-        except (LookupError, AttributeError, TypeError, ValueError) as e:
-            raise ValueError("invalid grouping enhancement config: %s" % e)
+        return _load_enhancements(cls, data)
 
     @classmethod
     def from_config_string(self, s, bases=None, id=None):
@@ -517,6 +563,173 @@ class Rule(object):
         )
 
 
+class FrameMatchContext(object):
+    """Holds the values of a single frame that matchers look at.  Values are
+    computed on first access and match results are memoized so that matchers
+    shared between rules are only evaluated once per frame.
+    """
+
+    def __init__(self, frame, platform):
+        self.frame = frame
+        self.platform = platform
+        self._values = {}
+        self._results = {}
+
+    @property
+    def family(self):
+        rv = self._values.get("family")
+        if rv is None:
+            rv = self._values["family"] = get_behavior_family_for_platform(
+                self.frame.get("platform") or self.platform
+            )
+        return rv
+
+    def get_value(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        frame = self.frame
+        if key == "path":
+            rv = frame.get("abs_path") or frame.get("filename") or ""
+        elif key == "package":
+            rv = frame.get("package") or ""
+        elif key == "function":
+            from sentry.stacktraces.functions import get_function_name_for_frame
+
+            rv = get_function_name_for_frame(frame, self.platform) or "<unknown>"
+        elif key == "module":
+            rv = frame.get("module") or "<unknown>"
+        else:
+            rv = "<unknown>"
+        self._values[key] = rv
+        return rv
+
+
+class CompiledMatch(object):
+    """A matcher with its pattern pre-analyzed for fast rejection."""
+
+    def __init__(self, match):
+        self.key = match.key
+        self.pattern = match.pattern
+        self.negated = match.negated
+        self.cache_key = (self.key, self.pattern)
+        self.path_like = self.key in ("path", "package")
+        self.families = None
+        self.app = None
+        self.prefix = self.suffix = ""
+
+        if self.key == "family":
+            flags = self.pattern.split(",")
+            if "all" not in flags:
+                self.families = frozenset(flags)
+        elif self.key == "app":
+            self.app = get_rule_bool(self.pattern)
+        elif self.path_like:
+            # Paths are matched case insensitive, normalized and optionally
+            # with a leading slash added so only the suffix is reliable.
+            _, suffix = _literal_affixes(self.pattern.lower())
+            if suffix and not suffix.endswith("/"):
+                self.suffix = suffix
+        else:
+            self.prefix, self.suffix = _literal_affixes(self.pattern)
+
+    @property
+    def cost(self):
+        """Rough relative evaluation cost used to order the matchers of a rule."""
+        if self.key in ("family", "app"):
+            return 0
+        if self.prefix or self.suffix:
+            return 1
+        return 2
+
+    def matches_frame(self, ctx):
+        # In-app matching depends on state that earlier rules modify, so it
+        # is never memoized.
+        if self.key == "app":
+            rv = self.app is not None and self.app == ctx.frame.get("in_app")
+        else:
+            rv = ctx._results.get(self.cache_key)
+            if rv is None:
+                rv = ctx._results[self.cache_key] = self._positive_frame_match(ctx)
+        if self.negated:
+            rv = not rv
+        return rv
+
+    def _positive_frame_match(self, ctx):
+        if self.key == "family":
+            return self.families is None or ctx.family in self.families
+
+        value = ctx.get_value(self.key)
+        if self.path_like:
+            # Relative paths are also matched with a leading slash added.
+            normalized = "/" + value.replace("\\", "/").lower()
+            if self.suffix and not normalized.endswith(self.suffix):
+                return False
+        elif not (value.startswith(self.prefix) and value.endswith(self.suffix)):
+            return False
+        return _cached_glob_match(value, self.pattern, self.path_like)
+
+
+class CompiledRule(object):
+    def __init__(self, rule):
+        self.rule = rule
+        self.actions = rule.actions
+        self.matchers = sorted((CompiledMatch(m) for m in rule.matchers), key=lambda m: m.cost)
+
+        # Rules that require a specific family are skipped entirely for
+        # stacktraces that do not contain a frame of that family.
+        self.families = None
+        for matcher in self.matchers:
+            if matcher.families is not None and not matcher.negated:
+                if self.families is None:
+                    self.families = matcher.families
+                else:
+                    self.families = self.families & matcher.families
+
+    def matches_frame(self, ctx):
+        return bool(self.matchers) and all(m.matches_frame(ctx) for m in self.matchers)
+
+
+class CompiledEnhancements(object):
+    """The flattened form of an `Enhancements` object including all rules
+    of its bases.  Rules are still applied in their original order as
+    actions of earlier rules (`+app` / `-app`) influence later matchers.
+    """
+
+    def __init__(self, enhancements):
+        self.rules = [CompiledRule(rule) for rule in enhancements.iter_rules()]
+
+    def iter_matching_rules(self, frames, platform):
+        """Yields `(idx, rule)` for every rule matching a frame, ordered by
+        rule first and frame second.
+        """
+        contexts = [FrameMatchContext(frame, platform) for frame in frames]
+        families = set(ctx.family for ctx in contexts)
+        for rule in self.rules:
+            if rule.families is not None and rule.families.isdisjoint(families):
+                continue
+            for idx, ctx in enumerate(contexts):
+                if rule.matches_frame(ctx):
+                    yield idx, rule
+
+
+# Compiled enhancements are kept outside of the `Enhancements` object to keep
+# its serialized form unchanged.
+_compiled_enhancements = weakref.WeakKeyDictionary()
+
+
+@functools.lru_cache(maxsize=LOADED_ENHANCEMENTS_CACHE_SIZE)
+def _load_enhancements(cls, data):
+    padded = data + b"=" * (4 - (len(data) % 4))
+    try:
+        return cls._from_config_structure(
+            msgpack.loads(zlib.decompress(base64.urlsafe_b64decode(padded)), raw=False)
+        )
+    except (LookupError, AttributeError, TypeError, ValueError) as e:
+        raise ValueError("invalid grouping enhancement config: %s" % e)
+
+
 class EnhancmentsVisitor(NodeVisitor):
     visit_comment = visit_empty = lambda *a: None
     unwrapped_exceptions = (InvalidEnhancerConfig,)
@@ -1,10 +1,63 @@
 from __future__ import absolute_import, print_function
 
+import hashlib
+import threading
+
+from django.conf import settings
 from six import text_type
 from symbolic import SourceView
+
+from sentry.utils import metrics
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.strings import codec_lookup
 
-__all__ = ["SourceCache", "SourceMapCache"]
+__all__ = ["SourceCache", "SourceMapCache", "get_cached_view"]
+
+_view_cache = None
+_view_cache_lock = threading.Lock()
+
+
+def get_view_cache():
+    """
+    Returns the worker-wide cache of parsed source and sourcemap views, or
+    ``None`` if it is disabled. It is bounded by the size of the files the
+    views were parsed from.
+    """
+    global _view_cache
+    if _view_cache is None and settings.SENTRY_JS_VIEW_CACHE_SIZE > 0:
+        with _view_cache_lock:
+            if _view_cache is None:
+                _view_cache = LRUCache(
+                    max_size=settings.SENTRY_JS_VIEW_CACHE_SIZE, get_size=lambda item: item[1]
+                )
+    return _view_cache
+
+
+def get_cached_view(kind, body, factory):
+    """
+    Returns ``factory(body)``, reusing the view parsed by an earlier call (in
+    any processor of this worker) for the same ``kind`` and contents.
+
+    Views are keyed by a checksum of the file contents rather than by url:
+    the same artifact uploaded to several releases or dists is parsed only
+    once, and a re-uploaded file can never return a stale view.
+    """
+    view_cache = get_view_cache()
+    if view_cache is None:
+        return factory(body)
+
+    key = (kind, hashlib.sha1(body).hexdigest())
+    item = view_cache.get(key)
+    if item is not None:
+        metrics.incr("sourcemaps.view_cache", tags={"kind": kind, "result": "hit"})
+        return item[0]
+
+    metrics.incr("sourcemaps.view_cache", tags={"kind": kind, "result": "miss"})
+    view = factory(body)
+    evicted = view_cache.set(key, (view, len(body)))
+    if evicted:
+        metrics.incr("sourcemaps.view_cache.evictions", amount=evicted, tags={"kind": kind})
+    return view
 
 
 def is_utf8(codec):
@@ -52,7 +105,7 @@ class SourceCache(object):
                     source = source.decode(encoding).encode("utf-8")
                 except UnicodeError:
                     pass
-            source = SourceView.from_bytes(source)
+            source = get_cached_view("source", source, SourceView.from_bytes)
         self._cache[url] = source
 
     def add_error(self, url, error):
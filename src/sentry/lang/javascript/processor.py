@@ -9,9 +9,14 @@ import re
 import sys
 import base64
 import six
+import threading
 import zlib
 
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from django.db import connections
+from itertools import chain
 from os.path import splitext
 from requests.utils import get_encoding_from_headers
 from six.moves.urllib.parse import urlsplit
@@ -40,10 +45,11 @@ from sentry.utils.hashlib import md5_text
 from sentry.utils.http import is_valid_origin
 from sentry.utils.safe import get_path
 from sentry.utils import metrics
+from sentry.utils.compat import zip
 from sentry.utils.urls import non_standard_url_join
 from sentry.stacktraces.processing import StacktraceProcessor
 
-from .cache import SourceCache, SourceMapCache
+from .cache import SourceCache, SourceMapCache, get_cached_view
 
 # number of surrounding lines (on each side) to fetch
 LINES_OF_CONTEXT = 5
@@ -73,6 +79,8 @@ CACHE_CONTROL_MIN = 60
 # the maximum number of remote resources (i.e. source files) that should be
 # fetched
 MAX_RESOURCE_FETCHES = 100
+# the maximum number of concurrent fetches from the same domain when scraping
+MAX_CONCURRENT_FETCHES_PER_DOMAIN = 4
 
 logger = logging.getLogger(__name__)
 
@@ -211,33 +219,92 @@ def discover_sourcemap(result):
     return force_text(sourcemap) if sourcemap is not None else None
 
 
-def fetch_release_file(filename, release, dist=None):
+def get_release_file_cache_key(filename, release, dist_name=None):
+    return "releasefile:v1:%s:%s" % (release.id, ReleaseFile.get_ident(filename, dist_name))
+
+
+def get_release_file_idents(filename, dist_name=None):
+    return [ReleaseFile.get_ident(f, dist_name) for f in ReleaseFile.normalize(filename)]
+
+
+def prefetch_release_files(filenames, release, dist=None):
+    """
+    Looks up the cached results of ``fetch_release_file`` for all
+    ``filenames`` at once, and loads the candidate artifacts of all files
+    that are not cached with a single database query.
+
+    Returns a dict mapping each filename to a ``(cached_result,
+    possible_files)`` tuple that can be passed to ``fetch_release_file``.
+    """
+    dist_name = dist and dist.name or None
+    cache_keys = {f: get_release_file_cache_key(f, release, dist_name) for f in filenames}
+    cached = cache.get_many(list(cache_keys.values()))
+
+    filename_idents = {
+        f: get_release_file_idents(f, dist_name) for f in filenames if cache_keys[f] not in cached
+    }
+
+    files_by_ident = {}
+    if filename_idents:
+        logger.debug(
+            "Checking database for %d release artifacts (release_id=%s)",
+            len(filename_idents),
+            release.id,
+        )
+        idents = set(chain.from_iterable(six.itervalues(filename_idents)))
+        for releasefile in ReleaseFile.objects.filter(
+            release=release, dist=dist, ident__in=idents
+        ).select_related("file"):
+            files_by_ident[releasefile.ident] = releasefile
+
+    rv = {}
+    for filename in filenames:
+        if filename in filename_idents:
+            # Candidates are kept in the same priority order as the idents.
+            possible_files = [
+                files_by_ident[ident]
+                for ident in filename_idents[filename]
+                if ident in files_by_ident
+            ]
+            rv[filename] = (None, possible_files)
+        else:
+            rv[filename] = (cached[cache_keys[filename]], None)
+    return rv
+
+
+def fetch_release_file(filename, release, dist=None, prefetched=None):
     """
     Attempt to retrieve a release artifact from the database.
 
-    Caches the result of that attempt (whether successful or not).
+    Caches the result of that attempt (whether successful or not). The cache
+    and database lookups are skipped if ``prefetched`` holds the result of
+    ``prefetch_release_files`` for this file.
     """
 
     dist_name = dist and dist.name or None
-    cache_key = "releasefile:v1:%s:%s" % (release.id, ReleaseFile.get_ident(filename, dist_name))
+    cache_key = get_release_file_cache_key(filename, release, dist_name)
 
-    logger.debug("Checking cache for release artifact %r (release_id=%s)", filename, release.id)
-    result = cache.get(cache_key)
+    if prefetched is not None:
+        result, possible_files = prefetched
+    else:
+        logger.debug("Checking cache for release artifact %r (release_id=%s)", filename, release.id)
+        result = cache.get(cache_key)
+        possible_files = None
 
     # not in the cache (meaning we haven't checked the database recently), so check the database
     if result is None:
-        filename_choices = ReleaseFile.normalize(filename)
-        filename_idents = [ReleaseFile.get_ident(f, dist_name) for f in filename_choices]
+        filename_idents = get_release_file_idents(filename, dist_name)
 
-        logger.debug(
-            "Checking database for release artifact %r (release_id=%s)", filename, release.id
-        )
+        if possible_files is None:
+            logger.debug(
+                "Checking database for release artifact %r (release_id=%s)", filename, release.id
+            )
 
-        possible_files = list(
-            ReleaseFile.objects.filter(
-                release=release, dist=dist, ident__in=filename_idents
-            ).select_related("file")
-        )
+            possible_files = list(
+                ReleaseFile.objects.filter(
+                    release=release, dist=dist, ident__in=filename_idents
+                ).select_related("file")
+            )
 
         if len(possible_files) == 0:
             logger.debug(
@@ -294,7 +361,15 @@ def fetch_release_file(filename, release, dist=None):
     return result
 
 
-def fetch_file(url, project=None, release=None, dist=None, allow_scraping=True):
+def fetch_file(
+    url,
+    project=None,
+    release=None,
+    dist=None,
+    allow_scraping=True,
+    prefetched_release_file=None,
+    domain_lock=None,
+):
     """
     Pull down a URL, returning a UrlResult object.
 
@@ -302,6 +377,9 @@ def fetch_file(url, project=None, release=None, dist=None, allow_scraping=True):
     event), then the internet. Caches the result of each of those two attempts
     separately, whether or not those attempts are successful. Used for both
     source files and source maps.
+
+    ``prefetched_release_file`` is passed on to ``fetch_release_file``, and
+    ``domain_lock`` is held while scraping the internet.
     """
 
     # If our url has been truncated, it'd be impossible to fetch
@@ -312,7 +390,7 @@ def fetch_file(url, project=None, release=None, dist=None, allow_scraping=True):
     # if we've got a release to look on, try that first (incl associated cache)
     if release:
         with metrics.timer("sourcemaps.release_file"):
-            result = fetch_release_file(url, release, dist)
+            result = fetch_release_file(url, release, dist, prefetched=prefetched_release_file)
     else:
         result = None
 
@@ -351,7 +429,13 @@ def fetch_file(url, project=None, release=None, dist=None, allow_scraping=True):
                 headers[token_header] = token
 
         with metrics.timer("sourcemaps.fetch"):
-            result = http.fetch_file(url, headers=headers, verify_ssl=verify_ssl)
+            if domain_lock is not None:
+                domain_lock.acquire()
+            try:
+                result = http.fetch_file(url, headers=headers, verify_ssl=verify_ssl)
+            finally:
+                if domain_lock is not None:
+                    domain_lock.release()
             z_body = zlib.compress(result.body)
             cache.set(
                 cache_key,
@@ -418,7 +502,7 @@ def get_max_age(headers):
     return min(max_age, CACHE_CONTROL_MAX)
 
 
-def fetch_sourcemap(url, project=None, release=None, dist=None, allow_scraping=True):
+def fetch_sourcemap(url, project=None, release=None, dist=None, allow_scraping=True, **kwargs):
     if is_data_uri(url):
         try:
             body = base64.b64decode(
@@ -430,11 +514,16 @@ def fetch_sourcemap(url, project=None, release=None, dist=None, allow_scraping=T
     else:
         # look in the database and, if not found, optionally try to scrape the web
         result = fetch_file(
-            url, project=project, release=release, dist=dist, allow_scraping=allow_scraping
+            url,
+            project=project,
+            release=release,
+            dist=dist,
+            allow_scraping=allow_scraping,
+            **kwargs
         )
         body = result.body
     try:
-        return SourceMapView.from_json_bytes(body)
+        return get_cached_view("sourcemap", body, SourceMapView.from_json_bytes)
     except Exception as exc:
         # This is in debug because the product shows an error already.
         logger.debug(six.text_type(exc), exc_info=True)
@@ -805,78 +894,140 @@ class JavaScriptStacktraceProcessor(StacktraceProcessor):
         Look for and (if found) cache a source file and its associated source
         map (if any).
         """
+        self.cache_sources([filename])
+
+    def cache_sources(self, filenames):
+        """
+        Look for and (if found) cache source files and their associated source
+        maps (if any). Files and then source maps are fetched concurrently.
+        """
 
         sourcemaps = self.sourcemaps
         cache = self.cache
 
-        self.fetch_count += 1
+        pending_file_list = []
+        for filename in filenames:
+            self.fetch_count += 1
 
-        if self.fetch_count > self.max_fetches:
-            cache.add_error(filename, {"type": EventError.JS_TOO_MANY_REMOTE_SOURCES})
-            return
+            if self.fetch_count > self.max_fetches:
+                cache.add_error(filename, {"type": EventError.JS_TOO_MANY_REMOTE_SOURCES})
+            else:
+                pending_file_list.append(filename)
+
+        # maps the url of each pending sourcemap to the files that reference it
+        pending_sourcemaps = OrderedDict()
 
         # TODO: respect cache-control/max-age headers to some extent
-        logger.debug("Attempting to cache source %r", filename)
-        try:
-            # this both looks in the database and tries to scrape the internet
-            result = fetch_file(
-                filename,
-                project=self.project,
-                release=self.release,
-                dist=self.dist,
-                allow_scraping=self.allow_scraping,
+        for filename, result in self.fetch_files(fetch_file, pending_file_list):
+            if isinstance(result, http.BadSource):
+                # most people don't upload release artifacts for their third-party libraries,
+                # so ignore missing node_modules files
+                if (
+                    result.data["type"] == EventError.JS_MISSING_SOURCE
+                    and "node_modules" in filename
+                ):
+                    pass
+                else:
+                    cache.add_error(filename, result.data)
+
+                # either way, there's no more for us to do here, since we don't have
+                # a valid file to cache
+                continue
+
+            cache.add(filename, result.body, result.encoding)
+            cache.alias(result.url, filename)
+
+            sourcemap_url = discover_sourcemap(result)
+            if not sourcemap_url:
+                continue
+
+            logger.debug(
+                "Found sourcemap URL %r for minified script %r", sourcemap_url[:256], result.url
             )
-        except http.BadSource as exc:
-            # most people don't upload release artifacts for their third-party libraries,
-            # so ignore missing node_modules files
-            if exc.data["type"] == EventError.JS_MISSING_SOURCE and "node_modules" in filename:
-                pass
-            else:
-                cache.add_error(filename, exc.data)
+            sourcemaps.link(filename, sourcemap_url)
+            if sourcemap_url not in sourcemaps:
+                pending_sourcemaps.setdefault(sourcemap_url, []).append(filename)
+
+        # pull down sourcemaps
+        for sourcemap_url, sourcemap_view in self.fetch_files(fetch_sourcemap, pending_sourcemaps):
+            if isinstance(sourcemap_view, http.BadSource):
+                # we don't perform the same check here as above, because if someone has
+                # uploaded a node_modules file, which has a sourceMappingURL, they
+                # presumably would like it mapped (and would like to know why it's not
+                # working, if that's the case). If they're not looking for it to be
+                # mapped, then they shouldn't be uploading the source file in the
+                # first place.
+                for filename in pending_sourcemaps[sourcemap_url]:
+                    cache.add_error(filename, sourcemap_view.data)
+                continue
 
-            # either way, there's no more for us to do here, since we don't have
-            # a valid file to cache
-            return
-        cache.add(filename, result.body, result.encoding)
-        cache.alias(result.url, filename)
+            sourcemaps.add(sourcemap_url, sourcemap_view)
 
-        sourcemap_url = discover_sourcemap(result)
-        if not sourcemap_url:
-            return
+            # cache any inlined sources
+            for src_id, source_name in sourcemap_view.iter_sources():
+                source_view = sourcemap_view.get_sourceview(src_id)
+                if source_view is not None:
+                    self.cache.add(non_standard_url_join(sourcemap_url, source_name), source_view)
 
-        logger.debug(
-            "Found sourcemap URL %r for minified script %r", sourcemap_url[:256], result.url
-        )
-        sourcemaps.link(filename, sourcemap_url)
-        if sourcemap_url in sourcemaps:
+    def fetch_files(self, fetch_func, urls):
+        """
+        Calls ``fetch_func`` (``fetch_file`` or ``fetch_sourcemap``) for all
+        ``urls`` and yields ``(url, result)`` pairs in order, where the result
+        is the raised ``BadSource`` if the fetch failed.
+
+        The release artifacts of all urls are looked up with a single query
+        up front, and the fetches themselves run on up to
+        ``SENTRY_JS_FETCH_CONCURRENCY`` threads, with at most
+        ``MAX_CONCURRENT_FETCHES_PER_DOMAIN`` of them scraping the same domain.
+        """
+        urls = list(urls)
+        if not urls:
             return
 
-        # pull down sourcemap
-        try:
-            sourcemap_view = fetch_sourcemap(
-                sourcemap_url,
-                project=self.project,
-                release=self.release,
-                dist=self.dist,
-                allow_scraping=self.allow_scraping,
+        release_files = {}
+        if self.release:
+            release_files = prefetch_release_files(
+                [url for url in urls if not is_data_uri(url)], self.release, self.dist
             )
-        except http.BadSource as exc:
-            # we don't perform the same check here as above, because if someone has
-            # uploaded a node_modules file, which has a sourceMappingURL, they
-            # presumably would like it mapped (and would like to know why it's not
-            # working, if that's the case). If they're not looking for it to be
-            # mapped, then they shouldn't be uploading the source file in the
-            # first place.
-            cache.add_error(filename, exc.data)
-            return
 
-        sourcemaps.add(sourcemap_url, sourcemap_view)
+        domain_locks = defaultdict(
+            lambda: threading.BoundedSemaphore(MAX_CONCURRENT_FETCHES_PER_DOMAIN)
+        )
+        for url in urls:
+            if not is_data_uri(url):
+                domain_locks[urlsplit(url).netloc]
+
+        def fetch(url):
+            try:
+                return fetch_func(
+                    url,
+                    project=self.project,
+                    release=self.release,
+                    dist=self.dist,
+                    allow_scraping=self.allow_scraping,
+                    prefetched_release_file=release_files.get(url),
+                    domain_lock=domain_locks.get(urlsplit(url).netloc),
+                )
+            except http.BadSource as exc:
+                return exc
+
+        def fetch_in_thread(url):
+            try:
+                return fetch(url)
+            finally:
+                # Reading release artifacts can open database connections,
+                # which are local to this thread and would leak otherwise.
+                connections.close_all()
+
+        max_workers = min(settings.SENTRY_JS_FETCH_CONCURRENCY, len(urls))
+        if max_workers <= 1:
+            results = [fetch(url) for url in urls]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(fetch_in_thread, urls))
 
-        # cache any inlined sources
-        for src_id, source_name in sourcemap_view.iter_sources():
-            source_view = sourcemap_view.get_sourceview(src_id)
-            if source_view is not None:
-                self.cache.add(non_standard_url_join(sourcemap_url, source_name), source_view)
+        for url, result in zip(urls, results):
+            yield url, result
 
     def populate_source_cache(self, frames):
         """
@@ -899,8 +1050,7 @@ class JavaScriptStacktraceProcessor(StacktraceProcessor):
                 continue
             pending_file_list.add(f["abs_path"])
 
-        for idx, filename in enumerate(pending_file_list):
-            self.cache_source(filename=filename)
+        self.cache_sources(pending_file_list)
 
     def close(self):
         StacktraceProcessor.close(self)
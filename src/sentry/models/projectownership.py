@@ -10,12 +10,17 @@ from django.utils import timezone
 
 from sentry.db.models import Model, sane_repr
 from sentry.db.models.fields import FlexibleForeignKey, JSONField
-from sentry.ownership.grammar import load_schema
+from sentry.ownership.grammar import CompiledRules, load_schema
 from sentry.utils.cache import cache
+from sentry.utils.datastructures import LRUCache
 from functools import reduce
 
 READ_CACHE_DURATION = 3600
 
+# Compiled rules by project and version of the ownership, shared by all
+# events that are processed in this process.
+_compiled_rules_cache = LRUCache(max_size=500)
+
 
 class ProjectOwnership(Model):
     __core__ = True
@@ -127,14 +132,23 @@ class ProjectOwnership(Model):
         return actors[0].resolve()
 
     @classmethod
-    def _matching_ownership_rules(cls, ownership, project_id, data):
-        rules = []
-        if ownership.schema is not None:
-            for rule in load_schema(ownership.schema):
-                if rule.test(data):
-                    rules.append(rule)
+    def get_compiled_rules(cls, ownership):
+        """
+        Returns the compiled rules of an ownership. They are cached by
+        ``last_updated``, which changes along with the rules.
+        """
+        cache_key = (ownership.project_id, ownership.last_updated)
+        compiled = _compiled_rules_cache.get(cache_key)
+        if compiled is None:
+            compiled = CompiledRules(load_schema(ownership.schema))
+            _compiled_rules_cache.set(cache_key, compiled)
+        return compiled
 
-        return rules
+    @classmethod
+    def _matching_ownership_rules(cls, ownership, project_id, data):
+        if ownership.schema is None:
+            return []
+        return cls.get_compiled_rules(ownership).get_matching_rules(data)
 
 
 def resolve_actors(owners, project_id):
@@ -2,15 +2,51 @@ from __future__ import absolute_import
 
 import six
 
+import threading
+import time
+
 from base64 import b64encode
 from threading import local
 from uuid import uuid4
 
+from django.conf import settings
 from django.core.cache import caches, InvalidCacheBackendError
 
+from sentry.utils import json, metrics
 from sentry.utils.cache import memoize
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.services import Service
 
+# Marks ids in the local cache that are known to be deleted (this is never
+# valid JSON.)
+_DELETED = "-"
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache():
+    """
+    Returns the process-local cache shared by all node storage instances (and
+    threads), or ``None`` if it is disabled. Data is kept serialized, so that
+    callers never share (and mutate) cached values. Entries are stored as
+    ``(expires_at, value)`` and expire after
+    ``SENTRY_NODESTORE_LOCAL_CACHE_TTL`` seconds.
+    """
+    global _local_cache
+    if (
+        _local_cache is None
+        and settings.SENTRY_NODESTORE_LOCAL_CACHE_SIZE > 0
+        and settings.SENTRY_NODESTORE_LOCAL_CACHE_TTL > 0
+    ):
+        with _local_cache_lock:
+            if _local_cache is None:
+                _local_cache = LRUCache(
+                    max_size=settings.SENTRY_NODESTORE_LOCAL_CACHE_SIZE,
+                    get_size=lambda item: len(item[1]),
+                )
+    return _local_cache
+
 
 class NodeStorage(local, Service):
     __all__ = (
@@ -99,31 +135,79 @@ class NodeStorage(local, Service):
         raise NotImplementedError
 
     def _get_cache_item(self, id):
-        if self.cache:
-            return self.cache.get(id)
+        return self._get_cache_items([id]).get(id)
 
     def _get_cache_items(self, id_list):
+        """
+        Returns the cached data of the given ids. Ids that are known to be
+        deleted map to ``None``.
+        """
+        rv = {}
+
+        local_cache = self.local_cache
+        if local_cache is not None:
+            now = time.time()
+            for id in id_list:
+                item = local_cache.get(id)
+                if item is None:
+                    continue
+                expires_at, value = item
+                if expires_at > now:
+                    rv[id] = json.loads(value) if value != _DELETED else None
+                else:
+                    local_cache.delete(id)
+
+            if rv:
+                metrics.incr("nodestore.local_cache", amount=len(rv), tags={"result": "hit"})
+            if len(rv) < len(id_list):
+                metrics.incr(
+                    "nodestore.local_cache", amount=len(id_list) - len(rv), tags={"result": "miss"}
+                )
+
         if self.cache:
-            return self.cache.get_many(id_list)
-        return {}
+            uncached_ids = [id for id in id_list if id not in rv]
+            if uncached_ids:
+                items = self.cache.get_many(uncached_ids)
+                self._set_local_cache_items(items)
+                rv.update(items)
+
+        return rv
 
     def _set_cache_item(self, id, data):
-        if self.cache and data:
-            self.cache.set(id, data)
+        self._set_cache_items({id: data})
 
     def _set_cache_items(self, items):
         cacheable_items = {k: v for k, v in six.iteritems(items) if v}
-        if self.cache:
+        self._set_local_cache_items(cacheable_items)
+        if self.cache and cacheable_items:
             self.cache.set_many(cacheable_items)
 
     def _delete_cache_item(self, id):
-        if self.cache:
-            self.cache.delete(id)
+        self._delete_cache_items([id])
 
     def _delete_cache_items(self, id_list):
+        self._set_local_cache_items({id: _DELETED for id in id_list})
         if self.cache:
             self.cache.delete_many(id_list)
 
+    def _set_local_cache_items(self, items):
+        local_cache = self.local_cache
+        if local_cache is None:
+            return
+
+        expires_at = time.time() + settings.SENTRY_NODESTORE_LOCAL_CACHE_TTL
+        evicted = 0
+        for id, data in six.iteritems(items):
+            value = _DELETED if data is _DELETED else json.dumps(data)
+            evicted += local_cache.set(id, (expires_at, value))
+
+        if evicted:
+            metrics.incr("nodestore.local_cache.evictions", amount=evicted)
+
+    @property
+    def local_cache(self):
+        return get_local_cache()
+
     @memoize
     def cache(self):
         try:
@@ -99,9 +99,9 @@ class BigtableNodeStorage(NodeStorage):
         return get_connection(self.project, self.instance, self.table, self.options)
 
     def get(self, id):
-        item_from_cache = self._get_cache_item(id)
-        if item_from_cache:
-            return item_from_cache
+        cache_items = self._get_cache_items([id])
+        if id in cache_items:
+            return cache_items[id]
 
         data = self.decode_row(self.connection.read_row(id))
         self._set_cache_item(id, data)
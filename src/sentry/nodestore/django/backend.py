@@ -1,24 +1,47 @@
 from __future__ import absolute_import
 
 import math
+import six
 
+from django.db import connections, router
 from django.utils import timezone
 
-from sentry.db.models import create_or_update
+from sentry.exceptions import InvalidConfiguration
 from sentry.nodestore.base import NodeStorage
+from sentry.utils import strings
+from sentry.utils.compat import pickle
 
 from .models import Node
 
 
 class DjangoNodeStorage(NodeStorage):
+    """
+    Stores nodes in the ``nodestore_node`` table (PostgreSQL.)
+
+    Node data is pickled and compressed with zlib, or with zstd if
+    ``compression`` is set to ``"zstd"`` (requires the ``zstandard``
+    package.) Rows written with either compression can always be read.
+
+    >>> DjangoNodeStorage(compression="zstd")
+    """
+
+    def __init__(self, compression=None):
+        self.compression = compression
+
+    def validate(self):
+        if self.compression not in (None, "zstd"):
+            raise InvalidConfiguration("Unknown compression: %r" % (self.compression,))
+        if self.compression == "zstd" and strings.zstandard is None:
+            raise InvalidConfiguration("zstd compression requires the zstandard package")
+
     def delete(self, id):
         Node.objects.filter(id=id).delete()
         self._delete_cache_item(id)
 
     def get(self, id):
-        item_from_cache = self._get_cache_item(id)
-        if item_from_cache:
-            return item_from_cache
+        cache_items = self._get_cache_items([id])
+        if id in cache_items:
+            return cache_items[id]
         try:
             data = Node.objects.get(id=id).data
             self._set_cache_item(id, data)
@@ -28,13 +51,15 @@ class DjangoNodeStorage(NodeStorage):
 
     def get_multi(self, id_list):
         cache_items = self._get_cache_items(id_list)
+        # Deleted nodes are omitted, just like missing rows.
+        items = {id: data for id, data in six.iteritems(cache_items) if data is not None}
         if len(cache_items) == len(id_list):
-            return cache_items
+            return items
 
         uncached_ids = [id for id in id_list if id not in cache_items]
-        items = {n.id: n.data for n in Node.objects.filter(id__in=uncached_ids)}
-        self._set_cache_items(items)
-        items.update(cache_items)
+        nodes = {n.id: n.data for n in Node.objects.filter(id__in=uncached_ids)}
+        self._set_cache_items(nodes)
+        items.update(nodes)
         return items
 
     def delete_multi(self, id_list):
@@ -42,8 +67,34 @@ class DjangoNodeStorage(NodeStorage):
         self._delete_cache_items(id_list)
 
     def set(self, id, data, ttl=None):
-        create_or_update(Node, id=id, values={"data": data, "timestamp": timezone.now()})
-        self._set_cache_item(id, data)
+        self.set_multi({id: data})
+
+    def set_multi(self, values):
+        """
+        Inserts or updates all nodes with a single statement.
+        """
+        if not values:
+            return
+
+        timestamp = timezone.now()
+        zstd = self.compression == "zstd"
+        params = []
+        for id, data in six.iteritems(values):
+            params.extend((id, strings.compress(pickle.dumps(data), zstd=zstd), timestamp))
+
+        connection = connections[router.db_for_write(Node)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                u"INSERT INTO {table} (id, data, timestamp) VALUES {values} "
+                u"ON CONFLICT (id) DO UPDATE "
+                u"SET data = EXCLUDED.data, timestamp = EXCLUDED.timestamp".format(
+                    table=connection.ops.quote_name(Node._meta.db_table),
+                    values=u", ".join([u"(%s, %s, %s)"] * len(values)),
+                ),
+                params,
+            )
+
+        self._set_cache_items(values)
 
     def cleanup(self, cutoff_timestamp):
         from sentry.db.deletion import BulkDeleteQuery
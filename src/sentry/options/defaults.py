@@ -181,6 +181,10 @@ register("snuba.track-outcomes-sample-rate", default=0.0)
 # The percentage of tagkeys that we want to cache. Set to 1.0 in order to cache everything, <=0.0 to stop caching
 register("snuba.tagstore.cache-tagkeys-rate", default=0.0, flags=FLAG_PRIORITIZE_DISK)
 
+# Count events per group in Redis at ingest and answer event frequency
+# conditions from these counters instead of tsdb where possible.
+register("rules.event-frequency-counter", default=False, flags=FLAG_PRIORITIZE_DISK)
+
 # Kafka Publisher
 register("kafka-publisher.raw-event-sample-rate", default=0.0)
 register("kafka-publisher.max-event-size", default=100000)
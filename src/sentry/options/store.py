@@ -2,6 +2,7 @@ from __future__ import absolute_import, print_function
 
 import logging
 import six
+import threading
 
 from collections import namedtuple
 from time import time
@@ -16,6 +17,7 @@ Key = namedtuple("Key", ("name", "default", "type", "flags", "ttl", "grace", "ca
 
 CACHE_FETCH_ERR = "Unable to fetch option cache for %s"
 CACHE_UPDATE_ERR = "Unable to update option cache for %s"
+SNAPSHOT_REFRESH_ERR = "Unable to refresh options snapshot"
 
 logger = logging.getLogger("sentry")
 
@@ -39,11 +41,22 @@ class OptionsStore(object):
     to the right place. If using the OptionsStore directly, it's your
     job to do validation of the data. You should probably go through
     OptionsManager instead, unless you need raw access to something.
+
+    When ``snapshot_interval`` is set, every option that has been read with a
+    ``ttl`` is kept in an in-process snapshot, which is reloaded with a single
+    bulk fetch from the cache and the database about every
+    ``snapshot_interval`` seconds (with jitter, so that processes don't all
+    refresh at once). Values are served from the snapshot until they are
+    older than their ``ttl`` and ``grace``, and only then fall back to
+    fetching the single key.
     """
 
-    def __init__(self, cache=None, ttl=None):
+    def __init__(self, cache=None, ttl=None, snapshot_interval=0):
         self.cache = cache
         self.ttl = ttl
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_keys = {}
+        self._snapshot_lock = threading.Lock()
         self.flush_local_cache()
 
     @cached_property
@@ -59,6 +72,11 @@ class OptionsStore(object):
         """
         Fetches a value from the options store.
         """
+        if self.snapshot_interval > 0 and key.ttl > 0:
+            found, result = self.get_snapshot(key)
+            if found:
+                return result
+
         result = self.get_cache(key, silent=silent)
         if result is not None:
             return result
@@ -71,6 +89,110 @@ class OptionsStore(object):
         # in local cache that's possibly stale
         return self.get_local_cache(key, force_grace=True)
 
+    def get_snapshot(self, key):
+        """
+        Attempt to fetch a key out of the snapshot, refreshing the snapshot
+        first if it is due. Returns a tuple of whether the key was found and
+        its value, which is ``None`` for options that are not set.
+        """
+        if key.name not in self._snapshot_keys:
+            self._snapshot_keys[key.name] = key
+
+        self.maybe_refresh_snapshot()
+
+        try:
+            value, refreshed_at = self._snapshot[key.name]
+        except KeyError:
+            return False, None
+
+        if time() - refreshed_at > key.ttl + key.grace:
+            return False, None
+        return True, value
+
+    def maybe_refresh_snapshot(self, **kwargs):
+        if self.snapshot_interval <= 0 or time() < self._snapshot_next_refresh:
+            return
+
+        # Only one thread refreshes, all others keep using the current
+        # snapshot in the meantime.
+        if not self._snapshot_lock.acquire(False):
+            return
+        try:
+            if time() < self._snapshot_next_refresh:
+                return
+            self.refresh_snapshot()
+        finally:
+            self._snapshot_lock.release()
+
+    def refresh_snapshot(self):
+        """
+        Reload all options of the snapshot, first from the network cache
+        and then from the database for options missing from the cache.
+        Options that fail to load keep their previous value.
+        """
+        from sentry.utils import metrics
+
+        self._snapshot_next_refresh = time() + self.snapshot_interval * (0.5 + random())
+
+        keys = list(dict(self._snapshot_keys).values())
+        if not keys:
+            return
+
+        snapshot = dict(self._snapshot)
+        cached = {}
+        missing = keys
+        with metrics.timer("options.snapshot.refresh"):
+            if self.cache is not None:
+                try:
+                    cached = self.cache.get_many([key.cache_key for key in keys])
+                except Exception:
+                    logger.warn(SNAPSHOT_REFRESH_ERR, exc_info=True)
+                missing = [key for key in keys if cached.get(key.cache_key) is None]
+
+            stored = {}
+            if missing:
+                try:
+                    stored = dict(
+                        self.model.objects.filter(
+                            key__in=[key.name for key in missing]
+                        ).values_list("key", "value")
+                    )
+                except Exception:
+                    logger.warn(SNAPSHOT_REFRESH_ERR, exc_info=True)
+                    missing = []
+                else:
+                    self._set_cache_many(
+                        {key: stored[key.name] for key in missing if key.name in stored}
+                    )
+
+        now = time()
+        hits = 0
+        for key in keys:
+            if cached.get(key.cache_key) is not None:
+                snapshot[key.name] = (cached[key.cache_key], now)
+                hits += 1
+        for key in missing:
+            snapshot[key.name] = (stored.get(key.name), now)
+
+        metrics.timing("options.snapshot.size", len(keys))
+        metrics.incr("options.snapshot.failed", amount=len(keys) - hits - len(missing))
+        if self._snapshot_refreshed_at is not None:
+            # the longest time the previous snapshot has been served for
+            metrics.timing("options.snapshot.age", now - self._snapshot_refreshed_at)
+
+        self._snapshot = snapshot
+        self._snapshot_refreshed_at = now
+
+    def _set_cache_many(self, values):
+        if self.cache is None or not values:
+            return
+        try:
+            self.cache.set_many(
+                {key.cache_key: value for key, value in six.iteritems(values)}, self.ttl
+            )
+        except Exception:
+            logger.warn(SNAPSHOT_REFRESH_ERR, exc_info=True)
+
     def get_cache(self, key, silent=False):
         """
         First check against our local in-process cache, falling
@@ -200,6 +322,8 @@ class OptionsStore(object):
 
         if key.ttl > 0:
             self._local_cache[cache_key] = _make_cache_value(key, value)
+            if key.name in self._snapshot_keys:
+                self._snapshot[key.name] = (value, time())
 
         try:
             self.cache.set(cache_key, value, self.ttl)
@@ -230,6 +354,9 @@ class OptionsStore(object):
         except KeyError:
             pass
 
+        if key.name in self._snapshot_keys:
+            self._snapshot[key.name] = (None, time())
+
         try:
             self.cache.delete(cache_key)
             return True
@@ -267,9 +394,12 @@ class OptionsStore(object):
 
     def flush_local_cache(self):
         """
-        Empty store's local in-process cache.
+        Empty store's local in-process cache and snapshot.
         """
         self._local_cache = {}
+        self._snapshot = {}
+        self._snapshot_refreshed_at = None
+        self._snapshot_next_refresh = 0
 
     def maybe_clean_local_cache(self, **kwargs):
         # Periodically force an expire on the local cache.
@@ -284,8 +414,12 @@ class OptionsStore(object):
             self.clean_local_cache()
 
     def connect_signals(self):
-        from celery.signals import task_postrun
-        from django.core.signals import request_finished
+        from celery.signals import task_postrun, task_prerun
+        from django.core.signals import request_finished, request_started
 
         task_postrun.connect(self.maybe_clean_local_cache)
         request_finished.connect(self.maybe_clean_local_cache)
+        # Refresh the snapshot before work starts, rather than while it is
+        # being read.
+        task_prerun.connect(self.maybe_refresh_snapshot)
+        request_started.connect(self.maybe_refresh_snapshot)
@@ -1,15 +1,23 @@
 from __future__ import absolute_import
 
+import bisect
+import six
+
 from collections import namedtuple
 from parsimonious.grammar import Grammar, NodeVisitor
 from parsimonious.exceptions import ParseError  # noqa
 from sentry.utils.safe import get_path
 from sentry.utils.glob import glob_match
 
-__all__ = ("parse_rules", "dump_schema", "load_schema")
+__all__ = ("parse_rules", "dump_schema", "load_schema", "CompiledRules")
 
 VERSION = 1
 
+# Characters that have a special meaning in glob patterns.  Everything outside
+# of these is matched literally, which lets us reject most values with a cheap
+# prefix/suffix check before calling into the glob matcher.
+GLOB_SPECIAL_CHARS = frozenset("*?[]{}!\\")
+
 # Grammar is defined in EBNF syntax.
 ownership_grammar = Grammar(
     r"""
@@ -217,6 +225,140 @@ def _iter_frames(data):
             continue
 
 
+def _literal_affixes(pattern, ignorecase):
+    """
+    Returns the literal prefix and suffix of a glob pattern.  A value can only
+    match the pattern if it starts with the prefix and ends with the suffix.
+    """
+    special = [idx for idx, char in enumerate(pattern) if char in GLOB_SPECIAL_CHARS]
+    if ignorecase:
+        # Only ASCII characters are guaranteed to fold the same way here and
+        # in the glob matcher.
+        special.extend(idx for idx, char in enumerate(pattern) if ord(char) > 127)
+        pattern = pattern.lower()
+    if not special:
+        return pattern, pattern
+    suffix = pattern[max(special) + 1 :]
+    # ``**/`` also matches no directory at all (``**/foo.py`` matches
+    # ``foo.py``), so the slash is not part of the suffix.
+    if pattern[max(special)] == "*" and suffix.startswith("/"):
+        suffix = suffix[1:]
+    return pattern[: min(special)], suffix
+
+
+class PatternIndex(object):
+    """
+    The patterns of all matchers of one type, indexed by their literal
+    prefix.  Every distinct pattern is tested at most once per event, and only
+    against values that start and end with its literal affixes.
+    """
+
+    def __init__(self, ignorecase=False, path_normalize=False):
+        self.ignorecase = ignorecase
+        self.path_normalize = path_normalize
+        self.by_pattern = {}
+        self.by_prefix = {}
+        self.prefix_lengths = []
+
+    def add(self, pattern, rule_index):
+        entry = self.by_pattern.get(pattern)
+        if entry is None:
+            prefix, suffix = _literal_affixes(pattern, self.ignorecase)
+            entry = self.by_pattern[pattern] = (pattern, suffix, [])
+            self.by_prefix.setdefault(prefix, []).append(entry)
+            if len(prefix) not in self.prefix_lengths:
+                bisect.insort(self.prefix_lengths, len(prefix))
+        entry[2].append(rule_index)
+
+    def normalize(self, value):
+        if self.path_normalize:
+            value = value.replace("\\", "/")
+        if self.ignorecase:
+            value = value.lower()
+        return value
+
+    def match(self, values):
+        """
+        Returns the indexes of all rules with a pattern that matches at least
+        one of ``values``.
+        """
+        matched = set()
+        matched_patterns = set()
+        for value in values:
+            normalized = self.normalize(value)
+            for length in self.prefix_lengths:
+                if length > len(normalized):
+                    break
+                for pattern, suffix, rule_indexes in self.by_prefix.get(normalized[:length], ()):
+                    if pattern in matched_patterns or not normalized.endswith(suffix):
+                        continue
+                    if glob_match(
+                        value,
+                        pattern,
+                        ignorecase=self.ignorecase,
+                        path_normalize=self.path_normalize,
+                    ):
+                        matched_patterns.add(pattern)
+                        matched.update(rule_indexes)
+        return matched
+
+
+class CompiledRules(object):
+    """
+    Matches a list of rules against events all at once.  This returns the
+    same rules as calling ``Rule.test`` for every rule, but the values of the
+    event (file names, the URL and tags) are collected and deduplicated once
+    and every pattern is only tested against values that can match it.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.paths = PatternIndex(ignorecase=True, path_normalize=True)
+        self.urls = PatternIndex(ignorecase=True)
+        self.tags = {}
+
+        for index, rule in enumerate(rules):
+            matcher = rule.matcher
+            if matcher.type == "path":
+                self.paths.add(matcher.pattern, index)
+            elif matcher.type == "url":
+                self.urls.add(matcher.pattern, index)
+            elif matcher.type.startswith("tags."):
+                tag_index = self.tags.get(matcher.type[5:])
+                if tag_index is None:
+                    tag_index = self.tags[matcher.type[5:]] = PatternIndex()
+                tag_index.add(matcher.pattern, index)
+
+    def get_matching_rules(self, data):
+        matched = set()
+
+        if self.paths.by_pattern:
+            filenames = set()
+            for frame in _iter_frames(data):
+                filename = frame.get("filename") or frame.get("abs_path")
+                if filename:
+                    filenames.add(filename)
+            matched.update(self.paths.match(filenames))
+
+        if self.urls.by_pattern:
+            try:
+                url = data["request"]["url"]
+            except (KeyError, TypeError):
+                url = None
+            if url:
+                matched.update(self.urls.match([url]))
+
+        if self.tags:
+            values_by_tag = {}
+            for k, v in get_path(data, "tags", filter=True) or ():
+                if k in self.tags and v is not None:
+                    values_by_tag.setdefault(k, set()).add(v)
+            for k, values in six.iteritems(values_by_tag):
+                matched.update(self.tags[k].match(values))
+
+        return [self.rules[index] for index in sorted(matched)]
+
+
 def parse_rules(data):
     """Convert a raw text input into a Rule tree"""
     tree = ownership_grammar.parse(data)
@@ -4,7 +4,7 @@ from sentry.utils.services import Service
 
 
 class ProjectConfigCache(Service):
-    __all__ = ("set_many", "delete_many", "get")
+    __all__ = ("set_many", "delete_many", "get", "get_many")
 
     def __init__(self, **options):
         pass
@@ -17,3 +17,10 @@ class ProjectConfigCache(Service):
 
     def get(self, project_id):
         raise NotImplementedError()
+
+    def get_many(self, project_ids):
+        """
+        Returns the cached configs keyed by the text form of the given keys.
+        Keys that are not cached are left out.
+        """
+        return {}
@@ -1,20 +1,53 @@
 from __future__ import absolute_import
 
+import logging
+import os
 import six
+import threading
+import time
 
 from sentry.relay.projectconfig_cache.base import ProjectConfigCache
-from sentry.utils import json
+from sentry.utils import json, metrics
+from sentry.utils.compat import zip
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.redis import get_dynamic_cluster_from_options, validate_dynamic_cluster
 
 
+logger = logging.getLogger(__name__)
+
 REDIS_CACHE_TIMEOUT = 3600  # 1 hr
 
+# Channel on which changed keys are published, so that all processes can
+# evict them from their local cache.
+INVALIDATION_CHANNEL = "relayconfig:invalidate"
+
 
 class RedisProjectConfigCache(ProjectConfigCache):
+    """
+    Project configs stored in Redis, with a process-local LRU cache in front.
+
+    Entries of the local cache expire after ``local_cache_ttl`` seconds.
+    Keys written through ``set_many`` and ``delete_many`` are additionally
+    published on an invalidation channel and evicted from the local cache of
+    every subscribed process right away, so the TTL only bounds staleness
+    when invalidations are lost. Setting ``local_cache_size`` to ``0``
+    disables the local cache.
+
+    Configs returned from the local cache are shared and must not be mutated.
+    """
+
     def __init__(self, **options):
         self.is_redis_cluster, self.cluster, options = get_dynamic_cluster_from_options(
             "SENTRY_RELAY_PROJECTCONFIG_CACHE_OPTIONS", options
         )
+        self.local_cache_ttl = options.pop("local_cache_ttl", 10)
+        local_cache_size = options.pop("local_cache_size", 10000)
+        if local_cache_size > 0 and self.local_cache_ttl > 0:
+            self.local_cache = LRUCache(max_size=local_cache_size)
+        else:
+            self.local_cache = None
+        self.__listener_pid = None
+        self.__listener_lock = threading.Lock()
         super(RedisProjectConfigCache, self).__init__(**options)
 
     def validate(self):
@@ -29,6 +62,53 @@ class RedisProjectConfigCache(ProjectConfigCache):
         else:
             return self.cluster.get_local_client_for_key(routing_key)
 
+    def __ensure_listener(self):
+        # The listener thread does not survive forking, so every process
+        # starts its own.
+        pid = os.getpid()
+        if self.__listener_pid == pid:
+            return
+        with self.__listener_lock:
+            if self.__listener_pid == pid:
+                return
+            thread = threading.Thread(
+                target=self.__listen, name="relayconfig-invalidation-listener"
+            )
+            thread.daemon = True
+            thread.start()
+            self.__listener_pid = pid
+
+    def __listen(self):
+        while True:
+            try:
+                pubsub = self.__get_redis_client(INVALIDATION_CHANNEL).pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Invalidations published before the subscription was
+                # established have been missed.
+                self.local_cache.clear()
+                for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    for key in json.loads(message["data"]):
+                        self.local_cache.delete(key)
+            except Exception:
+                logger.exception("relayconfig.invalidation_listener.error")
+                self.local_cache.clear()
+                time.sleep(1)
+
+    def __invalidate(self, project_ids):
+        if self.local_cache is None:
+            return
+        keys = [six.text_type(project_id) for project_id in project_ids]
+        for key in keys:
+            self.local_cache.delete(key)
+        if keys:
+            self.__get_redis_client(INVALIDATION_CHANNEL).publish(
+                INVALIDATION_CHANNEL, json.dumps(keys)
+            )
+
     def set_many(self, configs):
         for project_id, config in six.iteritems(configs):
             # XXX(markus): Figure out how to do pipelining here. We may have
@@ -41,7 +121,10 @@ class RedisProjectConfigCache(ProjectConfigCache):
             client = self.__get_redis_client(key)
             client.setex(key, REDIS_CACHE_TIMEOUT, json.dumps(config))
 
+        self.__invalidate(configs)
+
     def delete_many(self, project_ids):
+        project_ids = list(project_ids)
         for project_id in project_ids:
             # XXX(markus): Figure out how to do pipelining here. We may have
             # multiple routing keys (-> multiple clients).
@@ -53,10 +136,57 @@ class RedisProjectConfigCache(ProjectConfigCache):
             client = self.__get_redis_client(key)
             client.delete(key)
 
+        self.__invalidate(project_ids)
+
+    def __get_many_from_redis(self, project_ids):
+        keys = [self.__get_redis_key(project_id) for project_id in project_ids]
+        if self.is_redis_cluster:
+            values = self.cluster.mget(keys)
+        else:
+            # The routing map sends every key to its own host in parallel.
+            with self.cluster.map() as client:
+                promises = [client.get(key) for key in keys]
+            values = [promise.value for promise in promises]
+        return {
+            project_id: json.loads(value) if value is not None else None
+            for project_id, value in zip(project_ids, values)
+        }
+
+    def get_many(self, project_ids):
+        project_ids = [six.text_type(project_id) for project_id in project_ids]
+        rv = {}
+        missing = project_ids
+
+        if self.local_cache is not None:
+            self.__ensure_listener()
+            now = time.time()
+            missing = []
+            for project_id in project_ids:
+                item = self.local_cache.get(project_id)
+                if item is not None and item[0] > now:
+                    rv[project_id] = item[1]
+                else:
+                    missing.append(project_id)
+            metrics.incr(
+                "relay.projectconfig_cache.local",
+                amount=len(project_ids) - len(missing),
+                tags={"result": "hit"},
+            )
+            metrics.incr(
+                "relay.projectconfig_cache.local", amount=len(missing), tags={"result": "miss"}
+            )
+
+        if missing:
+            fetched = self.__get_many_from_redis(missing)
+            if self.local_cache is not None:
+                expires_at = time.time() + self.local_cache_ttl
+                for project_id, config in six.iteritems(fetched):
+                    self.local_cache.set(project_id, (expires_at, config))
+            rv.update(fetched)
+
+        return {
+            project_id: config for project_id, config in six.iteritems(rv) if config is not None
+        }
+
     def get(self, project_id):
-        key = self.__get_redis_key(project_id)
-        client = self.__get_redis_client(key)
-        rv = client.get(key)
-        if rv is not None:
-            return json.loads(rv)
-        return None
+        return self.get_many([project_id]).get(six.text_type(project_id))
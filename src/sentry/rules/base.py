@@ -94,3 +94,6 @@ class EventState(object):
         self.is_regression = is_regression
         self.is_new_group_environment = is_new_group_environment
         self.has_reappeared = has_reappeared
+        # Results of queries shared between the conditions of all rules that
+        # are evaluated for the same event.
+        self.query_cache = {}
@@ -4,12 +4,15 @@ import re
 
 from datetime import timedelta
 from django import forms
+from django.conf import settings
 from django.utils import timezone
 
-from sentry import tsdb
+from sentry import options, tsdb
 from sentry.receivers.rules import DEFAULT_RULE_LABEL
 from sentry.rules.conditions.base import EventCondition
 from sentry.utils import metrics
+from sentry.utils.dates import to_timestamp
+from sentry.utils.redis import redis_clusters
 
 intervals = {
     "1m": ("one minute", timedelta(minutes=1)),
@@ -20,6 +23,92 @@ intervals = {
 }
 
 
+class EventFrequencyCounter(object):
+    """
+    Counts the events of every group (in total and per environment) in fixed
+    windows of each of ``durations`` in Redis.
+
+    The number of events in the sliding window of a duration that ends now is
+    estimated from the current and the previous window, assuming the events
+    of the previous window were evenly spread:
+
+        previous * (1 - elapsed part of the current window) + current
+
+    so a check only reads three keys, regardless of the duration.
+
+    Counts are only returned once counting has been running since the start
+    of the previous window. Every process that counts events refreshes a
+    shared start marker at least every ``heartbeat / 2`` seconds, which
+    expires after ``heartbeat`` seconds. When counting stops, for instance
+    because the option is switched off, the marker expires and counting
+    starts over once it resumes, instead of returning counts that miss the
+    events of the pause.
+    """
+
+    def __init__(self, durations, heartbeat=60):
+        self.durations = sorted(int(duration.total_seconds()) for duration in durations)
+        self.heartbeat = heartbeat
+        self.__last_heartbeat = 0
+
+    def get_client(self):
+        return redis_clusters.get(settings.SENTRY_RULES_FREQUENCY_COUNTER_CLUSTER)
+
+    def get_start_key(self):
+        return u"ef:start"
+
+    def get_key(self, group_id, environment_id, duration, window):
+        return u"ef:{}:{}:{}:{}".format(group_id, environment_id or "", duration, window)
+
+    def incr(self, group_id, environment_id, timestamp):
+        timestamp = to_timestamp(timestamp)
+        now = int(to_timestamp(timezone.now()))
+        with self.get_client().pipeline(transaction=False) as pipe:
+            if now - self.__last_heartbeat >= self.heartbeat // 2:
+                pipe.set(self.get_start_key(), now, nx=True)
+                pipe.expire(self.get_start_key(), self.heartbeat)
+                self.__last_heartbeat = now
+            for duration in self.durations:
+                window = int(timestamp // duration)
+                for env_id in set([None, environment_id]):
+                    key = self.get_key(group_id, env_id, duration, window)
+                    pipe.incr(key)
+                    # windows are read until the end of the next window
+                    pipe.expireat(key, (window + 2) * duration)
+            pipe.execute()
+
+    def get_count(self, group_id, environment_id, duration, now):
+        """
+        Returns the estimated number of events in the ``duration`` before
+        ``now``, or ``None`` if the counter cannot tell yet.
+        """
+        duration = int(duration.total_seconds())
+        now = to_timestamp(now)
+        window = int(now // duration)
+        with self.get_client().pipeline(transaction=False) as pipe:
+            pipe.get(self.get_start_key())
+            pipe.get(self.get_key(group_id, environment_id, duration, window))
+            pipe.get(self.get_key(group_id, environment_id, duration, window - 1))
+            start, current, previous = pipe.execute()
+
+        if start is None or int(start) > (window - 1) * duration:
+            return None
+
+        elapsed = (now - window * duration) / duration
+        return int(int(previous or 0) * (1 - elapsed) + int(current or 0))
+
+
+frequency_counter = EventFrequencyCounter(duration for _, duration in intervals.values())
+
+
+def record_event_frequency(group_id, environment_id, timestamp):
+    """
+    Counts an event towards the frequency counter of its group when it is
+    enabled, which is done at ingest.
+    """
+    if options.get("rules.event-frequency-counter"):
+        frequency_counter.incr(group_id, environment_id, timestamp)
+
+
 class EventFrequencyForm(forms.Form):
     interval = forms.ChoiceField(
         choices=[
@@ -65,7 +154,13 @@ class BaseEventFrequencyCondition(EventCondition):
         if not interval:
             return False
 
-        current_value = self.get_rate(event, interval, self.rule.environment_id)
+        # All rules evaluated for an event share the state, so conditions
+        # that look at the same group and interval only query once.
+        cache_key = (self.id, event.group_id, interval, self.rule.environment_id)
+        current_value = state.query_cache.get(cache_key)
+        if current_value is None:
+            current_value = self.get_rate(event, interval, self.rule.environment_id)
+            state.query_cache[cache_key] = current_value
 
         return current_value > value
 
@@ -105,6 +200,20 @@ class BaseEventFrequencyCondition(EventCondition):
 class EventFrequencyCondition(BaseEventFrequencyCondition):
     label = "The issue is seen more than {value} times in {interval}"
 
+    def get_rate(self, event, interval, environment_id):
+        if options.get("rules.event-frequency-counter"):
+            _, duration = intervals[interval]
+            count = frequency_counter.get_count(
+                event.group_id, environment_id, duration, timezone.now()
+            )
+            metrics.incr(
+                "rules.conditions.frequency_counter",
+                tags={"interval": interval, "result": "miss" if count is None else "hit"},
+            )
+            if count is not None:
+                return count
+        return super(EventFrequencyCondition, self).get_rate(event, interval, environment_id)
+
     def query_hook(self, event, start, end, environment_id):
         return self.tsdb.get_sums(
             model=self.tsdb.models.group,
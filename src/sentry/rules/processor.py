@@ -12,11 +12,34 @@ from random import randrange
 from sentry import analytics
 from sentry.models import GroupRuleStatus, Rule
 from sentry.rules import EventState, rules
-from sentry.utils.hashlib import hash_values
+from sentry.utils import json
+from sentry.utils.datastructures import LRUCache
+from sentry.utils.hashlib import hash_values, md5_text
 from sentry.utils.safe import safe_execute
 
 RuleFuture = namedtuple("RuleFuture", ["rule", "kwargs"])
 
+# The instantiated conditions and filters of a rule, split by type. Every
+# entry is a pair of the condition data and its instance, which is ``None``
+# for unregistered conditions.
+RuleConditions = namedtuple("RuleConditions", ["revision", "conditions", "filters"])
+
+# Rule conditions by rule id, shared by all events processed in this process.
+_rule_conditions_cache = LRUCache(max_size=5000)
+
+
+def get_rule_revision(rule):
+    """
+    Returns a value that changes whenever a change to ``rule`` could change
+    how its conditions are evaluated.
+    """
+    return (
+        rule.environment_id,
+        rule.label,
+        rule.date_added,
+        md5_text(json.dumps(rule.data.get("conditions") or (), sort_keys=True)).hexdigest(),
+    )
+
 
 class RuleProcessor(object):
     logger = logging.getLogger("sentry.rules")
@@ -36,23 +59,75 @@ class RuleProcessor(object):
     def get_rules(self):
         return Rule.get_for_project(self.project.id)
 
+    def get_rule_status_cache_key(self, rule):
+        return "grouprulestatus:1:%s" % hash_values([self.group.id, rule.id])
+
+    def get_rule_statuses(self, rule_list):
+        """
+        Returns the status of every rule for the group of the event, keyed by
+        rule id. Statuses are read from the cache in one request, and the
+        statuses that are not cached are loaded (or created) together.
+        """
+        keys = {rule.id: self.get_rule_status_cache_key(rule) for rule in rule_list}
+        cached = cache.get_many(list(keys.values()))
+        statuses = {rule_id: cached[key] for rule_id, key in six.iteritems(keys) if key in cached}
+
+        missing = [rule for rule in rule_list if rule.id not in statuses]
+        if not missing:
+            return statuses
+
+        for status in GroupRuleStatus.objects.filter(
+            group=self.group, rule__in=[rule.id for rule in missing]
+        ):
+            statuses[status.rule_id] = status
+
+        for rule in missing:
+            if rule.id not in statuses:
+                statuses[rule.id], _ = GroupRuleStatus.objects.get_or_create(
+                    rule=rule, group=self.group, defaults={"project": self.project}
+                )
+
+        cache.set_many({keys[rule.id]: statuses[rule.id] for rule in missing}, 300)
+        return statuses
+
     def get_rule_status(self, rule):
-        key = "grouprulestatus:1:%s" % hash_values([self.group.id, rule.id])
-        rule_status = cache.get(key)
-        if rule_status is None:
-            rule_status, _ = GroupRuleStatus.objects.get_or_create(
-                rule=rule, group=self.group, defaults={"project": self.project}
-            )
-            cache.set(key, rule_status, 300)
-        return rule_status
+        return self.get_rule_statuses([rule])[rule.id]
+
+    def get_rule_conditions(self, rule):
+        """
+        Returns the instantiated conditions and filters of ``rule``. They are
+        cached for as long as the revision of the rule does not change.
+        """
+        revision = get_rule_revision(rule)
+        rule_conditions = _rule_conditions_cache.get(rule.id)
+        if rule_conditions is not None and rule_conditions.revision == revision:
+            return rule_conditions
+
+        rule_conditions = RuleConditions(revision, [], [])
+        for condition in rule.data.get("conditions", ()):
+            condition_cls = rules.get(condition["id"])
+            if condition_cls is None:
+                self.logger.warn("Unregistered condition or filter %r", condition["id"])
+                rule_conditions.filters.append((condition, None))
+                continue
 
-    def condition_matches(self, condition, state, rule):
-        condition_cls = rules.get(condition["id"])
-        if condition_cls is None:
-            self.logger.warn("Unregistered condition %r", condition["id"])
-            return
+            condition_inst = condition_cls(self.project, data=condition, rule=rule)
+            if condition_cls.rule_type == "condition/event":
+                rule_conditions.conditions.append((condition, condition_inst))
+            else:
+                rule_conditions.filters.append((condition, condition_inst))
 
-        condition_inst = condition_cls(self.project, data=condition, rule=rule)
+        _rule_conditions_cache.set(rule.id, rule_conditions)
+        return rule_conditions
+
+    def condition_matches(self, condition, state, rule, condition_inst=None):
+        if condition_inst is None:
+            condition_cls = rules.get(condition["id"])
+            if condition_cls is None:
+                self.logger.warn("Unregistered condition %r", condition["id"])
+                return
+
+            condition_inst = condition_cls(self.project, data=condition, rule=rule)
         return safe_execute(condition_inst.passes, self.event, state, _with_transaction=False)
 
     def get_rule_type(self, condition):
@@ -80,39 +155,26 @@ class RuleProcessor(object):
             return lambda bool_iter: not any(bool_iter)
         return None
 
-    def apply_rule(self, rule):
+    def apply_rule(self, rule, status, state):
         condition_match = rule.data.get("action_match") or Rule.DEFAULT_CONDITION_MATCH
         filter_match = rule.data.get("filter_match") or Rule.DEFAULT_FILTER_MATCH
-        rule_condition_list = rule.data.get("conditions", ())
         frequency = rule.data.get("frequency") or Rule.DEFAULT_FREQUENCY
 
-        if (
-            rule.environment_id is not None
-            and self.event.get_environment().id != rule.environment_id
-        ):
-            return
-
-        status = self.get_rule_status(rule)
-
         now = timezone.now()
         freq_offset = now - timedelta(minutes=frequency)
 
         if status.last_active and status.last_active > freq_offset:
             return
 
-        state = self.get_state()
-
-        condition_list = []
-        filter_list = []
-        for rule_cond in rule_condition_list:
-            if self.get_rule_type(rule_cond) == "condition/event":
-                condition_list.append(rule_cond)
-            else:
-                filter_list.append(rule_cond)
+        rule_conditions = self.get_rule_conditions(rule)
+        condition_list = rule_conditions.conditions
+        filter_list = rule_conditions.filters
 
         # if conditions exist evaluate them, otherwise move to the filters section
         if condition_list:
-            condition_iter = (self.condition_matches(c, state, rule) for c in condition_list)
+            condition_iter = (
+                self.condition_matches(c, state, rule, inst) for c, inst in condition_list
+            )
 
             condition_func = self.get_match_function(condition_match)
             if condition_func:
@@ -128,7 +190,7 @@ class RuleProcessor(object):
 
         # if filters exist evaluate them, otherwise pass
         if filter_list:
-            filter_iter = (self.condition_matches(f, state, rule) for f in filter_list)
+            filter_iter = (self.condition_matches(f, state, rule, inst) for f, inst in filter_list)
             filter_func = self.get_match_function(filter_match)
             if filter_func:
                 passed = filter_func(filter_iter)
@@ -186,6 +248,19 @@ class RuleProcessor(object):
             return six.itervalues({})
 
         self.grouped_futures.clear()
-        for rule in self.get_rules():
-            self.apply_rule(rule)
+
+        rule_list = self.get_rules()
+        if any(rule.environment_id is not None for rule in rule_list):
+            environment_id = self.event.get_environment().id
+            rule_list = [
+                rule
+                for rule in rule_list
+                if rule.environment_id is None or rule.environment_id == environment_id
+            ]
+
+        statuses = self.get_rule_statuses(rule_list)
+        # the state is shared, so that conditions can reuse each other's queries
+        state = self.get_state()
+        for rule in rule_list:
+            self.apply_rule(rule, statuses[rule.id], state)
         return six.itervalues(self.grouped_futures)
@@ -463,6 +463,7 @@ def bind_cache_to_option_store():
     from sentry.options import default_store
 
     default_store.cache = default_cache
+    default_store.snapshot_interval = settings.SENTRY_OPTIONS_SNAPSHOT_INTERVAL
 
 
 def show_big_error(message):
@@ -2,7 +2,9 @@ from __future__ import absolute_import
 
 import six
 import logging
+import time
 from datetime import datetime
+from django.conf import settings
 from django.utils import timezone
 
 from collections import namedtuple, OrderedDict
@@ -10,7 +12,9 @@ from collections import namedtuple, OrderedDict
 import sentry_sdk
 
 from sentry.models import Project, Release
+from sentry.utils import metrics
 from sentry.utils.cache import cache
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.hashlib import hash_values
 from sentry.utils.safe import get_path, safe_execute
 from sentry.stacktraces.functions import set_in_app, trim_function_name
@@ -25,6 +29,72 @@ StacktraceInfo.__hash__ = lambda x: id(x)
 StacktraceInfo.__eq__ = lambda a, b: a is b
 StacktraceInfo.__ne__ = lambda a, b: a is not b
 
+FRAME_CACHE_TIMEOUT = 3600
+
+_local_frame_cache = LRUCache(max_size=settings.SENTRY_FRAME_CACHE_LOCAL_SIZE)
+
+
+class FrameCache(object):
+    """
+    Batched access to the results of frame processors that are cached by
+    ``cache_key``, with a short-lived process-local tier in front of the
+    shared cache for hot frames.
+
+    Values written with ``set`` are buffered until ``flush`` writes them all
+    at once.  Values returned from the local tier are shared between events
+    and must not be mutated.
+    """
+
+    def __init__(self):
+        self.pending = {}
+
+    def get_many(self, keys):
+        rv = {}
+        missing = list(keys)
+
+        ttl = settings.SENTRY_FRAME_CACHE_LOCAL_TTL
+        if ttl > 0:
+            now = time.time()
+            missing = []
+            for key in keys:
+                item = _local_frame_cache.get(key)
+                if item is not None and item[0] > now:
+                    rv[key] = item[1]
+                else:
+                    missing.append(key)
+            metrics.incr(
+                "stacktraces.processing.frame_cache.local", amount=len(rv), tags={"result": "hit"}
+            )
+            metrics.incr(
+                "stacktraces.processing.frame_cache.local",
+                amount=len(missing),
+                tags={"result": "miss"},
+            )
+
+        if missing:
+            fetched = cache.get_many(missing)
+            self._set_local(fetched)
+            rv.update(fetched)
+
+        return rv
+
+    def set(self, key, value):
+        self.pending[key] = value
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        cache.set_many(pending, FRAME_CACHE_TIMEOUT)
+        self._set_local(pending)
+
+    def _set_local(self, values):
+        ttl = settings.SENTRY_FRAME_CACHE_LOCAL_TTL
+        if ttl > 0:
+            expires_at = time.time() + ttl
+            for key, value in six.iteritems(values):
+                _local_frame_cache.set(key, (expires_at, value))
+
 
 class ProcessableFrame(object):
     def __init__(self, frame, idx, processor, stacktrace_info, processable_frames):
@@ -35,6 +105,7 @@ class ProcessableFrame(object):
         self.data = None
         self.cache_key = None
         self.cache_value = None
+        self.frame_cache = None
         self.processable_frames = processable_frames
 
     def __repr__(self):
@@ -69,7 +140,10 @@ class ProcessableFrame(object):
 
     def set_cache_value(self, value):
         if self.cache_key is not None:
-            cache.set(self.cache_key, value, 3600)
+            if self.frame_cache is not None:
+                self.frame_cache.set(self.cache_key, value)
+            else:
+                cache.set(self.cache_key, value, FRAME_CACHE_TIMEOUT)
             return True
         return False
 
@@ -84,9 +158,10 @@ class ProcessableFrame(object):
 
 
 class StacktraceProcessingTask(object):
-    def __init__(self, processable_stacktraces, processors):
+    def __init__(self, processable_stacktraces, processors, frame_cache=None):
         self.processable_stacktraces = processable_stacktraces
         self.processors = processors
+        self.frame_cache = frame_cache if frame_cache is not None else FrameCache()
 
     def close(self):
         for frame in self.iter_processable_frames():
@@ -445,11 +520,10 @@ def get_crash_frame_from_event_data(data, frame_filter=None):
         return default
 
 
-def lookup_frame_cache(keys):
-    rv = {}
-    for key in keys:
-        rv[key] = cache.get(key)
-    return rv
+def lookup_frame_cache(keys, frame_cache=None):
+    if frame_cache is None:
+        frame_cache = FrameCache()
+    return frame_cache.get_many(keys)
 
 
 def get_stacktrace_processing_task(infos, processors):
@@ -464,9 +538,11 @@ def get_stacktrace_processing_task(infos, processors):
     # to guarantee reproducible symbolicator requests.
     by_stacktrace_info = OrderedDict()
 
+    frame_cache = FrameCache()
     for info in infos:
         processable_frames = get_processable_frames(info, processors)
         for processable_frame in processable_frames:
+            processable_frame.frame_cache = frame_cache
             processable_frame.processor.preprocess_frame(processable_frame)
             by_processor.setdefault(processable_frame.processor, []).append(processable_frame)
             by_stacktrace_info.setdefault(processable_frame.stacktrace_info, []).append(
@@ -475,12 +551,25 @@ def get_stacktrace_processing_task(infos, processors):
             if processable_frame.cache_key is not None:
                 to_lookup[processable_frame.cache_key] = processable_frame
 
-    frame_cache = lookup_frame_cache(to_lookup)
+    hits = {}
+    misses = {}
+    cached = lookup_frame_cache(to_lookup, frame_cache)
     for cache_key, processable_frame in six.iteritems(to_lookup):
-        processable_frame.cache_value = frame_cache.get(cache_key)
+        processable_frame.cache_value = cached.get(cache_key)
+        name = processable_frame.processor.__class__.__name__
+        counts = misses if processable_frame.cache_value is None else hits
+        counts[name] = counts.get(name, 0) + 1
+
+    for result, counts in (("hit", hits), ("miss", misses)):
+        for name, count in six.iteritems(counts):
+            metrics.incr(
+                "stacktraces.processing.frame_cache",
+                amount=count,
+                tags={"processor": name, "result": result},
+            )
 
     return StacktraceProcessingTask(
-        processable_stacktraces=by_stacktrace_info, processors=by_processor
+        processable_stacktraces=by_stacktrace_info, processors=by_processor, frame_cache=frame_cache
     )
 
 
@@ -562,6 +651,9 @@ def process_stacktraces(data, make_processors=None, set_raw_stacktrace=True):
                 data.setdefault("_metrics", {})["flag.processing.error"] = True
                 changed = True
 
+        # Write back all frames that processors have cached at once
+        processing_task.frame_cache.flush()
+
     except Exception:
         logger.exception("stacktraces.processing.crash")
         data.setdefault("_metrics", {})["flag.processing.fatal"] = True
@@ -7,15 +7,19 @@ import math
 import operator
 import zlib
 from calendar import Calendar
-from collections import OrderedDict, namedtuple
+from collections import OrderedDict, defaultdict, namedtuple
 from datetime import datetime, timedelta
 
 import pytz
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
 from django.utils import dateformat, timezone
 
 from sentry.app import tsdb
 from sentry.models import (
     Activity,
+    Group,
     GroupStatus,
     Organization,
     OrganizationStatus,
@@ -24,7 +28,7 @@ from sentry.models import (
     User,
     UserOption,
 )
-from sentry.tasks.base import instrumented_task
+from sentry.tasks.base import instrumented_task, retry
 from sentry.utils import json, redis
 from sentry.utils.dates import floor_to_utc_day, to_datetime, to_timestamp
 from sentry.utils.email import MessageBuilder
@@ -42,6 +46,9 @@ logger = logging.getLogger(__name__)
 
 BATCH_SIZE = 30000
 
+# The number of projects whose reports are built with the same queries.
+PROJECT_BATCH_SIZE = 100
+
 
 def _get_organization_queryset():
     return Organization.objects.filter(status=OrganizationStatus.VISIBLE)
@@ -176,33 +183,61 @@ def _query_tsdb_chunked(func, issue_ids, start, stop, rollup):
     return combined
 
 
-def prepare_project_series(start__stop, project, rollup=60 * 60 * 24):
+def for_project(prepare):
+    """
+    Turns a function that prepares report data of a list of projects, keyed by
+    project ID, into one that prepares the data of a single project.
+    """
+
+    @functools.wraps(prepare)
+    def prepare_project(interval, project, *args, **kwargs):
+        return prepare(interval, [project], *args, **kwargs)[project.id]
+
+    return prepare_project
+
+
+def _get_issue_ids_by_project(queryset):
+    issue_ids = defaultdict(set)
+    for project_id, issue_id in queryset.values_list("project_id", "id"):
+        issue_ids[project_id].add(issue_id)
+    return issue_ids
+
+
+def prepare_projects_series(start__stop, projects, rollup=60 * 60 * 24):
     start, stop = start__stop
     resolution, series = tsdb.get_optimal_rollup_series(start, stop, rollup)
     assert resolution == rollup, "resolution does not match requested value"
     clean = functools.partial(clean_series, start, stop, rollup)
-    issue_ids = project.group_set.filter(
-        status=GroupStatus.RESOLVED, resolved_at__gte=start, resolved_at__lt=stop
-    ).values_list("id", flat=True)
-
-    tsdb_range = _query_tsdb_chunked(tsdb.get_range, issue_ids, start, stop, rollup)
+    project_ids = [project.id for project in projects]
+    issue_ids = _get_issue_ids_by_project(
+        Group.objects.filter(
+            project_id__in=project_ids,
+            status=GroupStatus.RESOLVED,
+            resolved_at__gte=start,
+            resolved_at__lt=stop,
+        )
+    )
 
-    return merge_series(
-        reduce(
-            merge_series,
-            map(clean, tsdb_range.values()),
-            clean([(timestamp, 0) for timestamp in series]),
-        ),
-        clean(
-            tsdb.get_range(tsdb.models.project, [project.id], start, stop, rollup=rollup)[
-                project.id
-            ]
-        ),
-        lambda resolved, total: (resolved, total - resolved),  # unresolved
+    tsdb_range = _query_tsdb_chunked(
+        tsdb.get_range, set().union(*issue_ids.values()), start, stop, rollup
     )
+    project_range = tsdb.get_range(tsdb.models.project, project_ids, start, stop, rollup=rollup)
 
+    return {
+        project_id: merge_series(
+            reduce(
+                merge_series,
+                [clean(tsdb_range[issue_id]) for issue_id in issue_ids[project_id]],
+                clean([(timestamp, 0) for timestamp in series]),
+            ),
+            clean(project_range[project_id]),
+            lambda resolved, total: (resolved, total - resolved),  # unresolved
+        )
+        for project_id in project_ids
+    }
 
-def prepare_project_aggregates(ignore__stop, project):
+
+def prepare_projects_aggregates(ignore__stop, projects):
     # TODO: This needs to return ``None`` for periods that don't have any data
     # (because the project is not old enough) and possibly extrapolate for
     # periods that only have partial periods.
@@ -210,26 +245,30 @@ def prepare_project_aggregates(ignore__stop, project):
     segments = 4
     period = timedelta(days=7)
     start = stop - (period * segments)
+    project_ids = [project.id for project in projects]
 
-    def get_aggregate_value(start, stop):
-        return tsdb.get_sums(tsdb.models.project, (project.id,), start, stop, rollup=60 * 60 * 24)[
-            project.id
-        ]
+    def get_aggregate_values(start, stop):
+        return tsdb.get_sums(tsdb.models.project, project_ids, start, stop, rollup=60 * 60 * 24)
 
-    return [
-        get_aggregate_value(start + (period * i), start + (period * (i + 1) - timedelta(seconds=1)))
+    values = [
+        get_aggregate_values(
+            start + (period * i), start + (period * (i + 1) - timedelta(seconds=1))
+        )
         for i in range(segments)
     ]
 
+    return {project_id: [value[project_id] for value in values] for project_id in project_ids}
 
-def prepare_project_issue_summaries(interval, project):
+
+def prepare_projects_issue_summaries(interval, projects):
     start, stop = interval
+    project_ids = [project.id for project in projects]
 
-    queryset = project.group_set.exclude(status=GroupStatus.IGNORED)
+    queryset = Group.objects.filter(project_id__in=project_ids).exclude(status=GroupStatus.IGNORED)
 
     # Fetch all new issues.
-    new_issue_ids = set(
-        queryset.filter(first_seen__gte=start, first_seen__lt=stop).values_list("id", flat=True)
+    new_issue_ids = _get_issue_ids_by_project(
+        queryset.filter(first_seen__gte=start, first_seen__lt=stop)
     )
 
     # Fetch all regressions. This is a little weird, since there's no way to
@@ -239,7 +278,8 @@ def prepare_project_issue_summaries(interval, project):
     # past week. (In theory, the activity table *could* be used to answer this
     # query without the subselect, but there's no suitable indexes to make it's
     # performance predictable.)
-    reopened_issue_ids = set(
+    reopened_issue_ids = defaultdict(set)
+    for project_id, issue_id in (
         Activity.objects.filter(
             group__in=queryset.filter(
                 last_seen__gte=start,
@@ -251,36 +291,50 @@ def prepare_project_issue_summaries(interval, project):
             datetime__lt=stop,
         )
         .distinct()
-        .values_list("group_id", flat=True)
-    )
+        .values_list("project_id", "group_id")
+    ):
+        reopened_issue_ids[project_id].add(issue_id)
 
     rollup = 60 * 60 * 24
     event_counts = _query_tsdb_chunked(
-        tsdb.get_sums, new_issue_ids | reopened_issue_ids, start, stop, rollup
+        tsdb.get_sums,
+        set().union(*new_issue_ids.values()) | set().union(*reopened_issue_ids.values()),
+        start,
+        stop,
+        rollup,
     )
-
-    new_issue_count = sum(event_counts[id] for id in new_issue_ids)
-    reopened_issue_count = sum(event_counts[id] for id in reopened_issue_ids)
-    existing_issue_count = max(
-        tsdb.get_sums(tsdb.models.project, [project.id], start, stop, rollup=rollup)[project.id]
-        - new_issue_count
-        - reopened_issue_count,
-        0,
+    project_event_counts = tsdb.get_sums(
+        tsdb.models.project, project_ids, start, stop, rollup=rollup
     )
 
-    return [new_issue_count, reopened_issue_count, existing_issue_count]
+    results = {}
+    for project_id in project_ids:
+        new_issue_count = sum(event_counts[id] for id in new_issue_ids[project_id])
+        reopened_issue_count = sum(event_counts[id] for id in reopened_issue_ids[project_id])
+        existing_issue_count = max(
+            project_event_counts[project_id] - new_issue_count - reopened_issue_count, 0
+        )
+        results[project_id] = [new_issue_count, reopened_issue_count, existing_issue_count]
+
+    return results
 
 
-def prepare_project_usage_summary(start__stop, project):
+def prepare_projects_usage_summary(start__stop, projects):
     start, stop = start__stop
-    return (
-        tsdb.get_sums(
-            tsdb.models.project_total_blacklisted, [project.id], start, stop, rollup=60 * 60 * 24
-        )[project.id],
-        tsdb.get_sums(
-            tsdb.models.project_total_rejected, [project.id], start, stop, rollup=60 * 60 * 24
-        )[project.id],
-    )
+    project_ids = [project.id for project in projects]
+    blacklisted, rejected = [
+        tsdb.get_sums(model, project_ids, start, stop, rollup=60 * 60 * 24)
+        for model in (tsdb.models.project_total_blacklisted, tsdb.models.project_total_rejected)
+    ]
+    return {
+        project_id: (blacklisted[project_id], rejected[project_id]) for project_id in project_ids
+    }
+
+
+prepare_project_series = for_project(prepare_projects_series)
+prepare_project_aggregates = for_project(prepare_projects_aggregates)
+prepare_project_issue_summaries = for_project(prepare_projects_issue_summaries)
+prepare_project_usage_summary = for_project(prepare_projects_usage_summary)
 
 
 def get_calendar_range(ignore__stop_time, months):
@@ -323,15 +377,21 @@ def clean_calendar_data(project, series, start, stop, rollup, timestamp=None):
     return map(remove_invalid_values, clean_series(start, stop, rollup, series))
 
 
-def prepare_project_calendar_series(interval, project):
+def prepare_projects_calendar_series(interval, projects):
     start, stop = get_calendar_query_range(interval, 3)
 
     rollup = 60 * 60 * 24
-    series = tsdb.get_range(tsdb.models.project, [project.id], start, stop, rollup=rollup)[
-        project.id
-    ]
+    series = tsdb.get_range(
+        tsdb.models.project, [project.id for project in projects], start, stop, rollup=rollup
+    )
+
+    return {
+        project.id: clean_calendar_data(project, series[project.id], start, stop, rollup)
+        for project in projects
+    }
 
-    return clean_calendar_data(project, series, start, stop, rollup)
+
+prepare_project_calendar_series = for_project(prepare_projects_calendar_series)
 
 
 def build(name, fields):
@@ -339,8 +399,9 @@ def build(name, fields):
 
     cls = namedtuple(name, names)
 
-    def prepare(*args):
-        return cls(*[f(*args) for f in prepare_fields])
+    def prepare(interval, projects):
+        values = [f(interval, projects) for f in prepare_fields]
+        return {project.id: cls(*[value[project.id] for value in values]) for project in projects}
 
     def merge(target, other):
         return cls(*[f(target[i], other[i]) for i, f in enumerate(merge_fields)])
@@ -348,34 +409,43 @@ def build(name, fields):
     return cls, prepare, merge
 
 
-Report, prepare_project_report, merge_reports = build(
+Report, prepare_project_reports, merge_reports = build(
     "Report",
     [
         (
             "series",
-            prepare_project_series,
+            prepare_projects_series,
             functools.partial(merge_series, function=merge_sequences),
         ),
         (
             "aggregates",
-            prepare_project_aggregates,
+            prepare_projects_aggregates,
             functools.partial(merge_sequences, function=safe_add),
         ),
-        ("issue_summaries", prepare_project_issue_summaries, merge_sequences),
-        ("usage_summary", prepare_project_usage_summary, merge_sequences),
+        ("issue_summaries", prepare_projects_issue_summaries, merge_sequences),
+        ("usage_summary", prepare_projects_usage_summary, merge_sequences),
         (
             "calendar_series",
-            prepare_project_calendar_series,
+            prepare_projects_calendar_series,
             functools.partial(merge_series, function=safe_add),
         ),
     ],
 )
 
+prepare_project_report = for_project(prepare_project_reports)
+
 
 class ReportBackend(object):
     def build(self, timestamp, duration, project):
         return prepare_project_report(_to_interval(timestamp, duration), project)
 
+    def build_many(self, timestamp, duration, projects):
+        """
+        Build reports for a list of projects with batched queries, returning a
+        mapping of project ID to report.
+        """
+        return prepare_project_reports(_to_interval(timestamp, duration), projects)
+
     def prepare(self, timestamp, duration, organization):
         """
         Build and store reports for all projects in the organization.
@@ -396,7 +466,8 @@ class DummyReportBackend(ReportBackend):
 
     def fetch(self, timestamp, duration, organization, projects):
         assert all(project.organization_id == organization.id for project in projects)
-        return map(functools.partial(self.build, timestamp, duration), projects)
+        reports = self.build_many(timestamp, duration, projects)
+        return [reports[project.id] for project in projects]
 
 
 class RedisReportBackend(ReportBackend):
@@ -422,20 +493,47 @@ class RedisReportBackend(ReportBackend):
         return Report(*json.loads(zlib.decompress(value)))
 
     def prepare(self, timestamp, duration, organization):
-        reports = {}
-        for project in organization.project_set.all():
-            reports[project.id] = self.__encode(self.build(timestamp, duration, project))
-
-        if not reports:
-            # XXX: HMSET requires at least one key/value pair, so we need to
-            # protect ourselves here against organizations that were created
-            # but haven't set up any projects yet.
-            return
+        key = self.__make_key(timestamp, duration, organization)
 
+        # Reports are built for closed periods, so the reports of projects
+        # that were stored by a previous, failed attempt are still valid.
         with self.cluster.map() as client:
-            key = self.__make_key(timestamp, duration, organization)
-            client.hmset(key, reports)
-            client.expire(key, self.ttl)
+            result = client.hkeys(key)
+        prepared = set(int(project_id) for project_id in result.value)
+
+        projects = [
+            project for project in organization.project_set.all() if project.id not in prepared
+        ]
+
+        # XXX: HMSET requires at least one key/value pair, which every chunk
+        # has. Organizations that were created but haven't set up any projects
+        # yet don't have any chunks.
+        def prepare_chunk(projects):
+            reports = self.build_many(timestamp, duration, projects)
+            with self.cluster.map() as client:
+                client.hmset(
+                    key,
+                    {project_id: self.__encode(report) for project_id, report in reports.items()},
+                )
+                client.expire(key, self.ttl)
+
+        def prepare_chunk_in_thread(projects):
+            try:
+                return prepare_chunk(projects)
+            finally:
+                # Database connections are local to this thread and would leak
+                # otherwise.
+                connections.close_all()
+
+        chunks = list(chunked(projects, PROJECT_BATCH_SIZE))
+        max_workers = min(settings.SENTRY_REPORTS_CONCURRENCY, len(chunks))
+        if max_workers <= 1:
+            for chunk in chunks:
+                prepare_chunk(chunk)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # consume the results, so that errors are raised here
+                list(executor.map(prepare_chunk_in_thread, chunks))
 
     def fetch(self, timestamp, duration, organization, projects):
         with self.cluster.map() as client:
@@ -459,7 +557,12 @@ def prepare_reports(dry_run=False, *args, **kwargs):
         prepare_organization_report.delay(timestamp, duration, organization_id, dry_run=dry_run)
 
 
-@instrumented_task(name="sentry.tasks.reports.prepare_organization_report", queue="reports.prepare")
+@instrumented_task(
+    name="sentry.tasks.reports.prepare_organization_report",
+    queue="reports.prepare",
+    default_retry_delay=60 * 5,
+    max_retries=3,
+)
 def prepare_organization_report(timestamp, duration, organization_id, dry_run=False):
     try:
         organization = _get_organization_queryset().get(id=organization_id)
@@ -474,7 +577,7 @@ def prepare_organization_report(timestamp, duration, organization_id, dry_run=Fa
         )
         return
 
-    backend.prepare(timestamp, duration, organization)
+    _prepare_organization_report(timestamp, duration, organization)
 
     # If an OrganizationMember row doesn't have an associated user, this is
     # actually a pending invitation, so no report should be delivered.
@@ -486,6 +589,14 @@ def prepare_organization_report(timestamp, duration, organization_id, dry_run=Fa
         )
 
 
+@retry
+def _prepare_organization_report(timestamp, duration, organization):
+    # Only preparing the report is retried. A retry resumes where the failed
+    # attempt stopped, while retrying the delivery loop could send the same
+    # report to a user twice.
+    backend.prepare(timestamp, duration, organization)
+
+
 def fetch_personal_statistics(start__stop, organization, user):
     start, stop = start__stop
     resolved_issue_ids = set(
@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 
 import logging
+import time
 from collections import defaultdict, OrderedDict
+from datetime import timedelta
 
-from django.db import transaction
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
 
 from sentry import eventstore, eventstream
 from sentry.app import tsdb
@@ -24,6 +28,8 @@ from sentry.models import (
 )
 from sentry import similarity
 from sentry.tasks.base import instrumented_task
+from sentry.utils import metrics
+from sentry.utils.compat import zip
 from six.moves import reduce
 
 
@@ -103,15 +109,29 @@ initial_fields = {
 }
 
 
+def is_oldest_event(data, event):
+    # Events are usually backfilled from newest to oldest, but events of
+    # different shards are not, so this can't be assumed.
+    return "first_seen" not in data or event.datetime <= data["first_seen"]
+
+
 backfill_fields = {
-    "platform": lambda caches, data, event: event.platform,
-    "logger": lambda caches, data, event: event.get_tag("logger") or DEFAULT_LOGGER_NAME,
-    "first_seen": lambda caches, data, event: event.datetime,
-    "active_at": lambda caches, data, event: event.datetime,
+    "platform": lambda caches, data, event: event.platform
+    if is_oldest_event(data, event)
+    else data["platform"],
+    "logger": lambda caches, data, event: event.get_tag("logger") or DEFAULT_LOGGER_NAME
+    if is_oldest_event(data, event)
+    else data["logger"],
+    "first_seen": lambda caches, data, event: min(
+        data.get("first_seen", event.datetime), event.datetime
+    ),
+    "active_at": lambda caches, data, event: min(
+        data.get("active_at", event.datetime), event.datetime
+    ),
     "first_release": lambda caches, data, event: caches["Release"](
         caches["Project"](event.project_id).organization_id, event.get_tag("sentry:release")
     )
-    if event.get_tag("sentry:release")
+    if event.get_tag("sentry:release") and is_oldest_event(data, event)
     else data.get("first_release", None),
     "times_seen": lambda caches, data, event: data["times_seen"] + 1,
     "score": lambda caches, data, event: Group.calculate_score(
@@ -132,6 +152,23 @@ def get_group_creation_attributes(caches, events):
 
 
 def get_group_backfill_attributes(caches, group, events):
+    data = {
+        name: getattr(group, name)
+        for name in set(initial_fields.keys()) | set(backfill_fields.keys())
+    }
+    fields = set(backfill_fields.keys())
+
+    # The latest event of a group is only ever newer than the group itself when
+    # events are not migrated from newest to oldest, in which case it provides
+    # the initial fields instead.
+    latest_event = events[0]
+    if latest_event.datetime > group.last_seen:
+        initial_data = {
+            name: f(latest_event) for name, f in initial_fields.items() if name != "times_seen"
+        }
+        data.update(initial_data)
+        fields.update(initial_data.keys())
+
     return {
         k: v
         for k, v in reduce(
@@ -139,12 +176,9 @@ def get_group_backfill_attributes(caches, group, events):
                 [data, {name: f(caches, data, event) for name, f in backfill_fields.items()}]
             ),
             events,
-            {
-                name: getattr(group, name)
-                for name in set(initial_fields.keys()) | set(backfill_fields.keys())
-            },
+            data,
         ).items()
-        if k in backfill_fields
+        if k in fields
     }
 
 
@@ -343,7 +377,12 @@ def repair_group_release_data(caches, project, events):
         )
 
         if not created:
-            instance.update(first_seen=first_seen)
+            # Batches of events are not necessarily repaired from newest to
+            # oldest, so only ever widen the range the release was seen in.
+            instance.update(
+                first_seen=min(instance.first_seen, first_seen),
+                last_seen=max(instance.last_seen, last_seen),
+            )
 
 
 def get_event_user_from_interface(value):
@@ -444,36 +483,38 @@ def unlock_hashes(project_id, fingerprints):
     ).update(state=GroupHash.State.UNLOCKED)
 
 
-@instrumented_task(name="sentry.tasks.unmerge", queue="unmerge")
-def unmerge(
-    project_id,
-    source_id,
-    destination_id,
-    fingerprints,
-    actor_id,
-    last_event=None,
-    batch_size=500,
-    source_fields_reset=False,
-    eventstream_state=None,
-):
-    # XXX: The queryset chunking logic below is awfully similar to
-    # ``RangeQuerySetWrapper``. Ideally that could be refactored to be able to
-    # be run without iteration by passing around a state object and we could
-    # just use that here instead.
-
-    source = Group.objects.get(project_id=project_id, id=source_id)
-
-    caches = get_caches()
-
-    project = caches["Project"](project_id)
-
-    # On the first iteration of this loop, we clear out all of the
-    # denormalizations from the source group so that we can have a clean slate
-    # for the new, repaired data.
-    if last_event is None:
-        fingerprints = lock_hashes(project_id, source_id, fingerprints)
-        truncate_denormalizations(project, source)
-
+def get_event_shards(project_id, source_id, num_shards):
+    """\
+    Splits the time range of the events of the source group into
+    ``num_shards`` shards, ordered from newest to oldest. Each shard keeps track
+    of the last event that was migrated from it.
+    """
+    event_filter = eventstore.Filter(project_ids=[project_id], group_ids=[source_id])
+    newest_events, oldest_events = [
+        eventstore.get_unfetched_events(
+            filter=event_filter, limit=1, referrer="unmerge.shards", orderby=orderby
+        )
+        for orderby in (["-timestamp", "-event_id"], ["timestamp", "event_id"])
+    ]
+    if not newest_events or not oldest_events:
+        return []
+
+    # Shards include their start and exclude their end.
+    start = oldest_events[0].datetime
+    end = newest_events[0].datetime + timedelta(seconds=1)
+    size = (end - start) // num_shards
+
+    return [
+        {
+            "start": start if i == num_shards - 1 else end - size * (i + 1),
+            "end": end - size * i,
+            "last_event": None,
+        }
+        for i in range(num_shards)
+    ]
+
+
+def fetch_shard_events(project_id, source_id, shard, batch_size):
     # We process events sorted in descending order by -timestamp, -event_id. We need
     # to include event_id as well as timestamp in the ordering criteria since:
     #
@@ -488,6 +529,7 @@ def unmerge(
     # have missed an event with the same timestamp as the last item in the
     # previous batch.
 
+    last_event = shard["last_event"]
     conditions = []
     if last_event is not None:
         conditions.extend(
@@ -500,51 +542,203 @@ def unmerge(
             ]
         )
 
-    events = eventstore.get_events(
+    return eventstore.get_events(
         filter=eventstore.Filter(
-            project_ids=[project_id], group_ids=[source.id], conditions=conditions
+            start=shard["start"],
+            end=shard["end"],
+            project_ids=[project_id],
+            group_ids=[source_id],
+            conditions=conditions,
         ),
         limit=batch_size,
         referrer="unmerge",
         orderby=["-timestamp", "-event_id"],
     )
 
-    # If there are no more events to process, we're done with the migration.
-    if not events:
-        unlock_hashes(project_id, fingerprints)
-        logger.warning("Unmerge complete (eventstream state: %s)", eventstream_state)
-        if eventstream_state:
-            eventstream.end_unmerge(eventstream_state)
 
-        return destination_id
+def fetch_events(project_id, source_id, shards, batch_size):
+    """\
+    Fetches the next batch of events of every shard, concurrently on up to
+    ``SENTRY_UNMERGE_CONCURRENCY`` threads, and advances the shards past them.
+    Shards that have no more events are removed from ``shards``. Returns all
+    events sorted from newest to oldest.
+    """
+
+    def fetch(shard):
+        return fetch_shard_events(project_id, source_id, shard, batch_size)
+
+    def fetch_in_thread(shard):
+        try:
+            return fetch(shard)
+        finally:
+            # Binding event data can open database connections, which are
+            # local to this thread and would leak otherwise.
+            connections.close_all()
 
-    source_events = []
-    destination_events = []
+    max_workers = min(settings.SENTRY_UNMERGE_CONCURRENCY, len(shards))
+    if max_workers <= 1:
+        results = [fetch(shard) for shard in shards]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(fetch_in_thread, shards))
+
+    events = []
+    for shard, shard_events in zip(list(shards), results):
+        if len(shard_events) < batch_size:
+            shards.remove(shard)
+        else:
+            shard["last_event"] = {
+                "timestamp": shard_events[-1].timestamp,
+                "event_id": shard_events[-1].event_id,
+            }
+        events.extend(shard_events)
 
+    events.sort(key=lambda event: (event.datetime, event.event_id), reverse=True)
+    return events
+
+
+def collect_first_releases(first_releases, events):
+    """\
+    Records the release of the oldest event with a release for each group and
+    environment pair in ``first_releases``.
+    """
     for event in events:
-        (destination_events if get_fingerprint(event) in fingerprints else source_events).append(
-            event
+        release = event.get_tag("sentry:release")
+        if not release:
+            continue
+
+        key = (event.group_id, get_environment_name(event))
+        if key not in first_releases or event.datetime <= first_releases[key][0]:
+            first_releases[key] = (event.datetime, release)
+
+
+def repair_first_releases(caches, project, first_releases):
+    # ``repair_group_environment_data`` only sees one batch at a time, which
+    # are not repaired from newest to oldest when events are sharded.
+    for (group_id, env_name), (_, release) in first_releases.items():
+        fields = {"first_release": caches["Release"](project.organization_id, release)}
+        GroupEnvironment.objects.create_or_update(
+            environment_id=caches["Environment"](project.organization_id, env_name).id,
+            group_id=group_id,
+            defaults=fields,
+            values=fields,
         )
 
-    if source_events:
-        if not source_fields_reset:
-            source.update(**get_group_creation_attributes(caches, source_events))
-            source_fields_reset = True
+
+@instrumented_task(name="sentry.tasks.unmerge", queue="unmerge")
+def unmerge(
+    project_id,
+    source_id,
+    destination_id,
+    fingerprints,
+    actor_id,
+    last_event=None,
+    batch_size=500,
+    source_fields_reset=False,
+    eventstream_state=None,
+    shards=None,
+    first_releases=None,
+    events_migrated=0,
+    started_at=None,
+):
+    # The events of the source group are partitioned by time into shards,
+    # which are migrated concurrently. Every run of this task migrates the next
+    # batch of events of each shard and then reschedules itself, until all
+    # shards are exhausted.
+
+    source = Group.objects.get(project_id=project_id, id=source_id)
+
+    caches = get_caches()
+
+    project = caches["Project"](project_id)
+
+    if shards is None:
+        if last_event is None:
+            # On the first iteration of this loop, we clear out all of the
+            # denormalizations from the source group so that we can have a clean slate
+            # for the new, repaired data.
+            fingerprints = lock_hashes(project_id, source_id, fingerprints)
+            truncate_denormalizations(project, source)
+            shards = get_event_shards(project_id, source_id, settings.SENTRY_UNMERGE_SHARDS)
+            started_at = time.time()
         else:
-            source.update(**get_group_backfill_attributes(caches, source, source_events))
+            # This continues an unmerge that was started before events were
+            # sharded, which migrates all remaining events in a single shard.
+            shards = [{"start": None, "end": None, "last_event": last_event}]
 
-    (destination_id, eventstream_state) = migrate_events(
-        caches,
-        project,
-        source_id,
-        destination_id,
-        fingerprints,
-        destination_events,
-        actor_id,
-        eventstream_state,
-    )
+    if first_releases is None:
+        first_releases = {}
+
+    with metrics.timer("unmerge.fetch_events", tags={"shards": len(shards)}):
+        events = fetch_events(project_id, source_id, shards, batch_size) if shards else []
+
+    if events:
+        source_events = []
+        destination_events = []
+
+        for event in events:
+            (
+                destination_events if get_fingerprint(event) in fingerprints else source_events
+            ).append(event)
+
+        if source_events:
+            if not source_fields_reset:
+                source.update(**get_group_creation_attributes(caches, source_events))
+                source_fields_reset = True
+            else:
+                source.update(**get_group_backfill_attributes(caches, source, source_events))
+
+        (destination_id, eventstream_state) = migrate_events(
+            caches,
+            project,
+            source_id,
+            destination_id,
+            fingerprints,
+            destination_events,
+            actor_id,
+            eventstream_state,
+        )
+
+        repair_denormalizations(caches, project, events)
+        collect_first_releases(first_releases, events)
+
+        events_migrated += len(events)
+        metrics.incr("unmerge.events_migrated", amount=len(events))
+        logger.info(
+            "unmerge.progress",
+            extra={
+                "project_id": project_id,
+                "source_id": source_id,
+                "destination_id": destination_id,
+                "events_migrated": events_migrated,
+                "shards_remaining": len(shards),
+            },
+        )
 
-    repair_denormalizations(caches, project, events)
+    # If there are no more events to process, we're done with the migration.
+    if not shards:
+        repair_first_releases(caches, project, first_releases)
+        unlock_hashes(project_id, fingerprints)
+        logger.warning("Unmerge complete (eventstream state: %s)", eventstream_state)
+        if eventstream_state:
+            eventstream.end_unmerge(eventstream_state)
+
+        if started_at is not None:
+            duration = time.time() - started_at
+            metrics.timing("unmerge.duration", duration)
+            logger.info(
+                "unmerge.complete",
+                extra={
+                    "project_id": project_id,
+                    "source_id": source_id,
+                    "destination_id": destination_id,
+                    "events_migrated": events_migrated,
+                    "duration": duration,
+                    "events_per_second": events_migrated / duration if duration else None,
+                },
+            )
+
+        return destination_id
 
     unmerge.delay(
         project_id,
@@ -552,8 +746,11 @@ def unmerge(
         destination_id,
         fingerprints,
         actor_id,
-        last_event={"timestamp": events[-1].timestamp, "event_id": events[-1].event_id},
         batch_size=batch_size,
         source_fields_reset=source_fields_reset,
         eventstream_state=eventstream_state,
+        shards=shards,
+        first_releases=first_releases,
+        events_migrated=events_migrated,
+        started_at=started_at,
     )
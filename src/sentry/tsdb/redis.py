@@ -1,9 +1,12 @@
 from __future__ import absolute_import
 
+import atexit
 import itertools
 import logging
 import operator
 import random
+import threading
+import time
 import uuid
 from collections import defaultdict, namedtuple
 from hashlib import md5
@@ -14,6 +17,7 @@ from django.utils.encoding import force_bytes
 from pkg_resources import resource_string
 
 from sentry.tsdb.base import BaseTSDB
+from sentry.utils import metrics
 from sentry.utils.dates import to_datetime, to_timestamp
 from sentry.utils.redis import check_cluster_versions, get_cluster_from_options, SentryScript
 from sentry.utils.versioning import Version
@@ -106,6 +110,21 @@ class RedisTSDB(BaseTSDB):
     frequency table can be displayed as percentages of the whole data set.
     (Additional documentation and the bulk of the logic for implementing the
     frequency table API can be found in the ``cmsketch.lua`` script.)
+
+    Unions of distinct counters can optionally cache the merged sketch of
+    all closed (past) rollup buckets of a key by setting
+    ``distinct_counts_union_cache_ttl`` (in seconds). Queries then only
+    have to merge the cached sketches with the currently open bucket. Since
+    late events may still be recorded into closed buckets, the TTL bounds
+    how long those are not reflected in unions. Merging or deleting distinct
+    counters drops the cached sketches of the affected keys.
+
+    Counter increments can optionally be aggregated in process by setting
+    ``incr_flush_interval`` (in seconds). Increments of the same hash field
+    are then summed up and written at most once per interval, trading read
+    freshness of counters for a lot fewer Redis operations. Pending
+    increments are also written after every Celery task or request once the
+    interval has passed, and when the worker or process shuts down.
     """
 
     DEFAULT_SKETCH_PARAMETERS = SketchParameters(3, 128, 50)
@@ -115,6 +134,14 @@ class RedisTSDB(BaseTSDB):
         self.prefix = prefix
         self.vnodes = vnodes
         self.enable_frequency_sketches = options.pop("enable_frequency_sketches", False)
+        self.incr_flush_interval = options.pop("incr_flush_interval", 0)
+        self.distinct_counts_union_cache_ttl = options.pop("distinct_counts_union_cache_ttl", 0)
+        # (cluster, durable) -> ({(hash_key, hash_field): count}, {hash_key: expiry})
+        self.__pending_incrs = {}
+        self.__pending_incrs_lock = threading.Lock()
+        self.__last_incr_flush = time.time()
+        if self.incr_flush_interval > 0:
+            self.__connect_incr_flush_signals()
         super(RedisTSDB, self).__init__(**options)
 
     def validate(self):
@@ -184,6 +211,31 @@ class RedisTSDB(BaseTSDB):
             self.add_environment_parameter(model_key, environment_id),
         )
 
+    def make_union_cache_key(self, model, rollup, series, key, environment_id):
+        """
+        Make a key that is used for the cached union of the distinct counters
+        of ``key`` over the (closed) rollup buckets in ``series``.
+        """
+        return self.add_environment_parameter(
+            u"{prefix}u:{model}:{rollup}:{start}:{end}:{key}".format(
+                prefix=self.prefix,
+                model=model.value,
+                rollup=rollup,
+                start=min(series),
+                end=max(series),
+                key=self.get_model_key(key),
+            ),
+            environment_id,
+        )
+
+    def make_union_cache_index_key(self, model, key):
+        """
+        Make a key for the set of all cached unions of ``key``.
+        """
+        return u"{prefix}u:{model}:{key}".format(
+            prefix=self.prefix, model=model.value, key=self.get_model_key(key)
+        )
+
     def get_model_key(self, key):
         # We specialize integers so that a pure int-map can be optimized by
         # Redis, whereas long strings (say tag values) will store in a more
@@ -237,43 +289,142 @@ class RedisTSDB(BaseTSDB):
         for (cluster, durable), environment_ids in self.get_cluster_groups(
             set([None, environment_id])
         ):
-            manager = cluster.map()
-            if not durable:
-                manager = SuppressionWrapper(manager)
+            # (hash_key, hash_field) -> count
+            key_operations = defaultdict(lambda: 0)
+            # (hash_key) -> "max expiration encountered"
+            key_expiries = defaultdict(lambda: 0.0)
+
+            for rollup, max_values in six.iteritems(self.rollups):
+                for item in items:
+                    if len(item) == 2:
+                        model, key = item
+                        options = {}
+                    else:
+                        model, key, options = item
+
+                    count = options.get("count", default_count)
+                    timestamp = options.get("timestamp", default_timestamp)
+
+                    expiry = self.calculate_expiry(rollup, max_values, timestamp)
+
+                    for environment_id in environment_ids:
+                        hash_key, hash_field = self.make_counter_key(
+                            model, rollup, timestamp, key, environment_id
+                        )
 
-            with manager as client:
-                # (hash_key, hash_field) -> count
-                key_operations = defaultdict(lambda: 0)
-                # (hash_key) -> "max expiration encountered"
-                key_expiries = defaultdict(lambda: 0.0)
-
-                for rollup, max_values in six.iteritems(self.rollups):
-                    for item in items:
-                        if len(item) == 2:
-                            model, key = item
-                            options = {}
-                        else:
-                            model, key, options = item
-
-                        count = options.get("count", default_count)
-                        timestamp = options.get("timestamp", default_timestamp)
+                        if key_expiries[hash_key] < expiry:
+                            key_expiries[hash_key] = expiry
 
-                        expiry = self.calculate_expiry(rollup, max_values, timestamp)
+                        key_operations[(hash_key, hash_field)] += count
 
-                        for environment_id in environment_ids:
-                            hash_key, hash_field = self.make_counter_key(
-                                model, rollup, timestamp, key, environment_id
-                            )
+            if self.incr_flush_interval > 0:
+                self.__add_pending_incrs(cluster, durable, key_operations, key_expiries)
+            else:
+                self.__write_incrs(cluster, durable, key_operations, key_expiries)
+
+        if self.incr_flush_interval > 0:
+            self.maybe_flush_incrs()
+
+    def maybe_flush_incrs(self):
+        """
+        Writes all counter increments aggregated in this process if the flush
+        interval has passed since the last flush.
+        """
+        if time.time() - self.__last_incr_flush >= self.incr_flush_interval:
+            self.flush_incrs()
 
-                            if key_expiries[hash_key] < expiry:
-                                key_expiries[hash_key] = expiry
+    def flush_incrs(self):
+        """
+        Writes all counter increments aggregated in this process.
 
-                            key_operations[(hash_key, hash_field)] += count
+        If a write fails, the increments that Redis did not confirm are kept
+        pending for the next flush and the error is raised. Increments that
+        were confirmed are not written again.
+        """
+        with self.__pending_incrs_lock:
+            pending, self.__pending_incrs = self.__pending_incrs, {}
+            self.__last_incr_flush = time.time()
+
+        pending = list(six.iteritems(pending))
+        for i, ((cluster, durable), (key_operations, key_expiries)) in enumerate(pending):
+            metrics.timing("tsdb.redis.incr_flush.operations", len(key_operations))
+            promises = {}
+            try:
+                self.__write_incrs(
+                    cluster, durable, key_operations, dict(key_expiries), promises=promises
+                )
+            except Exception:
+                metrics.incr("tsdb.redis.incr_flush.failed")
+                unwritten = {
+                    operation: count
+                    for operation, count in six.iteritems(key_operations)
+                    if operation not in promises or not promises[operation].is_resolved
+                }
+                self.__add_pending_incrs(
+                    cluster,
+                    durable,
+                    unwritten,
+                    {hash_key: key_expiries[hash_key] for hash_key, _ in unwritten},
+                )
+                for (other_cluster, other_durable), other_incrs in pending[i + 1 :]:
+                    self.__add_pending_incrs(other_cluster, other_durable, *other_incrs)
+                raise
 
-                for (hash_key, hash_field), count in six.iteritems(key_operations):
-                    client.hincrby(hash_key, hash_field, count)
-                    if key_expiries.get(hash_key):
-                        client.expireat(hash_key, key_expiries.pop(hash_key))
+    def __maybe_flush_incrs_receiver(self, **kwargs):
+        # Errors must not propagate into the task or request that finished.
+        # Increments that failed to be written stay pending.
+        try:
+            self.maybe_flush_incrs()
+        except Exception:
+            logger.exception("tsdb.redis.incr_flush.failed")
+
+    def __flush_incrs_receiver(self, **kwargs):
+        try:
+            self.flush_incrs()
+        except Exception:
+            logger.exception("tsdb.redis.incr_flush.failed")
+
+    def __connect_incr_flush_signals(self):
+        from celery.signals import task_postrun, worker_process_shutdown, worker_shutdown
+        from django.core.signals import request_finished
+
+        # Increments are otherwise only flushed by the next incr_multi call,
+        # which may never come in an idle worker.
+        task_postrun.connect(self.__maybe_flush_incrs_receiver)
+        request_finished.connect(self.__maybe_flush_incrs_receiver)
+        # atexit handlers do not run in Celery's prefork children, which exit
+        # through os._exit, so flush from the worker shutdown signals as well.
+        worker_process_shutdown.connect(self.__flush_incrs_receiver)
+        worker_shutdown.connect(self.__flush_incrs_receiver)
+        atexit.register(self.__flush_incrs_receiver)
+
+    def __add_pending_incrs(self, cluster, durable, key_operations, key_expiries):
+        with self.__pending_incrs_lock:
+            pending_operations, pending_expiries = self.__pending_incrs.setdefault(
+                (cluster, durable), (defaultdict(lambda: 0), defaultdict(lambda: 0.0))
+            )
+            for operation, count in six.iteritems(key_operations):
+                pending_operations[operation] += count
+            for hash_key, expiry in six.iteritems(key_expiries):
+                if pending_expiries[hash_key] < expiry:
+                    pending_expiries[hash_key] = expiry
+
+    def __write_incrs(self, cluster, durable, key_operations, key_expiries, promises=None):
+        """
+        Writes counter increments. If ``promises`` is given, it is filled with
+        the promise of the ``HINCRBY`` of every ``(hash_key, hash_field)``.
+        """
+        manager = cluster.map()
+        if not durable:
+            manager = SuppressionWrapper(manager)
+
+        with manager as client:
+            for (hash_key, hash_field), count in six.iteritems(key_operations):
+                promise = client.hincrby(hash_key, hash_field, count)
+                if promises is not None:
+                    promises[(hash_key, hash_field)] = promise
+                if key_expiries.get(hash_key):
+                    client.expireat(hash_key, key_expiries.pop(hash_key))
 
     def get_range(self, model, keys, start, end, rollup=None, environment_ids=None):
         """
@@ -487,12 +638,23 @@ class RedisTSDB(BaseTSDB):
 
         rollup, series = self.get_optimal_rollup_series(start, end, rollup)
 
+        # Buckets that ended already are (mostly) immutable and their union
+        # can be cached.
+        union_cache_ttl = self.distinct_counts_union_cache_ttl
+        if union_cache_ttl > 0:
+            now = to_timestamp(timezone.now())
+            closed_series = [timestamp for timestamp in series if timestamp + rollup <= now]
+            open_series = [timestamp for timestamp in series if timestamp + rollup > now]
+        else:
+            closed_series = []
+            open_series = series
+
         temporary_id = uuid.uuid1().hex
 
         def make_temporary_key(key):
             return u"{}{}:{}".format(self.prefix, temporary_id, key)
 
-        def expand_key(key):
+        def expand_key(key, series=series):
             """
             Return a list containing all keys for each interval in the series for a key.
             """
@@ -500,6 +662,39 @@ class RedisTSDB(BaseTSDB):
                 self.make_key(model, rollup, timestamp, key, environment_id) for timestamp in series
             ]
 
+        def get_union_cache_keys(client, keys):
+            """
+            Return the keys of the cached unions of all closed buckets,
+            creating the ones that are missing.
+            """
+            union_keys = [
+                self.make_union_cache_key(model, rollup, closed_series, key, environment_id)
+                for key in keys
+            ]
+            with client.pipeline(transaction=False) as pipeline:
+                for union_key in union_keys:
+                    pipeline.exists(union_key)
+                exists = pipeline.execute()
+
+            missing = [
+                (key, union_key)
+                for key, union_key, exists in zip(keys, union_keys, exists)
+                if not exists
+            ]
+            if missing:
+                with client.pipeline(transaction=False) as pipeline:
+                    for key, union_key in missing:
+                        index_key = self.make_union_cache_index_key(model, key)
+                        pipeline.execute_command(
+                            "PFMERGE", union_key, *expand_key(key, closed_series)
+                        )
+                        pipeline.expire(union_key, union_cache_ttl)
+                        pipeline.sadd(index_key, union_key)
+                        pipeline.expire(index_key, union_cache_ttl)
+                    pipeline.execute()
+
+            return union_keys
+
         cluster, _ = self.get_cluster(environment_id)
         router = cluster.get_router()
 
@@ -518,10 +713,15 @@ class RedisTSDB(BaseTSDB):
             (host, keys) = value
             destination = make_temporary_key(u"p:{}".format(host))
             client = cluster.get_local_client(host)
+
+            sources = []
+            if closed_series:
+                sources.extend(get_union_cache_keys(client, list(keys)))
+            for key in keys:
+                sources.extend(expand_key(key, open_series))
+
             with client.pipeline(transaction=False) as pipeline:
-                pipeline.execute_command(
-                    "PFMERGE", destination, *itertools.chain.from_iterable(map(expand_key, keys))
-                )
+                pipeline.execute_command("PFMERGE", destination, *sources)
                 pipeline.get(destination)
                 pipeline.delete(destination)
                 return (host, pipeline.execute()[1])
@@ -558,6 +758,31 @@ class RedisTSDB(BaseTSDB):
             ]
         )
 
+    def delete_distinct_counts_union_cache(self, cluster, durable, model, keys):
+        """
+        Delete all cached unions of the distinct counters of ``keys``.
+        """
+        if not self.distinct_counts_union_cache_ttl:
+            return
+
+        try:
+            self.__delete_distinct_counts_union_cache(cluster, model, keys)
+        except Exception:
+            if durable:
+                raise
+
+    def __delete_distinct_counts_union_cache(self, cluster, model, keys):
+        with cluster.fanout() as client:
+            index_keys = {key: self.make_union_cache_index_key(model, key) for key in keys}
+            promises = {
+                key: client.target_key(key).smembers(index_key)
+                for key, index_key in six.iteritems(index_keys)
+            }
+
+        with cluster.fanout() as client:
+            for key, promise in six.iteritems(promises):
+                client.target_key(key).delete(index_keys[key], *(promise.value or ()))
+
     def merge_distinct_counts(
         self, model, destination, sources, timestamp=None, environment_ids=None
     ):
@@ -624,6 +849,10 @@ class RedisTSDB(BaseTSDB):
                                     self.calculate_expiry(rollup, self.rollups[rollup], timestamp),
                                 )
 
+            self.delete_distinct_counts_union_cache(
+                cluster, durable, model, list(sources) + [destination]
+            )
+
     def delete_distinct_counts(
         self, models, keys, start=None, end=None, timestamp=None, environment_ids=None
     ):
@@ -657,6 +886,9 @@ class RedisTSDB(BaseTSDB):
                                         )
                                     )
 
+            for model in models:
+                self.delete_distinct_counts_union_cache(cluster, durable, model, keys)
+
     def make_frequency_table_keys(self, model, rollup, timestamp, key, environment_id):
         prefix = self.make_key(model, rollup, timestamp, key, environment_id)
         return map(operator.methodcaller("format", prefix), ("{}:i", "{}:e"))
@@ -1,8 +1,12 @@
 from __future__ import absolute_import
 
+import base64
 import six
 
 from collections import Sequence
+from django.utils.encoding import force_bytes
+
+from sentry.utils import json
 
 
 class Cursor(object):
@@ -47,6 +51,45 @@ class Cursor(object):
         return cls(*bits)
 
 
+class KeysetCursor(Cursor):
+    """
+    A cursor whose value is the full sort key (a list of values) of the row
+    that a page starts after (or before, for previous cursors.)
+    """
+
+    def __str__(self):
+        return "%s:%s:%s" % (self.encode_value(self.value), self.offset, int(self.is_prev))
+
+    @staticmethod
+    def encode_value(value):
+        if not value:
+            return ""
+        value = json.dumps(value).encode("utf-8")
+        return base64.urlsafe_b64encode(value).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode_value(value):
+        if not value:
+            return None
+        value = force_bytes(value)
+        value = base64.urlsafe_b64decode(value + b"=" * (-len(value) % 4))
+        value = json.loads(value.decode("utf-8"))
+        if not isinstance(value, list):
+            raise ValueError
+        return value
+
+    @classmethod
+    def from_string(cls, value):
+        bits = value.split(":")
+        if len(bits) != 3:
+            raise ValueError
+        try:
+            bits = cls.decode_value(bits[0]), int(bits[1]), int(bits[2])
+        except (TypeError, ValueError):
+            raise ValueError
+        return cls(*bits)
+
+
 class CursorResult(Sequence):
     def __init__(self, results, next, prev, hits=None, max_hits=None):
         self.results = results
@@ -1,6 +1,8 @@
 from __future__ import absolute_import
 
-from collections import Hashable, MutableMapping
+import threading
+
+from collections import Hashable, MutableMapping, OrderedDict
 
 __unset__ = object()
 
@@ -61,3 +63,68 @@ class BidirectionalMapping(MutableMapping):
 
     def inverse(self):
         return self.__inverse.copy()
+
+
+class LRUCache(object):
+    """\
+    A thread safe cache that evicts the least recently used items once the
+    total size of all items exceeds ``max_size``.
+
+    The size of an item is computed with ``get_size(value)`` and defaults to
+    one, in which case ``max_size`` bounds the number of items.  Items that
+    are larger than ``max_size`` on their own are never stored.
+    """
+
+    def __init__(self, max_size, get_size=None):
+        self.max_size = max_size
+        self.get_size = get_size
+        self.size = 0
+        self.__data = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key):
+        return key in self.__data
+
+    def get(self, key, default=None):
+        with self.__lock:
+            item = self.__data.pop(key, __unset__)
+            if item is __unset__:
+                return default
+            self.__data[key] = item
+            return item[0]
+
+    def set(self, key, value):
+        """\
+        Stores ``value`` and returns the number of items that had to be
+        evicted to make room for it.
+        """
+        size = self.get_size(value) if self.get_size is not None else 1
+        evicted = 0
+        with self.__lock:
+            self.__remove(key)
+            if size > self.max_size:
+                return evicted
+            while self.__data and self.size + size > self.max_size:
+                _, (_, old_size) = self.__data.popitem(last=False)
+                self.size -= old_size
+                evicted += 1
+            self.__data[key] = (value, size)
+            self.size += size
+        return evicted
+
+    def delete(self, key):
+        with self.__lock:
+            self.__remove(key)
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+            self.size = 0
+
+    def __remove(self, key):
+        item = self.__data.pop(key, __unset__)
+        if item is not __unset__:
+            self.size -= item[1]
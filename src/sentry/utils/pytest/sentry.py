@@ -78,6 +78,13 @@ def pytest_configure(config):
 
     settings.SENTRY_ALLOW_ORIGIN = "*"
 
+    # Fetch, deletion, unmerge and report threads use their own database connections,
+    # which cannot see the data created inside of test transactions.
+    settings.SENTRY_JS_FETCH_CONCURRENCY = 1
+    settings.SENTRY_DELETIONS_CONCURRENCY = 1
+    settings.SENTRY_UNMERGE_CONCURRENCY = 1
+    settings.SENTRY_REPORTS_CONCURRENCY = 1
+
     settings.SENTRY_TSDB = "sentry.tsdb.inmemory.InMemoryTSDB"
     settings.SENTRY_TSDB_OPTIONS = {}
 
@@ -101,6 +108,9 @@ def pytest_configure(config):
         "nodedata": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
     }
 
+    # Tests change options in the database, which rolls back between tests
+    settings.SENTRY_OPTIONS_SNAPSHOT_INTERVAL = 0
+
     settings.SENTRY_RATELIMITER = "sentry.ratelimits.redis.RedisRateLimiter"
     settings.SENTRY_RATELIMITER_OPTIONS = {}
 
@@ -181,12 +181,13 @@ def bulk_delete_objects(
     cursor = connection.cursor()
     cursor.execute(query, params)
 
-    has_more = cursor.rowcount > 0
+    # the number of deleted rows, which is non-zero while there may be more to delete
+    rows_deleted = cursor.rowcount
 
-    if has_more and logger is not None and _leaf_re.search(model.__name__) is None:
+    if rows_deleted and logger is not None and _leaf_re.search(model.__name__) is None:
         logger.info(
             "object.delete.bulk_executed",
             extra=dict(filters, model=model.__name__, transaction_id=transaction_id),
         )
 
-    return has_more
+    return max(rows_deleted, 0)
@@ -11,12 +11,13 @@ import os
 import pytz
 import re
 import six
+import threading
 import time
 import urllib3
 import sentry_sdk
 from sentry_sdk import Hub
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 from django.conf import settings
 from six.moves.urllib.parse import urlparse
 
@@ -33,7 +34,9 @@ from sentry.models import (
 )
 from sentry.net.http import connection_from_url
 from sentry.utils import metrics, json
+from sentry.utils.cache import cache
 from sentry.utils.dates import to_timestamp
+from sentry.utils.hashlib import md5_text
 from sentry.snuba.events import Columns
 from sentry.snuba.dataset import Dataset
 from sentry.utils.compat import map
@@ -307,9 +310,197 @@ _snuba_pool = connection_from_url(
         method_whitelist={"GET", "POST", "DELETE"},
     ),
     timeout=settings.SENTRY_SNUBA_TIMEOUT,
-    maxsize=10,
+    maxsize=settings.SENTRY_SNUBA_MAX_CONCURRENT_QUERIES,
 )
-_query_thread_pool = ThreadPoolExecutor(max_workers=10)
+
+
+class SnubaQueryExecutor(object):
+    """
+    Runs snuba queries on a thread pool that is shared by the whole process.
+
+    At most ``max_concurrent`` queries run at once, and at most
+    ``max_concurrent_per_referrer`` of them may come from the same referrer.
+    Submitting a query blocks while its referrer is at the limit, so that a
+    single busy referrer cannot take up all of the pool. Identical queries
+    (same referrer and body) that are submitted while one of them is still in
+    flight share its response instead of being sent again.
+    """
+
+    def __init__(self, pool, max_concurrent, max_concurrent_per_referrer=None):
+        self.pool = pool
+        self.max_concurrent_per_referrer = max_concurrent_per_referrer
+        self.__executor = ThreadPoolExecutor(max_workers=max_concurrent)
+        self.__lock = threading.Lock()
+        self.__in_flight = {}
+        self.__referrer_semaphores = {}
+
+    def __get_referrer_semaphore(self, referrer):
+        if not self.max_concurrent_per_referrer:
+            return None
+        with self.__lock:
+            semaphore = self.__referrer_semaphores.get(referrer)
+            if semaphore is None:
+                semaphore = self.__referrer_semaphores[referrer] = threading.BoundedSemaphore(
+                    self.max_concurrent_per_referrer
+                )
+            return semaphore
+
+    def submit(self, body, headers, hub, span_data=None):
+        """
+        Sends ``body`` to the query endpoint of snuba and returns a future of
+        the (shared) ``urllib3`` response. ``span_data`` is attached to the
+        span of the request.
+        """
+        referrer = headers.get("referer", "<unknown>")
+        key = (referrer, body)
+        with self.__lock:
+            future = self.__in_flight.get(key)
+            if future is not None:
+                metrics.incr("snuba.client.coalesced", tags={"referrer": referrer})
+                return future
+            future = self.__in_flight[key] = Future()
+
+        queued_at = time.time()
+        semaphore = self.__get_referrer_semaphore(referrer)
+        if semaphore is not None:
+            semaphore.acquire()
+        try:
+            self.__executor.submit(
+                self.__execute, future, key, body, headers, hub, span_data, semaphore, queued_at
+            )
+        except Exception as e:
+            self.__finish(key, semaphore)
+            future.set_exception(e)
+        return future
+
+    def __finish(self, key, semaphore):
+        with self.__lock:
+            self.__in_flight.pop(key, None)
+        if semaphore is not None:
+            semaphore.release()
+
+    def __execute(self, future, key, body, headers, hub, span_data, semaphore, queued_at):
+        referrer = key[0]
+        started_at = time.time()
+        metrics.timing(
+            "snuba.client.queue_wait", started_at - queued_at, tags={"referrer": referrer}
+        )
+        try:
+            with hub.start_span(op="snuba", description=u"query {}".format(referrer)) as span:
+                span.set_tag("referrer", referrer)
+                for data_key, data in six.iteritems(span_data or {}):
+                    span.set_data(data_key, data)
+                response = self.pool.urlopen("POST", "/query", body=body, headers=headers)
+        except urllib3.exceptions.HTTPError as err:
+            result, error = None, SnubaError(err)
+        except Exception as err:
+            result, error = None, err
+        else:
+            result, error = response, None
+        finally:
+            metrics.timing(
+                "snuba.client.execution", time.time() - started_at, tags={"referrer": referrer}
+            )
+            # Later submissions of the same query have to send it again.
+            self.__finish(key, semaphore)
+
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+_query_executor = SnubaQueryExecutor(
+    _snuba_pool,
+    max_concurrent=settings.SENTRY_SNUBA_MAX_CONCURRENT_QUERIES,
+    max_concurrent_per_referrer=settings.SENTRY_SNUBA_MAX_CONCURRENT_QUERIES_PER_REFERRER,
+)
+
+# A successful response that was served from the result cache.
+CachedResponse = namedtuple("CachedResponse", ("status", "data"))
+
+
+class SnubaResultCache(object):
+    """
+    Caches successful query responses of a referrer, keyed by the
+    canonicalized query body.
+
+    Responses are always reused for the rest of the current request. They are
+    only shared between requests (through the default cache) for the
+    referrers in ``SENTRY_SNUBA_RESULT_CACHE_REFERRERS``: for
+    ``SENTRY_SNUBA_RESULT_CACHE_TTL`` seconds if the queried time window ended
+    more than ``SENTRY_SNUBA_RESULT_CACHE_SETTLE_TIME`` seconds ago, and for
+    ``SENTRY_SNUBA_RESULT_CACHE_RECENT_TTL`` seconds otherwise, as events for
+    recent windows may still be arriving. Quantizing the window with
+    ``quantize_time`` improves the hit rate of those.
+    """
+
+    def __init__(self, referrer):
+        from sentry.app import env
+
+        self.referrer = referrer
+        self.shared = referrer in settings.SENTRY_SNUBA_RESULT_CACHE_REFERRERS
+        request = env.request
+        if request is None:
+            self.request_cache = None
+        elif hasattr(request, "_snuba_result_cache"):
+            self.request_cache = request._snuba_result_cache
+        else:
+            self.request_cache = request._snuba_result_cache = {}
+
+    def get_key(self, query_params):
+        """
+        Returns the cache key of a query, or ``None`` if the query must not be
+        served from the cache.
+        """
+        if query_params.get("consistent"):
+            return None
+        if self.request_cache is None and not self.shared:
+            return None
+        return u"snuba:result:{}:{}".format(
+            self.referrer, md5_text(json.dumps(query_params, sort_keys=True)).hexdigest()
+        )
+
+    def get_ttl(self, query_params):
+        to_date = query_params.get("to_date")
+        settled = datetime.utcnow() - timedelta(
+            seconds=settings.SENTRY_SNUBA_RESULT_CACHE_SETTLE_TIME
+        )
+        if to_date is not None and parse_datetime(to_date) <= settled:
+            return settings.SENTRY_SNUBA_RESULT_CACHE_TTL
+        return settings.SENTRY_SNUBA_RESULT_CACHE_RECENT_TTL
+
+    def get(self, key):
+        if key is None:
+            return None
+
+        data = None
+        tier = "request"
+        if self.request_cache is not None:
+            data = self.request_cache.get(key)
+        if data is None and self.shared:
+            tier = "shared"
+            data = cache.get(key)
+            if data is not None and self.request_cache is not None:
+                self.request_cache[key] = data
+
+        metrics.incr(
+            "snuba.client.result_cache",
+            tags={
+                "referrer": self.referrer,
+                "result": "miss" if data is None else "hit",
+                "tier": tier,
+            },
+        )
+        return CachedResponse(200, data) if data is not None else None
+
+    def set(self, key, query_params, data):
+        if key is None:
+            return
+        if self.request_cache is not None:
+            self.request_cache[key] = data
+        if self.shared:
+            cache.set(key, data, self.get_ttl(query_params))
 
 
 epoch_naive = datetime(1970, 1, 1, tzinfo=None)
@@ -639,48 +830,40 @@ def bulk_raw_query(snuba_param_list, referrer=None):
         headers["referer"] = referrer
 
     query_param_list = map(_prepare_query_params, snuba_param_list)
-
-    def snuba_query(params):
-        query_params, forward, reverse, thread_hub = params
-        try:
-            with timer("snuba_query"):
-                referrer = headers.get("referer", "<unknown>")
-                if SNUBA_INFO:
-                    logger.info("{}.body: {}".format(referrer, json.dumps(query_params)))
-                    query_params["debug"] = True
-                body = json.dumps(query_params)
-                with thread_hub.start_span(
-                    op="snuba", description=u"query {}".format(referrer)
-                ) as span:
-                    span.set_tag("referrer", referrer)
-                    for param_key, param_data in six.iteritems(query_params):
-                        span.set_data(param_key, param_data)
-                    return (
-                        _snuba_pool.urlopen("POST", "/query", body=body, headers=headers),
-                        forward,
-                        reverse,
-                    )
-        except urllib3.exceptions.HTTPError as err:
-            raise SnubaError(err)
+    referrer = headers.get("referer", "<unknown>")
 
     with sentry_sdk.start_span(
         op="start_snuba_query",
         description=u"running {} snuba queries".format(len(snuba_param_list)),
     ) as span:
-        span.set_tag("referrer", headers.get("referer", "<unknown>"))
-        if len(snuba_param_list) > 1:
-            query_results = list(
-                _query_thread_pool.map(
-                    snuba_query, [params + (Hub(Hub.current),) for params in query_param_list]
+        span.set_tag("referrer", referrer)
+        with timer("snuba_query"):
+            result_cache = SnubaResultCache(referrer)
+            pending = []
+            for query_params, forward, reverse in query_param_list:
+                if SNUBA_INFO:
+                    logger.info("{}.body: {}".format(referrer, json.dumps(query_params)))
+                    query_params["debug"] = True
+                cache_key = result_cache.get_key(query_params)
+                response = result_cache.get(cache_key)
+                if response is None:
+                    body = json.dumps(query_params)
+                    response = _query_executor.submit(
+                        body, headers, Hub(Hub.current), span_data=query_params
+                    )
+                pending.append((response, query_params, cache_key, reverse))
+            query_results = [
+                (
+                    response.result() if isinstance(response, Future) else response,
+                    query_params,
+                    cache_key,
+                    reverse,
                 )
-            )
-        else:
-            # No need to submit to the thread pool if we're just performing a
-            # single query
-            query_results = [snuba_query(query_param_list[0] + (Hub(Hub.current),))]
+                for response, query_params, cache_key, reverse in pending
+            ]
 
     results = []
-    for response, _, reverse in query_results:
+    for response, query_params, cache_key, reverse in query_results:
         try:
             body = json.loads(response.data)
             if SNUBA_INFO:
@@ -716,6 +899,9 @@ def bulk_raw_query(snuba_param_list, referrer=None):
             else:
                 raise SnubaError(u"HTTP {}".format(response.status))
 
+        if not isinstance(response, CachedResponse):
+            result_cache.set(cache_key, query_params, response.data)
+
         # Forward and reverse translation maps from model ids to snuba keys, per column
         body["data"] = [reverse(d) for d in body["data"]]
         results.append(body)
@@ -10,6 +10,11 @@ import zlib
 from django.utils.encoding import force_text, smart_text
 from sentry.utils.compat import map
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 _word_sep_re = re.compile(r"[\s.;,_-]+", re.UNICODE)
 _camelcase_re = re.compile(r"(?:[A-Z]{2,}(?=[A-Z]))|(?:[A-Z][a-z0-9]+)|(?:[a-z0-9]+)")
 _letters_re = re.compile(r"[A-Z]+")
@@ -73,17 +78,30 @@ def truncatechars(value, arg, ellipsis="..."):
     return value
 
 
-def compress(value):
+# Values compressed with zstd instead of zlib carry this prefix (which is
+# never part of base64 encoded data.)
+ZSTD_PREFIX = u"zstd:"
+
+
+def compress(value, zstd=False):
     """
     Compresses a value for safe passage as a string.
 
     This returns a unicode string rather than bytes, as the Django ORM works
     with unicode objects.
+
+    If ``zstd`` is set, the value is compressed with zstd (which requires the
+    ``zstandard`` package) instead of zlib. ``decompress`` handles both.
     """
+    if zstd:
+        value = zstandard.ZstdCompressor().compress(value)
+        return ZSTD_PREFIX + base64.b64encode(value).decode("utf-8")
     return base64.b64encode(zlib.compress(value)).decode("utf-8")
 
 
 def decompress(value):
+    if isinstance(value, six.text_type) and value.startswith(ZSTD_PREFIX):
+        return zstandard.ZstdDecompressor().decompress(base64.b64decode(value[len(ZSTD_PREFIX) :]))
     return zlib.decompress(base64.b64decode(value))
 
 
@@ -334,3 +334,72 @@ def test_relay_disabled_project(
     assert http_cfg == {"disabled": True}
 
     assert projectconfig_cache_set == [{six.text_type(wrong_id): http_cfg}]
+
+
+@pytest.fixture
+def cached_configs(default_project, monkeypatch, settings):
+    settings.SENTRY_RELAY_PROJECTCONFIG_CACHE_READS = True
+    other_project = Project.objects.create(organization=default_project.organization)
+    cached_cfg = {
+        "projectId": default_project.id,
+        "organizationId": default_project.organization_id,
+        "disabled": False,
+    }
+    monkeypatch.setattr(
+        "sentry.relay.projectconfig_cache.get_many",
+        lambda keys: {
+            six.text_type(default_project.id): cached_cfg,
+            six.text_type(other_project.id): {"disabled": True},
+        },
+    )
+    return cached_cfg, other_project
+
+
+@pytest.mark.django_db
+def test_relay_projectconfig_cache_reused(
+    call_endpoint, default_project, projectconfig_cache_set, cached_configs
+):
+    """
+    Full configs already in the cache are served without computing them again.
+    """
+    cached_cfg, other_project = cached_configs
+
+    result, status_code = call_endpoint(
+        full_config=True,
+        projects=[six.text_type(default_project.id), six.text_type(other_project.id)],
+    )
+    assert status_code < 400
+
+    assert result["configs"][six.text_type(default_project.id)] == cached_cfg
+    # disabled configs are computed again
+    assert not result["configs"][six.text_type(other_project.id)]["disabled"]
+
+    (call,) = projectconfig_cache_set
+    assert list(call) == [six.text_type(other_project.id)]
+
+
+@pytest.mark.django_db
+def test_relay_projectconfig_cache_reads_disabled(
+    call_endpoint, default_project, projectconfig_cache_set, cached_configs, settings
+):
+    settings.SENTRY_RELAY_PROJECTCONFIG_CACHE_READS = False
+    cached_cfg, other_project = cached_configs
+
+    result, status_code = call_endpoint(full_config=True)
+    assert status_code < 400
+
+    assert result["configs"][six.text_type(default_project.id)] != cached_cfg
+    (call,) = projectconfig_cache_set
+    assert list(call) == [six.text_type(default_project.id)]
+
+
+@pytest.mark.django_db
+def test_relay_projectconfig_cache_checks_org_access(
+    call_endpoint, default_project, projectconfig_cache_set, cached_configs, monkeypatch
+):
+    monkeypatch.setattr(Relay, "has_org_access", lambda self, org: False)
+
+    result, status_code = call_endpoint(full_config=True)
+    assert status_code < 400
+
+    assert result["configs"][six.text_type(default_project.id)] == {"disabled": True}
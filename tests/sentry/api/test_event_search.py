@@ -29,6 +29,7 @@ from sentry.api.event_search import (
     SearchVisitor,
 )
 from sentry.testutils.cases import TestCase
+from sentry.utils.compat.mock import patch
 from sentry.testutils.helpers.datetime import before_now
 
 
@@ -296,6 +297,37 @@ class ParseSearchQueryTest(unittest.TestCase):
                 SearchFilter(key=SearchKey(name="random"), operator="=", value=SearchValue("-2w"))
             ]
 
+    def test_rel_time_filter_not_cached(self):
+        now = timezone.now()
+        with freeze_time(now):
+            parse_search_query("first_seen:-2w")
+        with freeze_time(now + timedelta(days=1)):
+            assert parse_search_query("first_seen:-2w") == [
+                SearchFilter(
+                    key=SearchKey(name="first_seen"),
+                    operator=">=",
+                    value=SearchValue(raw_value=now - timedelta(days=13)),
+                )
+            ]
+
+    def test_cached(self):
+        query = "user.email:foo@example.com release:1.2.1 hello"
+        terms = parse_search_query(query)
+
+        with patch(
+            "sentry.api.event_search.event_search_grammar", wraps=event_search_grammar
+        ) as grammar:
+            cached_terms = parse_search_query(query)
+            assert not grammar.parse.called
+
+            # the cache is separate per set of parser flags
+            parse_search_query(query, allow_boolean=False)
+            assert grammar.parse.called
+
+        assert cached_terms == terms
+        cached_terms.pop()
+        assert parse_search_query(query) == terms
+
     def test_invalid_date_formats(self):
         invalid_queries = ["first_seen:hello", "first_seen:123", "first_seen:2018-01-01T00:01ZZ"]
         for invalid_query in invalid_queries:
@@ -1,5 +1,7 @@
 from __future__ import absolute_import
 
+import six
+
 from datetime import timedelta
 from django.utils import timezone
 from unittest import TestCase as SimpleTestCase
@@ -11,6 +13,7 @@ from sentry.api.paginator import (
     OffsetPaginator,
     SequencePaginator,
     GenericOffsetPaginator,
+    KeysetPaginator,
     CombinedQuerysetIntermediary,
     CombinedQuerysetPaginator,
     reverse_bisect_left,
@@ -18,7 +21,7 @@ from sentry.api.paginator import (
 from sentry.models import User, Rule
 from sentry.incidents.models import AlertRule
 from sentry.testutils import TestCase, APITestCase
-from sentry.utils.cursors import Cursor
+from sentry.utils.cursors import Cursor, KeysetCursor
 
 
 class PaginatorTest(TestCase):
@@ -175,6 +178,68 @@ class OffsetPaginatorTest(TestCase):
             paginator.get_result()
 
 
+class KeysetPaginatorTest(TestCase):
+    def test_simple(self):
+        res1 = self.create_user("foo@example.com", name="b")
+        res2 = self.create_user("bar@example.com", name="a")
+        res3 = self.create_user("baz@example.com", name="b")
+        res4 = self.create_user("qux@example.com", name="a")
+
+        paginator = KeysetPaginator(User.objects.all(), order_by="name")
+        result1 = paginator.get_result(limit=2, cursor=None)
+        assert list(result1) == [res2, res4]
+        assert result1.next
+        assert not result1.prev
+
+        # Cursors survive the round trip through a request.
+        cursor = KeysetCursor.from_string(six.text_type(result1.next))
+        result2 = paginator.get_result(limit=2, cursor=cursor)
+        assert list(result2) == [res1, res3]
+        assert not result2.next
+        assert result2.prev
+
+        result3 = paginator.get_result(limit=1, cursor=result2.prev)
+        assert list(result3) == [res4]
+        assert result3.next
+        assert result3.prev
+
+        result4 = paginator.get_result(limit=1, cursor=result3.next)
+        assert list(result4) == [res1]
+
+    def test_descending(self):
+        res1 = self.create_user("foo@example.com", name="b")
+        res2 = self.create_user("bar@example.com", name="a")
+        res3 = self.create_user("baz@example.com", name="b")
+
+        paginator = KeysetPaginator(User.objects.all(), order_by=["-name"])
+        result1 = paginator.get_result(limit=1, cursor=None)
+        assert list(result1) == [res3]
+
+        result2 = paginator.get_result(limit=5, cursor=result1.next)
+        assert list(result2) == [res1, res2]
+        assert not result2.next
+
+        result3 = paginator.get_result(limit=5, cursor=result2.prev)
+        assert list(result3) == [res3]
+        assert not result3.prev
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(User.objects.all(), order_by="date_joined")
+        with self.assertRaises(BadPaginationError):
+            paginator.get_result(cursor=KeysetCursor(["foo", 1]))
+        with self.assertRaises(BadPaginationError):
+            paginator.get_result(cursor=KeysetCursor([1]))
+        with self.assertRaises(ValueError):
+            KeysetCursor.from_string("foo:0:0")
+        with self.assertRaises(ValueError):
+            KeysetCursor.from_string(u"\xe9t\xe9:0:0")
+
+    def test_cursor_round_trip(self):
+        cursor = KeysetCursor([u"\xe9t\xe9", 1], offset=2, is_prev=True)
+        parsed = KeysetCursor.from_string(six.text_type(cursor))
+        assert (parsed.value, parsed.offset, parsed.is_prev) == ([u"\xe9t\xe9", 1], 2, True)
+
+
 class DateTimePaginatorTest(TestCase):
     def test_ascending(self):
         joined = timezone.now()
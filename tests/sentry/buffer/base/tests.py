@@ -7,6 +7,7 @@ from sentry.utils.compat import mock
 from datetime import timedelta
 from django.utils import timezone
 from sentry.buffer.base import Buffer
+from sentry.db.models.query import bulk_increment
 from sentry.models import Group, Organization, Project, Release, ReleaseProject, Team
 from sentry.testutils import TestCase
 
@@ -76,3 +77,55 @@ class BufferTest(TestCase):
         self.buf.process(Group, columns, filters, {"last_seen": the_date}, signal_only=True)
         group.refresh_from_db()
         assert group.times_seen == prev_times_seen
+
+    def test_process_batch_bulk_update(self):
+        self.buf.bulk_update = True
+        project = self.create_project()
+        groups = [self.create_group(project=project) for _ in range(3)]
+        the_date = timezone.now() + timedelta(days=5)
+        batch = [
+            ({"times_seen": i + 1}, {"id": group.id}, {"last_seen": the_date}, None)
+            for i, group in enumerate(groups)
+        ]
+        # Rows that are not identified by their primary key are processed one by one.
+        filters = {"message": "foo bar", "project_id": project.id}
+        batch.append(({"times_seen": 1}, filters, None, None))
+
+        with mock.patch(
+            "sentry.buffer.base.bulk_increment", wraps=bulk_increment
+        ) as bulk_increment_mock:
+            self.buf.process_batch(Group, batch)
+        assert bulk_increment_mock.call_count == 1
+
+        for i, group in enumerate(groups):
+            group_ = Group.objects.get(id=group.id)
+            assert group_.times_seen == group.times_seen + i + 1
+            assert group_.last_seen == the_date
+            assert group_.score != group.score
+
+        assert Group.objects.get(message="foo bar").times_seen == 2
+
+    @mock.patch("sentry.buffer.base.buffer_incr_complete")
+    def test_process_batch_failing_row(self, buffer_incr_complete):
+        group = self.create_group()
+        # The group was deleted, so creating it in its place fails.
+        deleted = ({"times_seen": 1}, {"id": group.id + 1000}, None, None)
+        batch = [deleted, ({"times_seen": 1}, {"id": group.id}, None, None)]
+
+        with self.capture_on_commit_callbacks() as callbacks:
+            assert self.buf.process_batch(Group, batch) == [deleted]
+            assert buffer_incr_complete.send_robust.call_count == 0
+
+        assert Group.objects.get(id=group.id).times_seen == group.times_seen + 1
+
+        # Signals are sent once the rows are committed.
+        assert len(callbacks) == 1
+        callbacks[0]()
+        buffer_incr_complete.send_robust.assert_called_once_with(
+            model=Group,
+            columns={"times_seen": 1},
+            filters={"id": group.id},
+            extra=None,
+            created=False,
+            sender=Group,
+        )
@@ -49,6 +49,38 @@ class RedisBufferTest(TestCase):
         client = self.buf.cluster.get_routing_client()
         assert client.zrange("b:p", 0, -1) == []
 
+    @mock.patch("sentry.buffer.redis.process_incr")
+    def test_process_pending_groups_models(self, process_incr):
+        self.buf.incr_batch_size = 2
+        with self.buf.cluster.map() as client:
+            client.zadd("b:p", {"b:k:a:1": 1, "b:k:b:1": 2, "b:k:a:2": 3, "b:k:b:2": 4})
+        self.buf.process_pending()
+        assert process_incr.apply_async.mock_calls == [
+            mock.call(kwargs={"batch_keys": ["b:k:a:1", "b:k:a:2"]}),
+            mock.call(kwargs={"batch_keys": ["b:k:b:1", "b:k:b:2"]}),
+        ]
+
+    @mock.patch("sentry.buffer.redis.process_incr")
+    @mock.patch("sentry.buffer.redis.metrics")
+    def test_process_pending_max_pending_keys(self, metrics, process_incr):
+        self.buf.incr_batch_size = 5
+        self.buf.max_pending_keys = 2
+        with self.buf.cluster.map() as client:
+            client.zadd("b:p", {"foo": 1, "bar": 2, "baz": 3})
+
+        with mock.patch("sentry.buffer.redis.time", mock.Mock(return_value=11)):
+            self.buf.process_pending()
+        process_incr.apply_async.assert_called_once_with(kwargs={"batch_keys": ["foo", "bar"]})
+        metrics.timing.assert_any_call(
+            "buffer.pending-partition-size", 3, tags={"partition": "None"}
+        )
+        metrics.timing.assert_any_call(
+            "buffer.pending-partition-lag", 10, tags={"partition": "None"}
+        )
+
+        client = self.buf.cluster.get_routing_client()
+        assert client.zrange("b:p", 0, -1) == [b"baz"]
+
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     @mock.patch("sentry.buffer.base.Buffer.process")
     def test_process_does_bubble_up_json(self, process):
@@ -70,6 +102,65 @@ class RedisBufferTest(TestCase):
         self.buf.process("foo")
         process.assert_called_once_with(Group, columns, filters, extra, signal_only)
 
+    @mock.patch("sentry.buffer.base.Buffer.process_batch", return_value=[])
+    def test_process_bulk_update(self, process_batch):
+        self.buf.bulk_update = True
+        client = self.buf.cluster.get_routing_client()
+        for key, pk in (("foo", "1"), ("bar", "2")):
+            client.hmset(
+                key,
+                {"f": '{"pk": ["i","%s"]}' % pk, "i+times_seen": "2", "m": "sentry.models.Group"},
+            )
+        self.buf.process(batch_keys=["foo", "bar", "baz"])
+        process_batch.assert_called_once_with(
+            Group,
+            [({"times_seen": 2}, {"pk": 1}, {}, None), ({"times_seen": 2}, {"pk": 2}, {}, None)],
+        )
+        assert client.keys("l:*") == []
+
+    @mock.patch("sentry.buffer.base.Buffer.process_batch")
+    def test_process_bulk_update_requeues_on_failure(self, process_batch):
+        self.buf.bulk_update = True
+        group = self.create_group()
+        self.buf.incr(Group, {"times_seen": 2}, {"pk": group.id}, {"message": "foo"})
+        key = self.buf._make_key(Group, {"pk": group.id})
+
+        def fail(model, batch):
+            # buffered while the batch is processed
+            self.buf.incr(Group, {"times_seen": 1}, {"pk": group.id}, {"message": "bar"})
+            raise Exception("boom")
+
+        process_batch.side_effect = fail
+        self.buf.process(batch_keys=[key])
+
+        # the failed increment is added back without overwriting newer values
+        process_batch.side_effect = None
+        process_batch.return_value = []
+        self.buf.process(batch_keys=[key])
+        process_batch.assert_called_with(
+            Group, [({"times_seen": 3}, {"pk": group.id}, {"message": "bar"}, None)]
+        )
+
+    @mock.patch("sentry.buffer.base.Buffer.process_batch")
+    def test_process_bulk_update_drops_after_max_attempts(self, process_batch):
+        self.buf.bulk_update = True
+        self.buf.max_process_attempts = 2
+        groups = [self.create_group() for _ in range(2)]
+        keys = [self.buf._make_key(Group, {"pk": group.id}) for group in groups]
+        for group in groups:
+            self.buf.incr(Group, {"times_seen": 1}, {"pk": group.id})
+
+        # only the rows that failed are buffered again
+        process_batch.side_effect = lambda model, batch: batch[:1]
+        self.buf.process(batch_keys=keys)
+        client = self.buf.cluster.get_routing_client()
+        assert client.hget(keys[0], "r") == b"1"
+        assert not client.exists(keys[1])
+
+        # and dropped once they failed max_process_attempts times
+        self.buf.process(batch_keys=keys)
+        assert not client.exists(keys[0])
+
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     @mock.patch("sentry.buffer.base.Buffer.process")
     def test_process_does_bubble_up_pickle(self, process):
@@ -125,6 +216,15 @@ class RedisBufferTest(TestCase):
         pending = client.zrange("b:p", 0, -1)
         assert pending == [b"foo"]
 
+    def test_incr_keeps_first_pending_time(self):
+        client = self.buf.cluster.get_routing_client()
+        key = self.buf._make_key(Group, {"pk": 1})
+        for now in (1, 2):
+            with mock.patch("sentry.buffer.redis.time", mock.Mock(return_value=now)):
+                self.buf.incr(Group, {"times_seen": 1}, {"pk": 1})
+
+        assert client.zscore("b:p", key) == 1
+
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     @mock.patch("sentry.buffer.redis.process_incr")
     @mock.patch("sentry.buffer.redis.process_pending")
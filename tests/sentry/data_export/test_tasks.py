@@ -1,9 +1,12 @@
 from __future__ import absolute_import
 
+import gzip
+import six
+
 from django.db import IntegrityError
 from sentry.data_export.base import ExportQueryType
-from sentry.data_export.models import ExportedData
-from sentry.data_export.tasks import assemble_download, merge_export_blobs
+from sentry.data_export.models import ExportedData, ExportedDataBlob
+from sentry.data_export.tasks import ExportBlobWriter, assemble_download, merge_export_blobs
 from sentry.models import File
 from sentry.snuba.discover import InvalidSearchQuery
 from sentry.testutils import TestCase, SnubaTestCase
@@ -548,6 +551,61 @@ class AssembleDownloadTest(TestCase, SnubaTestCase):
         assert error == "Failed to save the assembled file."
 
 
+class ExportBlobWriterTest(TestCase):
+    def setUp(self):
+        super(ExportBlobWriterTest, self).setUp()
+        self.data_export = ExportedData.objects.create(
+            user=self.create_user(),
+            organization=self.create_organization(),
+            query_type=ExportQueryType.DISCOVER,
+            query_info={},
+        )
+
+    def get_blobs(self):
+        return [
+            (export_blob.offset, export_blob.blob.getfile().read())
+            for export_blob in ExportedDataBlob.objects.filter(
+                data_export=self.data_export
+            ).order_by("offset")
+        ]
+
+    def test_write(self):
+        writer = ExportBlobWriter(self.data_export, 10, blob_size=4)
+        writer.write(b"abc")
+        assert self.get_blobs() == []
+        writer.write(b"defghij")
+        assert writer.tell() == 10
+        writer.close()
+
+        assert writer.bytes_written == 10
+        assert not writer.is_full
+        assert self.get_blobs() == [(10, b"abcd"), (14, b"efgh"), (18, b"ij")]
+
+    @patch("sentry.data_export.tasks.MAX_FILE_SIZE", 6)
+    def test_full(self):
+        writer = ExportBlobWriter(self.data_export, 0, blob_size=4)
+        writer.write(b"abcdefghij")
+        assert writer.is_full
+        writer.write(b"klm")
+        writer.close()
+
+        assert self.get_blobs() == [(0, b"abcd"), (4, b"efgh")]
+
+    def test_delete_blobs(self):
+        writer = ExportBlobWriter(self.data_export, 0, blob_size=4)
+        writer.write(b"abcdef")
+        writer.close()
+
+        # a batch that fails after storing some of its blobs
+        writer = ExportBlobWriter(self.data_export, 6, blob_size=4)
+        writer.write(b"ghijk")
+        assert self.get_blobs() == [(0, b"abcd"), (4, b"ef"), (6, b"ghij")]
+        writer.delete_blobs()
+
+        assert writer.bytes_written == 0
+        assert self.get_blobs() == [(0, b"abcd"), (4, b"ef")]
+
+
 class AssembleDownloadLargeTest(TestCase, SnubaTestCase):
     def setUp(self):
         super(AssembleDownloadLargeTest, self).setUp()
@@ -592,6 +650,59 @@ class AssembleDownloadLargeTest(TestCase, SnubaTestCase):
 
         assert emailer.called
 
+    @patch("sentry.data_export.models.ExportedData.email_success")
+    def test_discover_cursor(self, emailer):
+        de = ExportedData.objects.create(
+            user=self.user,
+            organization=self.org,
+            query_type=ExportQueryType.DISCOVER,
+            query_info={
+                "project": [self.project.id],
+                "field": ["transaction"],
+                "query": "event.type:transaction",
+            },
+        )
+        with self.tasks():
+            assemble_download(de.id, batch_size=7)
+        de = ExportedData.objects.get(id=de.id)
+        assert de.file.headers == {"Content-Type": "text/csv"}
+
+        header, rows = de.file.getfile().read().strip().split(b"\r\n", 1)
+        assert header == b"transaction"
+        # every event is exported exactly once, newest first
+        assert rows.split(b"\r\n") == [
+            "/event/{0:03d}/".format(i).encode("utf-8") for i in range(50)
+        ]
+
+        assert emailer.called
+
+    @patch("sentry.data_export.tasks.MAX_BATCH_SIZE", 200)
+    @patch("sentry.data_export.models.ExportedData.email_success")
+    def test_discover_gzip(self, emailer):
+        de = ExportedData.objects.create(
+            user=self.user,
+            organization=self.org,
+            query_type=ExportQueryType.DISCOVER,
+            query_info={
+                "project": [self.project.id],
+                "field": ["transaction"],
+                "query": "event.type:transaction",
+            },
+        )
+        with self.tasks():
+            assemble_download(de.id, batch_size=7, compression="gzip")
+        de = ExportedData.objects.get(id=de.id)
+        assert de.file.name.endswith(".csv.gz")
+        assert de.file.headers == {"Content-Type": "application/gzip"}
+
+        # every batch is a gzip member of its own
+        with gzip.GzipFile(fileobj=six.BytesIO(de.file.getfile().read())) as f:
+            header, rows = f.read().strip().split(b"\r\n", 1)
+        assert header == b"transaction"
+        assert len(rows.split(b"\r\n")) == 50
+
+        assert emailer.called
+
 
 class MergeExportBlobsTest(TestCase, SnubaTestCase):
     def test_task_persistent_name(self):
@@ -0,0 +1,27 @@
+from __future__ import absolute_import
+
+from sentry.db.models.query import bulk_increment
+from sentry.models import Group
+from sentry.testutils import TestCase
+
+
+class BulkIncrementTestCase(TestCase):
+    def test_bulk_increment(self):
+        groups = [self.create_group(times_seen=1) for _ in range(2)]
+        missing_id = groups[-1].id + 1000
+
+        updated = bulk_increment(
+            Group,
+            {
+                groups[0].id: ({"times_seen": 2}, {"message": "foo"}),
+                groups[1].id: ({"times_seen": 5}, {"message": "bar"}),
+                missing_id: ({"times_seen": 1}, {"message": "baz"}),
+            },
+        )
+
+        assert updated == {groups[0].id, groups[1].id}
+        assert [
+            (group.times_seen, group.message)
+            for group in Group.objects.filter(id__in=[g.id for g in groups]).order_by("id")
+        ] == [(3, "foo"), (6, "bar")]
+        assert not Group.objects.filter(id=missing_id).exists()
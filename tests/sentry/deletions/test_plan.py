@@ -0,0 +1,88 @@
+from __future__ import absolute_import
+
+from sentry.deletions import (
+    BulkModelDeletionTask,
+    ModelDeletionTask,
+    ModelRelation,
+    default_manager,
+)
+from sentry.deletions.plan import DeletionPlan
+from sentry.models import Group, GroupAssignee, GroupHash, GroupMeta, Project, ProjectKey
+from sentry.testutils import TestCase
+
+
+class DeletionPlanTest(TestCase):
+    def get_relations(self, project):
+        return [
+            ModelRelation(GroupHash, {"project_id": project.id}, BulkModelDeletionTask),
+            ModelRelation(GroupAssignee, {"project_id": project.id}),
+            ModelRelation(GroupMeta, {"group__project": project.id}, ModelDeletionTask),
+            ModelRelation(ProjectKey, {"project_id": project.id}),
+            ModelRelation(Group, {"project_id": project.id}, BulkModelDeletionTask),
+        ]
+
+    def test_stages(self):
+        plan = DeletionPlan(default_manager, self.get_relations(self.project))
+
+        assert [[(step.model, step.kind) for step in stage] for stage in plan.stages] == [
+            [(GroupHash, "bulk"), (GroupAssignee, "bulk")],
+            [(GroupMeta, "objects")],
+            # GroupHash references Group, but is not part of the same stage
+            [(ProjectKey, "bulk"), (Group, "bulk")],
+        ]
+
+    def test_stages_split_on_references(self):
+        plan = DeletionPlan(
+            default_manager,
+            [
+                ModelRelation(GroupHash, {"project_id": self.project.id}),
+                ModelRelation(Group, {"project_id": self.project.id}, BulkModelDeletionTask),
+                ModelRelation(Project, {"id": self.project.id}, BulkModelDeletionTask),
+            ],
+        )
+
+        assert [[step.model for step in stage] for stage in plan.stages] == [
+            [GroupHash],
+            [Group],
+            [Project],
+        ]
+
+    def test_dry_run(self):
+        group = self.create_group()
+        GroupHash.objects.create(project=self.project, group=group, hash="a" * 32)
+        GroupMeta.objects.create(group=group, key="foo", value="bar")
+
+        plan = DeletionPlan(default_manager, self.get_relations(self.project))
+        plan.execute(dry_run=True)
+
+        assert all(step.estimated_rows is not None for step in plan.steps)
+        assert not any(step.finished for step in plan.steps)
+        assert len(plan.describe()) == 5
+        assert plan.describe()[0].startswith(
+            '1. [bulk] GroupHash {"project_id": %d}, ~' % self.project.id
+        )
+        assert GroupHash.objects.filter(group=group).exists()
+        assert GroupMeta.objects.filter(group=group).exists()
+        assert Group.objects.filter(id=group.id).exists()
+
+    def test_execute(self):
+        group = self.create_group()
+        GroupHash.objects.create(project=self.project, group=group, hash="a" * 32)
+        GroupHash.objects.create(project=self.project, group=group, hash="b" * 32)
+        GroupMeta.objects.create(group=group, key="foo", value="bar")
+        other_group = self.create_group(project=self.create_project())
+
+        progress = []
+        plan = DeletionPlan(
+            default_manager, self.get_relations(self.project), progress=progress.append
+        )
+        plan.execute()
+
+        assert all(step.finished for step in plan.steps)
+        assert plan.steps[0].rows_deleted == 2
+        assert plan.steps[0] in progress
+        assert "2 deleted, done" in plan.describe()[0]
+        assert not GroupHash.objects.filter(group=group).exists()
+        assert not GroupMeta.objects.filter(group=group).exists()
+        assert not Group.objects.filter(id=group.id).exists()
+        assert Group.objects.filter(id=other_group.id).exists()
@@ -21,6 +21,7 @@ from sentry.event_manager import (
     EventManager,
     EventUser,
     has_pending_commit_resolution,
+    _find_hashes,
 )
 from sentry.grouping.utils import hash_from_values
 from sentry.models import (
@@ -1268,6 +1269,20 @@ class EventManagerTest(TestCase):
         hashes = [gh.hash for gh in GroupHash.objects.filter(group=event.group)]
         assert sorted(hashes) == sorted([hash_from_values(checksum), checksum])
 
+    def test_find_hashes_preserves_order(self):
+        existing = GroupHash.objects.create(project=self.project, hash="b" * 32)
+
+        hashes = _find_hashes(self.project, ["a" * 32, "b" * 32, "c" * 32])
+        assert [h.hash for h in hashes] == ["a" * 32, "b" * 32, "c" * 32]
+        assert hashes[1].id == existing.id
+        assert all(h.id is not None for h in hashes)
+
+        assert [h.id for h in _find_hashes(self.project, ["c" * 32, "a" * 32])] == [
+            hashes[2].id,
+            hashes[0].id,
+        ]
+        assert GroupHash.objects.filter(project=self.project).count() == 3
+
     def test_legacy_attributes_moved(self):
         event = make_event(
             release="my-release",
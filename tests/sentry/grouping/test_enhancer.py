@@ -47,6 +47,15 @@ family:native                                   max-frames=3
     assert isinstance(dumped, six.string_types)
 
 
+def test_loads_memoized():
+    dumped = Enhancements.from_config_string("path:*/foo.js -app").dumps()
+
+    # Events with the same config share the loaded and compiled enhancements.
+    enhancements = Enhancements.loads(dumped)
+    assert Enhancements.loads(dumped) is enhancements
+    assert Enhancements.loads(dumped).compile() is enhancements.compile()
+
+
 def test_parsing_errors():
     with pytest.raises(InvalidEnhancerConfig):
         Enhancements.from_config_string("invalid.message:foo -> bar")
@@ -205,3 +214,55 @@ def test_package_matching():
     assert not bool(
         bundled_rule.get_matching_frame_actions({"package": "/usr/lib/linux-gate.so"}, "native")
     )
+
+
+def test_compiled_matching_agrees_with_rules():
+    enhancement = Enhancements.from_config_string(
+        """
+        family:native package:/var/**/Frameworks/**                  -app
+        family:native function:std::*                                -app
+        family:javascript path:**/test.js                            +app
+        family:javascript path:**/node_modules/**                    -app
+        family:javascript app:yes module:foo.*                       -group
+        !function:main                                               v-group
+    """
+    )
+    frames = [
+        {"package": "/var/containers/MyApp/Frameworks/libsomething", "function": "main"},
+        {"function": "std::whatever", "package": "/usr/lib/libc.so"},
+        {"abs_path": "http://example.com/foo/TEST.js", "platform": "javascript"},
+        {"abs_path": "C:\\app\\node_modules\\lib.js", "platform": "javascript"},
+        {"module": "foo.bar", "in_app": True, "platform": "javascript"},
+        # ``**/`` also matches bare file names
+        {"filename": "test.js", "platform": "javascript"},
+        {"abs_path": "node_modules/lib.js", "platform": "javascript"},
+    ]
+
+    expected = []
+    for rule in enhancement.iter_rules():
+        for idx, frame in enumerate(frames):
+            if rule.get_matching_frame_actions(frame, "native"):
+                expected.append((idx, rule))
+
+    compiled = enhancement.compile()
+    assert enhancement.compile() is compiled
+    assert [
+        (idx, compiled_rule.rule)
+        for idx, compiled_rule in compiled.iter_matching_rules(frames, "native")
+    ] == expected
+
+
+def test_compiled_family_bucketing():
+    enhancement = Enhancements.from_config_string(
+        """
+        family:native function:std::*                  -app
+        family:javascript function:*                   -app
+    """
+    )
+    native_rule, js_rule = enhancement.compile().rules
+    assert native_rule.families == frozenset(["native"])
+    assert js_rule.families == frozenset(["javascript"])
+
+    frames = [{"function": "std::whatever"}, {"function": "foo"}]
+    matches = list(enhancement.compile().iter_matching_rules(frames, "javascript"))
+    assert [(idx, rule.rule) for idx, rule in matches] == [(0, js_rule.rule), (1, js_rule.rule)]
@@ -4,10 +4,11 @@ import pytest
 
 from sentry.grouping.component import GroupingComponent
 from sentry.grouping.strategies.configurations import CONFIGURATIONS
-from sentry.grouping.api import get_default_grouping_config_dict
+from sentry.grouping.api import _variants_cache, get_default_grouping_config_dict
 from sentry.utils import json
+from sentry.utils.safe import get_path
 
-from tests.sentry.grouping import with_grouping_input
+from tests.sentry.grouping import GroupingInput, with_grouping_input
 
 
 def dump_variant(variant, lines=None, indent=0):
@@ -68,3 +69,25 @@ def test_event_hash_variant(config_name, grouping_input, insta_snapshot, log):
     assert evt.get_grouping_config() == grouping_config
 
     insta_snapshot(output)
+
+
+def test_grouping_variants_cache():
+    _variants_cache.clear()
+    grouping_config = get_default_grouping_config_dict()
+    evt1 = GroupingInput("actix.json").create_event(grouping_config)
+    evt2 = GroupingInput("actix.json").create_event(grouping_config)
+    evt1.project = evt2.project = None
+
+    # Local variables are not considered for grouping
+    for frame in get_path(evt2.data, "exception", "values", 0, "stacktrace", "frames"):
+        frame["vars"] = {"foo": "bar"}
+
+    variants1 = evt1.get_grouping_variants()
+    assert len(_variants_cache) == 1
+    variants2 = evt2.get_grouping_variants()
+    assert len(_variants_cache) == 1
+
+    assert sorted(variants1) == sorted(variants2)
+    for key, variant in variants1.items():
+        assert variant.get_hash() == variants2[key].get_hash()
+        assert variant.component is not variants2[key].component
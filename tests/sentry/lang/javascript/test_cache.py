@@ -1,6 +1,9 @@
 from __future__ import absolute_import
 
-from sentry.lang.javascript.cache import SourceCache
+from sentry.lang.javascript import cache as cache_module
+from sentry.lang.javascript.cache import SourceCache, get_cached_view
+from sentry.utils.compat import mock
+from sentry.utils.datastructures import LRUCache
 from unittest import TestCase
 
 
@@ -38,3 +41,32 @@ class BasicCacheTest(TestCase):
         # fall back to utf-8
         cache.add(url, "foobar".encode("utf-32"), encoding="utf-32")
         assert cache.get(url)[0] == u"foobar"
+
+
+class ViewCacheTest(TestCase):
+    def test_shared_between_caches(self):
+        view_cache = LRUCache(max_size=10, get_size=lambda item: item[1])
+        url = "http://example.com/foo.js"
+
+        with mock.patch.object(cache_module, "_view_cache", view_cache):
+            first = SourceCache()
+            first.add(url, b"foo\nbar")
+            second = SourceCache()
+            second.add(url + "x", b"foo\nbar")
+
+        assert second.get(url + "x") is first.get(url)
+
+    def test_keyed_by_contents(self):
+        view_cache = LRUCache(max_size=10, get_size=lambda item: item[1])
+        factory = mock.Mock(side_effect=lambda body: object())
+
+        with mock.patch.object(cache_module, "_view_cache", view_cache):
+            view = get_cached_view("sourcemap", b"abc", factory)
+            assert get_cached_view("sourcemap", b"abc", factory) is view
+            assert get_cached_view("source", b"abc", factory) is not view
+            assert get_cached_view("sourcemap", b"abd", factory) is not view
+            assert factory.call_count == 3
+
+            # evicts the least recently used views by size of the contents
+            get_cached_view("sourcemap", b"abcdefgh", factory)
+            assert get_cached_view("sourcemap", b"abc", factory) is not view
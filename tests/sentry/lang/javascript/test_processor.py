@@ -4,6 +4,7 @@ import pytest
 import re
 import responses
 import six
+import threading
 import unittest
 from symbolic import SourceMapTokenMatch
 
@@ -20,6 +21,7 @@ from sentry.lang.javascript.processor import (
     generate_module,
     trim_line,
     fetch_release_file,
+    prefetch_release_files,
     UnparseableSourcemap,
     get_max_age,
     CACHE_CONTROL_MAX,
@@ -214,6 +216,56 @@ class FetchReleaseFileTest(TestCase):
 
         assert result == new_result
 
+    def test_prefetch(self):
+        project = self.project
+        release = Release.objects.create(organization_id=project.organization_id, version="abc")
+        release.add_project(project)
+
+        for name in ("~/foo.min.js", "bar.min.js"):
+            file = File.objects.create(
+                name=name, type="release.file", headers={"Content-Type": "application/json"}
+            )
+            file.putfile(six.BytesIO(name.encode("utf-8")))
+            ReleaseFile.objects.create(
+                name=name, release=release, organization_id=project.organization_id, file=file
+            )
+
+        # cache a negative lookup for a file that has been uploaded since
+        assert fetch_release_file("baz.min.js", release) is None
+        file = File.objects.create(name="baz.min.js", type="release.file", headers={})
+        file.putfile(six.BytesIO(b"baz"))
+        ReleaseFile.objects.create(
+            name="baz.min.js", release=release, organization_id=project.organization_id, file=file
+        )
+
+        filenames = ["http://example.com/foo.min.js", "bar.min.js", "baz.min.js", "missing.js"]
+        with self.assertNumQueries(1):
+            prefetched = prefetch_release_files(filenames, release)
+
+        assert prefetched["baz.min.js"] == (-1, None)
+        assert prefetched["missing.js"] == (None, [])
+        assert [rf.name for rf in prefetched["bar.min.js"][1]] == ["bar.min.js"]
+
+        result = fetch_release_file(
+            "http://example.com/foo.min.js",
+            release,
+            prefetched=prefetched["http://example.com/foo.min.js"],
+        )
+        assert result.body == b"~/foo.min.js"
+        assert (
+            fetch_release_file("baz.min.js", release, prefetched=prefetched["baz.min.js"]) is None
+        )
+        assert (
+            fetch_release_file("missing.js", release, prefetched=prefetched["missing.js"]) is None
+        )
+
+        # the results of the prefetched lookups are cached like any others
+        prefetched = prefetch_release_files(filenames, release)
+        assert prefetched["http://example.com/foo.min.js"][0][0] == {
+            "content-type": "application/json"
+        }
+        assert prefetched["missing.js"] == (-1, None)
+
 
 class FetchFileTest(TestCase):
     @responses.activate
@@ -929,3 +981,79 @@ class CacheSourceTest(TestCase):
         # now we have an error
         assert len(processor.cache.get_errors(abs_path)) == 1
         assert processor.cache.get_errors(abs_path)[0] == {"url": map_url, "type": "js_no_source"}
+
+    @responses.activate
+    def test_cache_sources_concurrently(self):
+        project = self.create_project()
+        processor = JavaScriptStacktraceProcessor(data={}, stacktrace_infos=None, project=project)
+
+        responses.add(
+            responses.GET,
+            "http://example.com/a.js",
+            body=b"a\n//# sourceMappingURL=shared.js.map",
+            content_type="application/javascript",
+        )
+        responses.add(
+            responses.GET,
+            "http://example.com/b.js",
+            body=b"b\n//# sourceMappingURL=shared.js.map",
+            content_type="application/javascript",
+        )
+        responses.add(
+            responses.GET,
+            "http://example.com/shared.js.map",
+            body=b'{"version": 3, "sources": ["a.ts"], "sourcesContent": ["A"], "mappings": "AAAA"}',
+            content_type="application/json",
+        )
+
+        filenames = ["http://example.com/a.js", "http://example.com/b.js", "app:///missing.js"]
+        processor.max_fetches = 2
+        with self.settings(SENTRY_JS_FETCH_CONCURRENCY=4):
+            processor.cache_sources(filenames)
+
+        assert processor.cache.get("http://example.com/a.js")[0] == u"a"
+        assert processor.cache.get("http://example.com/b.js")[0] == u"b"
+        assert processor.cache.get_errors("app:///missing.js") == [
+            {"type": EventError.JS_TOO_MANY_REMOTE_SOURCES}
+        ]
+
+        # the shared sourcemap is only fetched once, along with its inlined source
+        map_calls = [c for c in responses.calls if c.request.url.endswith(".map")]
+        assert len(map_calls) == 1
+        sourcemap_url, sourcemap_view = processor.sourcemaps.get_link("http://example.com/b.js")
+        assert sourcemap_url == "http://example.com/shared.js.map"
+        assert sourcemap_view is not None
+        assert processor.cache.get("http://example.com/a.ts")[0] == u"A"
+
+    def test_fetch_files_concurrently(self):
+        processor = JavaScriptStacktraceProcessor(
+            data={}, stacktrace_infos=None, project=self.create_project()
+        )
+        urls = ["http://example.com/%d.js" % i for i in range(4)] + ["http://other.com/x.js"]
+
+        lock = threading.Lock()
+        started = []
+        threads = set()
+        concurrent = threading.Event()
+
+        def fetch_func(url, domain_lock=None, **kwargs):
+            assert domain_lock is not None
+            with lock:
+                started.append(url)
+                threads.add(threading.current_thread().ident)
+                if len(started) == 2:
+                    concurrent.set()
+            # the first fetch only finishes once another one has started
+            concurrent.wait(5)
+            if url.startswith("http://other.com/"):
+                raise http.BadSource({"type": EventError.JS_GENERIC_FETCH_ERROR})
+            return url.upper()
+
+        with self.settings(SENTRY_JS_FETCH_CONCURRENCY=2):
+            results = list(processor.fetch_files(fetch_func, urls))
+
+        assert concurrent.is_set()
+        assert len(threads) == 2
+        assert [url for url, result in results] == urls
+        assert [result for url, result in results[:-1]] == [url.upper() for url in urls[:-1]]
+        assert isinstance(results[-1][1], http.BadSource)
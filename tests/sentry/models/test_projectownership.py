@@ -1,5 +1,7 @@
 from __future__ import absolute_import
 
+from django.utils import timezone
+
 from sentry.testutils import TestCase
 from sentry.api.fields.actor import Actor
 from sentry.models import ProjectOwnership, User, Team
@@ -79,6 +81,22 @@ class ProjectOwnershipTestCase(TestCase):
             ([Actor(self.team.id, Team), Actor(self.user.id, User)], [rule_a, rule_b]),
         )
 
+    def test_get_compiled_rules_cached_by_version(self):
+        rule_a = Rule(Matcher("path", "*.py"), [Owner("team", self.team.slug)])
+        rule_b = Rule(Matcher("path", "src/*"), [Owner("user", self.user.email)])
+        ownership = ProjectOwnership.objects.create(
+            project_id=self.project.id, schema=dump_schema([rule_a])
+        )
+
+        compiled = ProjectOwnership.get_compiled_rules(ownership)
+        assert compiled.rules == [rule_a]
+        assert ProjectOwnership.get_compiled_rules(ownership) is compiled
+
+        ownership.schema = dump_schema([rule_a, rule_b])
+        ownership.last_updated = timezone.now()
+        ownership.save()
+        assert ProjectOwnership.get_compiled_rules(ownership).rules == [rule_a, rule_b]
+
 
 class ResolveActorsTestCase(TestCase):
     def test_no_actors(self):
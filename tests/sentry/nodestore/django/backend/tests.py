@@ -2,13 +2,17 @@
 
 from __future__ import absolute_import
 
+import pytest
+
 from datetime import timedelta
+from django.test import override_settings
 from django.utils import timezone
 
 from sentry.nodestore.django.models import Node
 from sentry.nodestore.django.backend import DjangoNodeStorage
 from sentry.testutils import TestCase
 from sentry.utils.compat import mock
+from sentry.utils.strings import zstandard, ZSTD_PREFIX
 
 
 class DjangoNodeStorageTest(TestCase):
@@ -46,6 +50,29 @@ class DjangoNodeStorageTest(TestCase):
         assert Node.objects.get(id="d2502ebbd7df41ceba8d3275595cac33").data == {"foo": "bar"}
         assert Node.objects.get(id="5394aa025b8e401ca6bc3ddee3130edc").data == {"foo": "baz"}
 
+    def test_set_multi_updates(self):
+        Node.objects.create(id="d2502ebbd7df41ceba8d3275595cac33", data={"foo": "bar"})
+        self.ns.set_multi(
+            {
+                "d2502ebbd7df41ceba8d3275595cac33": {"foo": "baz"},
+                "5394aa025b8e401ca6bc3ddee3130edc": {"foo": "qux"},
+            }
+        )
+        assert Node.objects.get(id="d2502ebbd7df41ceba8d3275595cac33").data == {"foo": "baz"}
+        assert Node.objects.get(id="5394aa025b8e401ca6bc3ddee3130edc").data == {"foo": "qux"}
+
+    @pytest.mark.skipif(zstandard is None, reason="zstandard is not installed")
+    def test_set_zstd(self):
+        self.ns.compression = "zstd"
+        self.ns.validate()
+        self.ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": "bar"})
+
+        raw = Node.objects.filter(id="d2502ebbd7df41ceba8d3275595cac33").values_list(
+            "data", flat=True
+        )[0]
+        assert raw.startswith(ZSTD_PREFIX)
+        assert Node.objects.get(id="d2502ebbd7df41ceba8d3275595cac33").data == {"foo": "bar"}
+
     def test_create(self):
         node_id = self.ns.create({"foo": "bar"})
         assert Node.objects.get(id=node_id).data == {"foo": "bar"}
@@ -131,3 +158,63 @@ class DjangoNodeStorageTest(TestCase):
             self.ns.get("node_4")
             self.ns.get("node_4")
             assert mock_get.call_count == 2
+
+    @override_settings(SENTRY_NODESTORE_LOCAL_CACHE_SIZE=30)
+    @mock.patch("sentry.nodestore.base._local_cache", None)
+    @mock.patch("sentry.nodestore.django.backend.DjangoNodeStorage.cache", None)
+    def test_local_cache(self):
+        node_1 = ("a" * 32, {"foo": "a"})
+        node_2 = ("b" * 32, {"foo": "b"})
+        node_3 = ("c" * 32, {"foo": "c"})
+
+        for node_id, data in [node_1, node_2, node_3]:
+            Node.objects.create(id=node_id, data=data)
+
+        assert self.ns.get_multi([node_1[0], node_2[0]]) == dict([node_1, node_2])
+        with mock.patch.object(Node.objects, "filter") as mock_filter:
+            assert self.ns.get_multi([node_1[0], node_2[0]]) == dict([node_1, node_2])
+            assert mock_filter.call_count == 0
+
+        # Cached data is not shared with callers.
+        self.ns.get(node_1[0])["foo"] = "x"
+        assert self.ns.get(node_1[0]) == node_1[1]
+
+        # Only the two most recently used nodes fit into the cache.
+        assert self.ns.get(node_3[0]) == node_3[1]
+        with mock.patch.object(Node.objects, "filter", wraps=Node.objects.filter) as mock_filter:
+            assert self.ns.get_multi([node_1[0], node_2[0], node_3[0]]) == dict(
+                [node_1, node_2, node_3]
+            )
+            mock_filter.assert_called_once_with(id__in=[node_2[0]])
+
+        # Deleted nodes are cached as missing.
+        self.ns.delete(node_1[0])
+        with mock.patch.object(Node.objects, "get") as mock_get:
+            assert self.ns.get(node_1[0]) is None
+            assert mock_get.call_count == 0
+        assert self.ns.get_multi([node_1[0]]) == {}
+
+    @override_settings(SENTRY_NODESTORE_LOCAL_CACHE_SIZE=1024, SENTRY_NODESTORE_LOCAL_CACHE_TTL=60)
+    @mock.patch("sentry.nodestore.base._local_cache", None)
+    @mock.patch("sentry.nodestore.django.backend.DjangoNodeStorage.cache", None)
+    @mock.patch("sentry.nodestore.base.time.time")
+    def test_local_cache_expiry(self, mock_time):
+        mock_time.return_value = 1000
+        node = Node.objects.create(id="a" * 32, data={"foo": "a"})
+        assert self.ns.get(node.id) == {"foo": "a"}
+
+        # Deleted nodes are cached as missing until they expire too.
+        self.ns.delete("b" * 32)
+        Node.objects.create(id="b" * 32, data={"foo": "b"})
+
+        mock_time.return_value = 1059
+        with mock.patch.object(Node.objects, "get") as mock_get:
+            assert self.ns.get(node.id) == {"foo": "a"}
+            assert self.ns.get("b" * 32) is None
+            assert mock_get.call_count == 0
+
+        mock_time.return_value = 1060
+        with mock.patch.object(Node.objects, "get", wraps=Node.objects.get) as mock_get:
+            assert self.ns.get(node.id) == {"foo": "a"}
+            assert self.ns.get("b" * 32) == {"foo": "b"}
+            assert mock_get.call_count == 2
@@ -152,3 +152,44 @@ class OptionsStoreTest(TestCase):
         mocked_time.return_value = 26
         store.clean_local_cache()
         assert not store._local_cache
+
+    @patch("sentry.options.store.random", return_value=0.5)
+    @patch("sentry.options.store.time")
+    def test_snapshot(self, mocked_time, mocked_random):
+        key, unset_key = self.make_key(10, 10), self.make_key(10, 10)
+        mocked_time.return_value = 0
+        self.store.set(key, "bar")
+
+        store = OptionsStore(cache=self.store.cache, snapshot_interval=10)
+        assert store.get(key) == "bar"
+        assert store.get(unset_key) is None
+
+        Option.objects.filter(key=key.name).update(value="lol")
+        store.cache.delete(key.cache_key)
+
+        mocked_time.return_value = 5
+        with patch.object(Option.objects, "get_queryset", side_effect=Exception()):
+            with patch.object(store.cache, "get", side_effect=Exception()):
+                # Still served from the snapshot
+                assert store.get(key) == "bar"
+
+        # Both keys are refreshed at once, without fetching single keys
+        mocked_time.return_value = 10
+        with patch.object(store.cache, "get", side_effect=Exception()):
+            with patch.object(Option.objects, "get", side_effect=Exception()) as get:
+                assert store.get(key) == "lol"
+                assert store.get(unset_key) is None
+                assert not get.called
+        assert store.cache.get(key.cache_key) == "lol"
+
+        store.set(key, "baz")
+        mocked_time.return_value = 20
+        with patch.object(Option.objects, "get_queryset", side_effect=Exception()):
+            with patch.object(store.cache, "get_many", side_effect=Exception()):
+                # The refresh fails, so the previous values are kept until
+                # they are beyond their grace time
+                assert store.get(key) == "baz"
+
+                mocked_time.return_value = 31
+                with patch.object(store.cache, "get", side_effect=Exception()):
+                    assert store.get(key) is None
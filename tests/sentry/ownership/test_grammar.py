@@ -2,7 +2,15 @@ from __future__ import absolute_import
 
 import pytest
 
-from sentry.ownership.grammar import Rule, Matcher, Owner, parse_rules, dump_schema, load_schema
+from sentry.ownership.grammar import (
+    CompiledRules,
+    Rule,
+    Matcher,
+    Owner,
+    parse_rules,
+    dump_schema,
+    load_schema,
+)
 
 fixture_data = """
 # cool stuff comment
@@ -125,3 +133,28 @@ def test_matcher_test_tags():
 def test_matcher_test_tags_without_tag_data(data):
     assert not Matcher("tags.foo", "foo_value").test(data)
     assert not Matcher("tags.bar", "barval").test(data)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {},
+        {"tags": None},
+        {"request": {"url": "http://google.com/foo"}},
+        {"stacktrace": {"frames": [{"filename": "foo.js"}, {"abs_path": "SRC\\Sentry\\a.py"}]}},
+        {"exception": {"values": [{"stacktrace": {"frames": [{"filename": "app.JS"}]}}]}},
+        {"tags": [["foo", "bar"], ["foo", "bar baz"], ["bar", "bar"]]},
+        {"tags": [["foo", "BAR"]], "stacktrace": {"frames": [{"filename": "src/sentry/x.py"}]}},
+        {"stacktrace": {"frames": [{"filename": "foo.py"}, {"filename": "app.js"}]}},
+    ],
+)
+def test_compiled_rules(data):
+    rules = parse_rules(fixture_data)
+    rules.append(Rule(Matcher("path", "src/*"), [Owner("team", "src")]))
+    rules.append(Rule(Matcher("path", "*"), [Owner("team", "everything")]))
+    rules.append(Rule(Matcher("path", "**/foo.py"), [Owner("team", "foo")]))
+    rules.append(Rule(Matcher("path", "**/"), [Owner("team", "any")]))
+    rules.append(Rule(Matcher("path", "src/**/x.py"), [Owner("team", "x")]))
+
+    expected = [rule for rule in rules if rule.test(data)]
+    assert CompiledRules(rules).get_matching_rules(data) == expected
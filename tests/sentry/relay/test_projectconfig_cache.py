@@ -0,0 +1,58 @@
+from __future__ import absolute_import
+
+import time
+
+from sentry.relay.projectconfig_cache.redis import RedisProjectConfigCache
+from sentry.utils.redis import redis_clusters
+
+
+def _set_in_redis(key, value):
+    # bypasses the cache, so that no invalidation is published
+    redis_clusters.get("default").get_local_client_for_key(key).set(key, value)
+
+
+def test_local_cache():
+    cache = RedisProjectConfigCache()
+    cache.set_many({1: {"foo": "bar"}})
+    assert cache.get(1) == {"foo": "bar"}
+
+    _set_in_redis("relayconfig:1", '{"foo": "baz"}')
+    assert cache.get(1) == {"foo": "bar"}
+    assert cache.get_many([1, 2]) == {"1": {"foo": "bar"}}
+
+    cache.delete_many([1])
+    assert cache.get(1) is None
+
+
+def test_local_cache_expires():
+    cache = RedisProjectConfigCache(local_cache_ttl=0.05)
+    cache.set_many({1: {"foo": "bar"}})
+    assert cache.get(1) == {"foo": "bar"}
+
+    _set_in_redis("relayconfig:1", '{"foo": "baz"}')
+    time.sleep(0.1)
+    assert cache.get(1) == {"foo": "baz"}
+
+
+def test_local_cache_disabled():
+    cache = RedisProjectConfigCache(local_cache_size=0)
+    cache.set_many({1: {"foo": "bar"}})
+    assert cache.get(1) == {"foo": "bar"}
+
+    _set_in_redis("relayconfig:1", '{"foo": "baz"}')
+    assert cache.get(1) == {"foo": "baz"}
+
+
+def test_invalidation_is_published():
+    reader = RedisProjectConfigCache()
+    writer = RedisProjectConfigCache()
+
+    assert reader.get(1) is None
+    # give the listener of the reader time to subscribe
+    time.sleep(0.1)
+    writer.set_many({1: {"foo": "bar"}})
+
+    deadline = time.time() + 5
+    while reader.get(1) is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert reader.get(1) == {"foo": "bar"}
@@ -11,7 +11,9 @@ from sentry import tsdb
 from sentry.models import Rule
 from sentry.rules.conditions.event_frequency import (
     EventFrequencyCondition,
+    EventFrequencyCounter,
     EventUniqueUserFrequencyCondition,
+    record_event_frequency,
 )
 from sentry.testutils.cases import RuleTestCase
 from six.moves import xrange
@@ -139,6 +141,88 @@ class EventFrequencyConditionTestCase(FrequencyConditionMixin, RuleTestCase):
             timestamp=timestamp,
         )
 
+    def test_query_shared_per_state(self):
+        event = self.get_event()
+        data = {"interval": "1h", "value": "10"}
+        state = self.get_state()
+
+        with mock.patch.object(EventFrequencyCondition, "query_hook", return_value=11) as query:
+            assert self.get_rule(data=data, rule=Rule(id=1)).passes(event, state) is True
+            assert self.get_rule(data=data, rule=Rule(id=2)).passes(event, state) is True
+            assert query.call_count == 1
+
+            # a different environment or a new event needs a new query
+            self.get_rule(data=data, rule=Rule(id=3, environment_id=1)).passes(event, state)
+            self.get_rule(data=data, rule=Rule(id=1)).passes(event, self.get_state())
+            assert query.call_count == 3
+
+    @mock.patch("django.utils.timezone.now")
+    def test_frequency_counter(self, now):
+        # counters expire relative to the actual time
+        now.return_value = datetime.now(pytz.utc).replace(second=0, microsecond=0)
+        event = self.get_event()
+        data = {"interval": "1m", "value": "10"}
+        rule = self.get_rule(data=data, rule=Rule(environment_id=None))
+
+        with self.options({"rules.event-frequency-counter": True}):
+            for _ in xrange(11):
+                record_event_frequency(event.group_id, 1, now())
+
+            # the counter has not seen a full window yet, so tsdb is used
+            self.assertDoesNotPass(rule, event)
+
+            now.return_value += timedelta(minutes=1, seconds=30)
+            with mock.patch.object(EventFrequencyCondition, "query_hook") as query:
+                # half of the previous window is still counted
+                assert rule.get_rate(event, "1m", None) == 5
+                assert rule.get_rate(event, "1m", 1) == 5
+                assert rule.get_rate(event, "1m", 2) == 0
+                assert not query.called
+
+
+class EventFrequencyCounterTestCase(RuleTestCase):
+    rule_cls = EventFrequencyCondition
+
+    def test_sliding_window(self):
+        counter = EventFrequencyCounter([timedelta(minutes=1)])
+        start = datetime.now(pytz.utc).replace(second=0, microsecond=0)
+        group_id = self.event.group_id
+
+        with mock.patch("django.utils.timezone.now", return_value=start):
+            for seconds in (0, 30, 59):
+                counter.incr(group_id, 1, start + timedelta(seconds=seconds))
+            assert counter.get_count(group_id, 1, timedelta(minutes=1), start) is None
+
+        for seconds in (70, 80):
+            counter.incr(group_id, 2, start + timedelta(seconds=seconds))
+
+        get_count = counter.get_count
+        assert get_count(group_id, None, timedelta(minutes=1), start + timedelta(seconds=60)) == 5
+        assert get_count(group_id, None, timedelta(minutes=1), start + timedelta(seconds=90)) == 3
+        assert get_count(group_id, 1, timedelta(minutes=1), start + timedelta(seconds=90)) == 1
+        assert get_count(group_id, 2, timedelta(minutes=1), start + timedelta(seconds=90)) == 2
+        assert get_count(group_id, None, timedelta(minutes=1), start + timedelta(seconds=180)) == 0
+
+    def test_restarts_after_pause(self):
+        counter = EventFrequencyCounter([timedelta(minutes=1)])
+        start = datetime.now(pytz.utc).replace(second=0, microsecond=0)
+        group_id = self.event.group_id
+        get_count = counter.get_count
+
+        with mock.patch("django.utils.timezone.now", return_value=start):
+            counter.incr(group_id, 1, start)
+        assert get_count(group_id, 1, timedelta(minutes=1), start + timedelta(minutes=2)) == 0
+
+        # counting was paused for longer than the heartbeat, so the start
+        # marker expired and events of the pause would be missing
+        counter.get_client().delete(counter.get_start_key())
+
+        resumed = start + timedelta(seconds=90)
+        with mock.patch("django.utils.timezone.now", return_value=resumed):
+            counter.incr(group_id, 1, resumed)
+        assert get_count(group_id, 1, timedelta(minutes=1), start + timedelta(minutes=2)) is None
+        assert get_count(group_id, 1, timedelta(minutes=1), start + timedelta(minutes=3)) == 0
+
 
 class EventUniqueUserFrequencyConditionTestCase(FrequencyConditionMixin, RuleTestCase):
     rule_cls = EventUniqueUserFrequencyCondition
@@ -87,6 +87,45 @@ class RuleProcessorTest(TestCase):
         results = list(rp.apply())
         assert len(results) == 0
 
+    def get_processor(self):
+        return RuleProcessor(
+            self.event,
+            is_new=True,
+            is_regression=True,
+            is_new_group_environment=True,
+            has_reappeared=True,
+        )
+
+    def test_get_rule_statuses(self):
+        other_rule = Rule.objects.create(
+            project=self.event.project,
+            data={"conditions": [EVERY_EVENT_COND_DATA], "actions": [EMAIL_ACTION_DATA]},
+        )
+        existing = GroupRuleStatus.objects.create(
+            rule=other_rule, group=self.event.group, project=self.event.project
+        )
+
+        statuses = self.get_processor().get_rule_statuses([self.rule, other_rule])
+        assert statuses[other_rule.id].id == existing.id
+        assert statuses[self.rule.id].id == GroupRuleStatus.objects.get(rule=self.rule).id
+
+        # all statuses are cached now
+        with patch("sentry.rules.processor.GroupRuleStatus.objects.filter") as mock_filter:
+            statuses = self.get_processor().get_rule_statuses([self.rule, other_rule])
+        assert not mock_filter.called
+        assert statuses[other_rule.id].id == existing.id
+
+    def test_get_rule_conditions_cached_per_revision(self):
+        rp = self.get_processor()
+        rule_conditions = rp.get_rule_conditions(self.rule)
+        assert [c for c, _ in rule_conditions.conditions] == [EVERY_EVENT_COND_DATA]
+        assert rule_conditions.filters == []
+        assert self.get_processor().get_rule_conditions(self.rule) is rule_conditions
+
+        self.rule.data["conditions"] = []
+        self.rule.save()
+        assert rp.get_rule_conditions(self.rule).conditions == []
+
 
 # mock filter which always passes
 class MockFilterTrue(EventFilter):
@@ -14,6 +14,7 @@ from sentry.app import tsdb
 from sentry.models import Project, UserOption, GroupStatus
 from sentry.tasks.reports import (
     DISABLED_ORGANIZATIONS_USER_OPTION_KEY,
+    RedisReportBackend,
     Report,
     Skipped,
     change,
@@ -32,10 +33,13 @@ from sentry.tasks.reports import (
     safe_add,
     user_subscribed_to_organization_reports,
     prepare_project_issue_summaries,
+    prepare_project_report,
+    prepare_project_reports,
     prepare_project_series,
 )
 from sentry.testutils.cases import TestCase, SnubaTestCase
 from sentry.testutils.factories import DEFAULT_EVENT_DATA
+from sentry.utils import redis
 from sentry.utils.dates import to_datetime, to_timestamp, floor_to_utc_day
 from sentry.testutils.helpers.datetime import iso_format
 
@@ -350,3 +354,56 @@ class ReportTestCase(TestCase, SnubaTestCase):
         assert any(
             map(lambda x: x[1] == (2, 0), response)
         ), "must show two issues resolved in one rollup window"
+
+    def test_prepare_project_reports_batches_projects(self):
+        now = datetime(2016, 9, 12, tzinfo=pytz.utc)
+        interval = (now - timedelta(days=7), now)
+        projects = [
+            self.create_project(organization=self.organization, date_added=now - timedelta(days=90))
+            for _ in range(3)
+        ]
+        for i, project in enumerate(projects):
+            for _ in range(i):
+                tsdb.incr(tsdb.models.project, project.id, now - timedelta(days=1))
+
+        with mock.patch.object(tsdb, "get_range", wraps=tsdb.get_range) as get_range:
+            reports = prepare_project_reports(interval, projects)
+
+        # project series and calendar series, there are no resolved issues
+        assert get_range.call_count == 2
+        assert reports == {
+            project.id: prepare_project_report(interval, project) for project in projects
+        }
+        assert [reports[project.id].series[-1][1] for project in projects] == [
+            (0, 0),
+            (0, 1),
+            (0, 2),
+        ]
+
+    @mock.patch("sentry.tasks.reports.PROJECT_BATCH_SIZE", 1)
+    def test_redis_backend_resumes_prepare(self):
+        now = datetime(2016, 9, 12, tzinfo=pytz.utc)
+        timestamp, duration = to_timestamp(now), 60 * 60 * 24 * 7
+        organization = self.create_organization()
+        projects = [self.create_project(organization=organization) for _ in range(2)]
+
+        backend = RedisReportBackend(redis.clusters.get("default"), 60)
+        build_many = backend.build_many
+
+        with mock.patch.object(
+            backend,
+            "build_many",
+            side_effect=[build_many(timestamp, duration, projects[:1]), RuntimeError("boom")],
+        ):
+            with pytest.raises(RuntimeError):
+                backend.prepare(timestamp, duration, organization)
+
+        with mock.patch.object(backend, "build_many", wraps=build_many) as mock_build_many:
+            backend.prepare(timestamp, duration, organization)
+
+        assert mock_build_many.call_count == 1
+        assert mock_build_many.call_args[0][2] == projects[1:]
+        assert [
+            report.aggregates
+            for report in backend.fetch(timestamp, duration, organization, projects)
+        ] == [backend.build(timestamp, duration, project).aggregates for project in projects]
@@ -3,12 +3,17 @@ from __future__ import absolute_import
 import pytest
 
 from sentry.grouping.api import get_default_grouping_config_dict, load_grouping_config
+from sentry.stacktraces import processing
 from sentry.stacktraces.processing import (
     find_stacktraces_in_data,
     normalize_stacktraces_for_grouping,
     get_crash_frame_from_event_data,
+    process_stacktraces,
+    StacktraceProcessor,
 )
 from sentry.testutils import TestCase
+from sentry.utils.cache import cache
+from sentry.utils.compat import mock
 
 
 class FindStacktracesTest(TestCase):
@@ -360,3 +365,70 @@ class NormalizeInApptest(TestCase):
 )
 def test_get_crash_frame(event):
     assert get_crash_frame_from_event_data(event)["marco"] == "polo"
+
+
+class UppercaseProcessor(StacktraceProcessor):
+    def __init__(self, *args, **kwargs):
+        StacktraceProcessor.__init__(self, *args, **kwargs)
+        self.computed = []
+
+    def handles_frame(self, frame, stacktrace_info):
+        return True
+
+    def preprocess_frame(self, processable_frame):
+        processable_frame.set_cache_key_from_values([processable_frame["function"]])
+
+    def process_frame(self, processable_frame, processing_task):
+        function = processable_frame.cache_value
+        if function is None:
+            function = processable_frame["function"].upper()
+            self.computed.append(function)
+            processable_frame.set_cache_value(function)
+        return [dict(processable_frame.frame, function=function)], None, None
+
+
+class FrameCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        processing._local_frame_cache.clear()
+
+    def process(self):
+        processors = []
+
+        def make_processors(data, infos):
+            processors.append(UppercaseProcessor(data, infos, project=self.project))
+            return processors
+
+        data = {
+            "project": self.project.id,
+            "stacktrace": {"frames": [{"function": "foo"}, {"function": "bar"}]},
+        }
+        with mock.patch("sentry.stacktraces.processing.cache", mock.Mock(wraps=cache)) as shared:
+            data = process_stacktraces(data, make_processors=make_processors)
+        assert [frame["function"] for frame in data["stacktrace"]["frames"]] == ["FOO", "BAR"]
+        return processors[0].computed, shared
+
+    def test_batched(self):
+        computed, shared = self.process()
+        assert sorted(computed) == ["BAR", "FOO"]
+        assert shared.get_many.call_count == 1
+        assert shared.set_many.call_count == 1
+        assert not shared.get.called
+        assert not shared.set.called
+
+        processing._local_frame_cache.clear()
+        computed, shared = self.process()
+        assert computed == []
+        assert shared.get_many.call_count == 1
+        assert not shared.set_many.called
+
+    def test_local_cache(self):
+        self.process()
+        computed, shared = self.process()
+        assert computed == []
+        assert not shared.get_many.called
+
+        with self.settings(SENTRY_FRAME_CACHE_LOCAL_TTL=0):
+            computed, shared = self.process()
+        assert computed == []
+        assert shared.get_many.call_count == 1
@@ -4,12 +4,14 @@ from __future__ import absolute_import
 import pytest
 import pytz
 
+from celery.signals import task_postrun
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 from sentry.testutils import TestCase
 from sentry.tsdb.base import TSDBModel, ONE_MINUTE, ONE_HOUR, ONE_DAY
 from sentry.tsdb.redis import RedisTSDB, CountMinScript, SuppressionWrapper
+from sentry.utils.compat import mock
 from sentry.utils.dates import to_datetime, to_timestamp
 
 
@@ -182,6 +184,105 @@ class RedisTSDBTest(TestCase):
         results = self.db.get_sums(TSDBModel.project, [1, 2], dts[0], dts[-1], environment_id=1)
         assert results == {1: 0, 2: 0}
 
+    def test_incr_flush_interval(self):
+        db = RedisTSDB(
+            rollups=((ONE_HOUR, 24),),
+            vnodes=64,
+            hosts={i - 6: {"db": i} for i in range(6, 9)},
+            incr_flush_interval=3600,
+        )
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+
+        db.incr(TSDBModel.project, 1, now)
+        db.incr_multi([(TSDBModel.project, 1), (TSDBModel.group, 2)], now, count=2)
+        db.incr(TSDBModel.project, 1, now, environment_id=1)
+
+        # nothing is written until the flush interval passed
+        assert db.get_sums(TSDBModel.project, [1], now, now) == {1: 0}
+
+        db.flush_incrs()
+        assert db.get_sums(TSDBModel.project, [1], now, now) == {1: 4}
+        assert db.get_sums(TSDBModel.project, [1], now, now, environment_id=1) == {1: 1}
+        assert db.get_sums(TSDBModel.group, [2], now, now) == {2: 2}
+
+        # flushing again does not write the same increments twice
+        db.flush_incrs()
+        assert db.get_sums(TSDBModel.project, [1], now, now) == {1: 4}
+
+    def test_incr_flush_failure(self):
+        db = RedisTSDB(
+            rollups=((ONE_HOUR, 24),),
+            vnodes=64,
+            hosts={i - 6: {"db": i} for i in range(6, 9)},
+            incr_flush_interval=3600,
+        )
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+
+        db.incr(TSDBModel.project, 1, now, count=2)
+
+        with mock.patch.object(
+            RedisTSDB, "_RedisTSDB__write_incrs", side_effect=Exception("boom")
+        ), pytest.raises(Exception):
+            db.flush_incrs()
+
+        # the increments that failed to write are flushed with the next ones
+        db.incr(TSDBModel.project, 1, now)
+        db.flush_incrs()
+        assert db.get_sums(TSDBModel.project, [1], now, now) == {1: 3}
+
+    def test_incr_flush_partial_failure(self):
+        db = RedisTSDB(
+            rollups=((ONE_HOUR, 24),),
+            vnodes=64,
+            hosts={i - 6: {"db": i} for i in range(6, 9)},
+            incr_flush_interval=3600,
+        )
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+
+        db.incr(TSDBModel.project, 1, now)
+        db.incr(TSDBModel.project, 2, now)
+
+        write_incrs = db._RedisTSDB__write_incrs
+        written = db.make_counter_key(TSDBModel.project, ONE_HOUR, now, 1, None)
+
+        def fail(cluster, durable, key_operations, key_expiries, promises):
+            # only the increment of project 1 is confirmed before the failure
+            write_incrs(
+                cluster, durable, {written: key_operations[written]}, key_expiries, promises
+            )
+            raise Exception("boom")
+
+        with mock.patch.object(db, "_RedisTSDB__write_incrs", side_effect=fail), pytest.raises(
+            Exception
+        ):
+            db.flush_incrs()
+
+        db.flush_incrs()
+        assert db.get_sums(TSDBModel.project, [1, 2], now, now) == {1: 1, 2: 1}
+
+    def test_incr_flush_after_task(self):
+        db = RedisTSDB(
+            rollups=((ONE_HOUR, 24),),
+            vnodes=64,
+            hosts={i - 6: {"db": i} for i in range(6, 9)},
+            incr_flush_interval=3600,
+        )
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+
+        db.incr(TSDBModel.project, 1, now)
+        task_postrun.send(sender=None)
+        assert db.get_sums(TSDBModel.project, [1], now, now) == {1: 0}
+
+        db._RedisTSDB__last_incr_flush -= 3600
+        task_postrun.send(sender=None)
+        assert db.get_sums(TSDBModel.project, [1], now, now) == {1: 1}
+
+        # errors are logged instead of failing the task
+        db._RedisTSDB__last_incr_flush -= 3600
+        with mock.patch.object(db, "flush_incrs", side_effect=Exception("boom")) as flush_incrs:
+            task_postrun.send(sender=None)
+        assert flush_incrs.called
+
     def test_count_distinct(self):
         now = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(hours=4)
         dts = [now + timedelta(hours=i) for i in range(4)]
@@ -320,6 +421,43 @@ class RedisTSDBTest(TestCase):
         )
         assert results == {1: 0, 2: 0}
 
+    def test_distinct_counts_union_cache(self):
+        db = RedisTSDB(
+            rollups=((ONE_HOUR, 24),),
+            vnodes=64,
+            distinct_counts_union_cache_ttl=3600,
+            hosts={i - 6: {"db": i} for i in range(6, 9)},
+        )
+
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(hours=4)
+        dts = [now + timedelta(hours=i) for i in range(4)]
+
+        model = TSDBModel.users_affected_by_group
+
+        db.record(model, 1, ("foo", "bar"), dts[0])
+        db.record(model, 2, ("baz",), dts[1])
+
+        assert db.get_distinct_counts_union(model, [1, 2], dts[0], dts[-1], rollup=3600) == 3
+
+        # Closed buckets are served from the cached union until invalidated.
+        db.record(model, 1, ("qux",), dts[1])
+        assert db.get_distinct_counts_union(model, [1, 2], dts[0], dts[-1], rollup=3600) == 3
+
+        # The currently open bucket is always read (but "qux" is still cached away.)
+        db.record(model, 2, ("quux",), datetime.utcnow().replace(tzinfo=pytz.UTC))
+        assert (
+            db.get_distinct_counts_union(
+                model, [1, 2], dts[0], datetime.utcnow().replace(tzinfo=pytz.UTC), rollup=3600
+            )
+            == 4
+        )
+
+        db.merge_distinct_counts(model, 1, [2], dts[0])
+        assert db.get_distinct_counts_union(model, [1, 2], dts[0], dts[-1], rollup=3600) == 4
+
+        db.delete_distinct_counts([model], [1], dts[0], dts[-1])
+        assert db.get_distinct_counts_union(model, [1, 2], dts[0], dts[-1], rollup=3600) == 0
+
     def test_frequency_tables(self):
         now = datetime.utcnow().replace(tzinfo=pytz.UTC)
         model = TSDBModel.frequent_issues_by_project
@@ -2,7 +2,7 @@ from __future__ import absolute_import
 
 import pytest
 
-from sentry.utils.datastructures import BidirectionalMapping
+from sentry.utils.datastructures import BidirectionalMapping, LRUCache
 
 
 def test_bidirectional_mapping():
@@ -32,3 +32,45 @@ def test_bidirectional_mapping():
     del value["c"]
 
     assert len(value) == len(value.inverse()) == 2
+
+
+def test_lru_cache():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    # "b" is the least recently used item now
+    assert cache.set("c", 3) == 1
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+    cache.delete("a")
+    assert "a" not in cache
+    assert cache.get("a", "default") == "default"
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_lru_cache_sized():
+    cache = LRUCache(max_size=10, get_size=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    assert cache.size == 8
+
+    assert cache.set("c", "xxxx") == 1
+    assert "a" not in cache
+    assert cache.size == 8
+
+    # replacing an item accounts for the old size
+    cache.set("b", "xx")
+    assert cache.size == 6
+
+    # items that can never fit are not stored
+    assert cache.set("d", "x" * 11) == 0
+    assert "d" not in cache
+    assert cache.size == 6
@@ -1,12 +1,16 @@
 from __future__ import absolute_import
 
+import threading
 import unittest
 
+from concurrent.futures import Future
 from datetime import datetime, timedelta
+from django.core.cache import cache
 from django.utils import timezone
 
 import pytest
 import pytz
+import urllib3
 
 from sentry.models import GroupRelease, Release, Project
 from sentry.testutils import TestCase
@@ -16,8 +20,11 @@ from sentry.utils.snuba import (
     get_query_params_to_update_for_projects,
     get_snuba_translators,
     get_json_type,
+    raw_query,
     get_snuba_column_name,
     Dataset,
+    SnubaError,
+    SnubaQueryExecutor,
     SnubaQueryParams,
     UnqualifiedQueryError,
     quantize_time,
@@ -321,3 +328,126 @@ class QuantizeTimeTest(unittest.TestCase):
                 break
 
         assert i != j
+
+
+class SnubaQueryExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.running = []
+        self.max_running = 0
+        self.lock = threading.Lock()
+        self.pool = mock.Mock()
+        self.pool.urlopen.side_effect = self.urlopen
+
+    def urlopen(self, method, path, body, headers):
+        with self.lock:
+            self.running.append(body)
+            self.max_running = max(self.max_running, len(self.running))
+        self.release.wait(5)
+        with self.lock:
+            self.running.remove(body)
+        return body
+
+    def test_coalesces_identical_queries(self):
+        executor = SnubaQueryExecutor(self.pool, max_concurrent=4)
+        hub = mock.MagicMock()
+        first = executor.submit("a", {"referer": "test"}, hub)
+        second = executor.submit("a", {"referer": "test"}, hub)
+        other_referrer = executor.submit("a", {"referer": "other"}, hub)
+        assert first is second
+        assert first is not other_referrer
+
+        self.release.set()
+        assert first.result() == "a"
+        assert other_referrer.result() == "a"
+        assert self.pool.urlopen.call_count == 2
+
+        # the query is sent again once the first one finished
+        assert executor.submit("a", {"referer": "test"}, hub).result() == "a"
+        assert self.pool.urlopen.call_count == 3
+
+    def test_limits_concurrency_per_referrer(self):
+        executor = SnubaQueryExecutor(self.pool, max_concurrent=4, max_concurrent_per_referrer=2)
+        hub = mock.MagicMock()
+        futures = []
+
+        def submit():
+            for body in "abcd":
+                futures.append(executor.submit(body, {"referer": "test"}, hub))
+
+        submitter = threading.Thread(target=submit)
+        submitter.start()
+        submitter.join(0.2)
+        # the third query waits for one of the first two to finish
+        assert submitter.is_alive()
+        assert len(futures) == 2
+
+        self.release.set()
+        submitter.join(5)
+        assert [future.result() for future in futures] == ["a", "b", "c", "d"]
+        assert self.max_running == 2
+
+    def test_errors(self):
+        self.pool.urlopen.side_effect = urllib3.exceptions.HTTPError("boom")
+        executor = SnubaQueryExecutor(self.pool, max_concurrent=1)
+
+        future = executor.submit("a", {}, mock.MagicMock())
+        with pytest.raises(SnubaError):
+            future.result()
+
+
+class SnubaResultCacheTest(TestCase):
+    def setUp(self):
+        super(SnubaResultCacheTest, self).setUp()
+        response = mock.Mock(status=200, data=b'{"data": [{"count": 1}]}')
+        self.submit = mock.patch(
+            "sentry.utils.snuba._query_executor.submit",
+            side_effect=lambda *a, **kw: self.done(response),
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def done(self, response):
+        future = Future()
+        future.set_result(response)
+        return future
+
+    def query(self, end=None, referrer="test"):
+        end = end or datetime.utcnow() - timedelta(hours=1)
+        return raw_query(
+            dataset=Dataset.Events,
+            start=end - timedelta(hours=1),
+            end=end,
+            filter_keys={"project_id": [self.project.id]},
+            aggregations=[["count()", "", "count"]],
+            referrer=referrer,
+        )
+
+    def test_not_cached_by_default(self):
+        assert self.query()["data"] == [{"count": 1}]
+        assert self.query()["data"] == [{"count": 1}]
+        assert self.submit.call_count == 2
+
+    def test_cached_for_referrer(self):
+        with self.settings(SENTRY_SNUBA_RESULT_CACHE_REFERRERS={"test"}):
+            with mock.patch("sentry.utils.snuba.cache.set", wraps=cache.set) as cache_set:
+                assert self.query()["data"] == [{"count": 1}]
+                assert self.query()["data"] == [{"count": 1}]
+                assert self.submit.call_count == 1
+                assert cache_set.call_args[0][2] == 60 * 60
+
+                self.query(referrer="other")
+                assert self.submit.call_count == 2
+
+                self.query(end=datetime.utcnow())
+                assert self.submit.call_count == 3
+                assert cache_set.call_args[0][2] == 10
+
+    def test_cached_for_request(self):
+        from sentry.app import env
+
+        env.request = mock.Mock(spec=[])
+        self.addCleanup(setattr, env, "request", None)
+
+        assert self.query()["data"] == [{"count": 1}]
+        assert self.query()["data"] == [{"count": 1}]
+        assert self.submit.call_count == 1
@@ -14,14 +14,26 @@ from django.utils import timezone
 
 from sentry import eventstream, tagstore
 from sentry.app import tsdb
-from sentry.models import Environment, Group, GroupHash, GroupRelease, Release, UserReport
+from sentry.models import (
+    Environment,
+    Group,
+    GroupEnvironment,
+    GroupHash,
+    GroupRelease,
+    Release,
+    UserReport,
+)
 from sentry.similarity import features, _make_index_backend
 from sentry.tasks.unmerge import (
+    collect_first_releases,
+    fetch_events,
     get_caches,
+    get_event_shards,
     get_event_user_from_interface,
     get_fingerprint,
     get_group_backfill_attributes,
     get_group_creation_attributes,
+    repair_first_releases,
     unmerge,
 )
 from sentry.testutils import SnubaTestCase, TestCase
@@ -32,7 +44,7 @@ from sentry.testutils.helpers.features import with_feature
 from sentry.tasks.merge import merge_groups
 
 from six.moves import xrange
-from sentry.utils.compat import map
+from sentry.utils.compat import map, zip
 
 # Use the default redis client as a cluster client in the similarity index
 index = _make_index_backend(redis.clusters.get("default").get_local_client(0))
@@ -170,6 +182,170 @@ class UnmergeTestCase(TestCase, SnubaTestCase):
             "first_release": None,
         }
 
+    def test_get_group_backfill_attributes_out_of_order(self):
+        now = datetime.utcnow().replace(microsecond=0, tzinfo=timezone.utc)
+        group = Group(
+            active_at=now - timedelta(hours=2),
+            first_seen=now - timedelta(hours=2),
+            last_seen=now - timedelta(hours=1),
+            platform="javascript",
+            message="Hello from JavaScript",
+            level=logging.INFO,
+            score=Group.calculate_score(3, now),
+            logger="javascript",
+            times_seen=1,
+            first_release=None,
+            culprit="",
+            data={"type": "default", "last_received": to_timestamp(now), "metadata": {}},
+        )
+
+        attributes = get_group_backfill_attributes(
+            get_caches(),
+            group,
+            [
+                self.store_event(
+                    data={
+                        "platform": "python",
+                        "message": "Hello from Python",
+                        "timestamp": iso_format(now),
+                        "type": "default",
+                        "level": "debug",
+                    },
+                    project_id=self.project.id,
+                ),
+                self.store_event(
+                    data={
+                        "platform": "java",
+                        "message": "Hello from Java",
+                        "timestamp": iso_format(now - timedelta(hours=3)),
+                        "type": "default",
+                        "level": "debug",
+                    },
+                    project_id=self.project.id,
+                ),
+                self.store_event(
+                    data={
+                        "platform": "cocoa",
+                        "message": "Hello from Cocoa",
+                        "timestamp": iso_format(now - timedelta(minutes=90)),
+                        "type": "default",
+                        "level": "debug",
+                    },
+                    project_id=self.project.id,
+                ),
+            ],
+        )
+
+        assert attributes["last_seen"] == now
+        assert attributes["message"] == "Hello from Python"
+        assert attributes["level"] == logging.DEBUG
+        assert attributes["first_seen"] == now - timedelta(hours=3)
+        assert attributes["active_at"] == now - timedelta(hours=3)
+        assert attributes["platform"] == "java"
+        assert attributes["times_seen"] == 4
+
+    def store_events(self, count, **data):
+        now = before_now(minutes=5).replace(microsecond=0, tzinfo=pytz.utc)
+        return [
+            self.store_event(
+                data=dict(
+                    data,
+                    message="Hello world",
+                    timestamp=iso_format(now + timedelta(seconds=i)),
+                    fingerprint=["group1"],
+                ),
+                project_id=self.project.id,
+            )
+            for i in xrange(count)
+        ]
+
+    def test_get_event_shards(self):
+        events = self.store_events(10)
+        group_id = events[0].group_id
+
+        shards = get_event_shards(self.project.id, group_id, 3)
+        assert len(shards) == 3
+        assert shards[0]["end"] == events[-1].datetime + timedelta(seconds=1)
+        assert shards[-1]["start"] == events[0].datetime
+        for newer, older in zip(shards, shards[1:]):
+            assert newer["start"] == older["end"]
+        assert all(shard["last_event"] is None for shard in shards)
+
+        assert get_event_shards(self.project.id, group_id + 1, 3) == []
+
+    def test_fetch_events(self):
+        events = self.store_events(10)
+        group_id = events[0].group_id
+        # two shards of five events each
+        shards = get_event_shards(self.project.id, group_id, 2)
+
+        batch = fetch_events(self.project.id, group_id, shards, 3)
+        assert [event.event_id for event in batch] == [
+            event.event_id for event in events[7:][::-1] + events[2:5][::-1]
+        ]
+        assert [shard["last_event"]["event_id"] for shard in shards] == [
+            events[7].event_id,
+            events[2].event_id,
+        ]
+
+        # both shards return a short batch and are dropped
+        batch = fetch_events(self.project.id, group_id, shards, 3)
+        assert [event.event_id for event in batch] == [
+            event.event_id for event in events[5:7][::-1] + events[:2][::-1]
+        ]
+        assert shards == []
+
+    def test_unmerge_continues_last_event(self):
+        events = self.store_events(4)
+        source_id = events[0].group_id
+
+        # Tasks scheduled before events were sharded only pass the last event
+        # that has been migrated.
+        with self.tasks():
+            destination_id = unmerge(
+                self.project.id,
+                source_id,
+                None,
+                [get_fingerprint(events[0])],
+                None,
+                last_event={"timestamp": events[2].timestamp, "event_id": events[2].event_id},
+            )
+
+        assert Group.objects.get(id=destination_id).times_seen == 2
+        assert Group.objects.get(id=destination_id).first_seen == events[0].datetime
+
+    def test_repair_first_releases(self):
+        newer, older = [
+            self.store_event(
+                data={
+                    "message": "Hello world",
+                    "timestamp": iso_format(before_now(minutes=minutes)),
+                    "environment": "production",
+                    "release": release,
+                },
+                project_id=self.project.id,
+            )
+            for minutes, release in ((1, "2.0"), (5, "1.0"))
+        ]
+        environment = Environment.objects.get(name="production")
+        group_environment = GroupEnvironment.objects.get(
+            group_id=newer.group_id, environment_id=environment.id
+        )
+        assert group_environment.first_release.version == "2.0"
+
+        # batches are not migrated from newest to oldest
+        first_releases = {}
+        collect_first_releases(first_releases, [older])
+        collect_first_releases(first_releases, [newer])
+        repair_first_releases(get_caches(), self.project, first_releases)
+
+        group_environment = GroupEnvironment.objects.get(id=group_environment.id)
+        assert group_environment.first_release.version == "1.0"
+
+    def test_unmerge_single_shard(self):
+        with self.settings(SENTRY_UNMERGE_SHARDS=1):
+            self.test_unmerge()
+
     @with_feature("projects:similarity-indexing")
     def test_unmerge(self):
         now = before_now(minutes=5).replace(microsecond=0, tzinfo=pytz.utc)